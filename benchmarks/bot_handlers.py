@@ -0,0 +1,208 @@
+"""Load test of the TgBotRunner handlers with synthetic updates, a stand-in bot api and stand-in backends.
+
+    python -m benchmarks.bot_handlers --users 50 --rounds 5 --telegram-latency 0.02 --output results.json
+
+Every virtual user searches, inspects and downloads a result and checks /downloads, all users at once.
+Reports per-handler latency percentiles and how long the event loop was blocked while they ran.
+"""
+from dataclasses import dataclass, asdict, field
+from httpx import MockTransport
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+import argparse
+import asyncio
+import itertools
+import json
+import tempfile
+import time
+from benchmarks.orchestrator import git_commit, reset_searcher_state
+from logger import logger
+from tests.stand_ins import ApibayStandIn, TelegramStandIn, TransmissionStandIn
+from tg_bot import TgBotRunner
+from tg_bot.tg_bot import handler_errors
+from torrent_manager import MonitorOrchestrator, PBSearcher, PooledHttpClient, TransmissionClient, JsonMonitorStore
+
+
+@dataclass
+class LoadTestParams:
+    users: int = 20
+    rounds: int = 3
+    queries: int = 50
+    telegram_latency: float = 0
+    apibay_latency: float = 0
+    transmission_latency: float = 0
+    rows: int = 20
+    torrents: int = 30
+    lag_interval: float = 0.005
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values: list[float]) -> dict:
+    return {"count": len(values), "p50_ms": percentile(values, 50) * 1000, "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000, "max_ms": max(values, default=0) * 1000}
+
+
+@dataclass
+class LoopLagMonitor:
+    """Sleeps for `interval` in a loop, anything on top of it is time the loop spent running something else"""
+    interval: float = 0.005
+    lags: list[float] = field(default_factory=list)
+
+    async def run(self) -> None:
+        while True:
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.perf_counter() - started_at - self.interval, 0))
+
+    def summary(self) -> dict:
+        return summarize(self.lags) | {"stalled_ms": sum(self.lags) * 1000}
+
+
+class UpdateFactory:
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _user(self, chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"user {chat_id}"}
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {"message_id": next(self._ids), "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}, "from": self._user(chat_id)}
+
+    def command(self, chat_id: int, command: str, *args: str) -> Update:
+        message = self._message(chat_id, " ".join((f"/{command}",) + args))
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command) + 1}]
+        return Update.de_json({"update_id": next(self._ids), "message": message}, self.bot)
+
+    def callback(self, chat_id: int, data: str) -> Update:
+        callback_query = {"id": str(next(self._ids)), "from": self._user(chat_id), "chat_instance": str(chat_id),
+                          "data": data, "message": self._message(chat_id, "here's a top results i've found:")}
+        return Update.de_json({"update_id": next(self._ids), "callback_query": callback_query}, self.bot)
+
+
+class BotLoadTest:
+    def __init__(self, params: LoadTestParams, directory: str) -> None:
+        self.params = params
+        self.telegram = TelegramStandIn(latency=params.telegram_latency)
+        self.apibay = ApibayStandIn(latency=params.apibay_latency, rows_per_response=params.rows,
+                                    released_episodes=params.rows, release_every=1)
+        self.transmission = TransmissionStandIn(latency=params.transmission_latency)
+        for i in range(params.torrents):
+            self.transmission.add(f"Seeded torrent {i}", f"{i:040x}")
+        self.search_http_client = PooledHttpClient(transport=MockTransport(self.apibay))
+        self.transmission_http_client = PooledHttpClient(transport=MockTransport(self.transmission))
+        self.store = JsonMonitorStore(f"{directory}/monitors.json")
+        self.application: Application = ApplicationBuilder().token("123456:stand-in").request(self.telegram) \
+            .get_updates_request(TelegramStandIn()).build()
+        self.runner = TgBotRunner(
+            tg_client=self.application,
+            torrent_client=TransmissionClient("transmission.local", http_client=self.transmission_http_client),
+            torrent_searcher=PBSearcher(http_client=self.search_http_client),
+            monitors_orchestrator=MonitorOrchestrator(http_client=self.search_http_client, store=self.store),
+            tg_user_whitelist=[self.chat_id(user) for user in range(params.users)])
+        self.updates = UpdateFactory(self.application.bot)
+        self.latencies: dict[str, list[float]] = {}
+
+    @staticmethod
+    def chat_id(user: int) -> int:
+        return 1000 + user
+
+    async def send(self, handler_name: str, update: Update) -> None:
+        started_at = time.perf_counter()
+        await self.application.process_update(update)
+        self.latencies.setdefault(handler_name, []).append(time.perf_counter() - started_at)
+
+    async def user_session(self, user: int) -> None:
+        chat_id = self.chat_id(user)
+        for round_number in range(self.params.rounds):
+            show = (user + round_number * self.params.users) % self.params.queries
+            await self.send("search_pb", self.updates.command(chat_id, "search", f"show {show}", "s01"))
+            if not (search_results := self.runner.sessions.get(chat_id).search_results):
+                continue
+            info_hash = next(reversed(search_results))
+            await self.send("callback_full_name", self.updates.callback(chat_id, f"full_name={info_hash}"))
+            await self.send("callback_mag_link", self.updates.callback(chat_id, f"mag_link={info_hash}"))
+            await self.send("callback_download_type", self.updates.callback(chat_id, "download_type_search=show"))
+            await self.send("get_recent_downloads", self.updates.command(chat_id, "downloads"))
+
+    async def run(self) -> dict:
+        errors_before = {name: handler_errors.value(handler=name) for name in self._handler_names()}
+        lag_monitor = LoopLagMonitor(self.params.lag_interval)
+        async with self.application:
+            lag_task = asyncio.create_task(lag_monitor.run())
+            started_at = time.perf_counter()
+            try:
+                await asyncio.gather(*(self.user_session(user) for user in range(self.params.users)))
+            finally:
+                duration = time.perf_counter() - started_at
+                lag_task.cancel()
+                await asyncio.gather(lag_task, return_exceptions=True)
+                await self.search_http_client.aclose()
+                await self.transmission_http_client.aclose()
+        updates_processed = sum(map(len, self.latencies.values()))
+        return {
+            "duration_s": duration,
+            "updates": updates_processed,
+            "updates_per_s": updates_processed / duration if duration else 0,
+            "handlers": {name: summarize(latencies) | {
+                "errors": handler_errors.value(handler=name) - errors_before.get(name, 0)}
+                for name, latencies in self.latencies.items()},
+            "event_loop_lag": lag_monitor.summary(),
+            "bot_api_calls": dict(self.telegram.calls),
+            "apibay_requests": self.apibay.requests,
+            "transmission_requests": len(self.transmission.requests),
+        }
+
+    @staticmethod
+    def _handler_names() -> list[str]:
+        return ["search_pb", "callback_full_name", "callback_mag_link", "callback_download_type",
+                "get_recent_downloads"]
+
+
+def run_load_test(params: LoadTestParams) -> dict:
+    reset_searcher_state()
+    with tempfile.TemporaryDirectory() as directory:
+        results = asyncio.run(BotLoadTest(params, directory).run())
+    return {"benchmark": "tg_bot.handlers", "commit": git_commit(), "params": asdict(params)} | results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="virtual users sending updates at the same time")
+    parser.add_argument("--rounds", type=int, default=3, help="search-and-download scenarios per user")
+    parser.add_argument("--queries", type=int, default=50, help="distinct search queries shared by the users")
+    parser.add_argument("--telegram-latency", type=float, default=0)
+    parser.add_argument("--apibay-latency", type=float, default=0)
+    parser.add_argument("--transmission-latency", type=float, default=0)
+    parser.add_argument("--rows", type=int, default=20, help="rows in every apibay response")
+    parser.add_argument("--torrents", type=int, default=30, help="torrents already in transmission")
+    parser.add_argument("--output", default="", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the application logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.remove()
+    params = LoadTestParams(users=args.users, rounds=args.rounds, queries=args.queries,
+                            telegram_latency=args.telegram_latency, apibay_latency=args.apibay_latency,
+                            transmission_latency=args.transmission_latency, rows=args.rows, torrents=args.torrents)
+    report = run_load_test(params)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
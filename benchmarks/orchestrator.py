@@ -0,0 +1,174 @@
+"""Throughput and memory of MonitorOrchestrator.run_search_jobs against in-process apibay and transmission stand-ins.
+
+    python -m benchmarks.orchestrator --monitors 10 1000 10000 --latency 0.005 --output results.json
+
+Results are printed as json, so runs on different commits can be diffed or loaded into a dataframe.
+"""
+from dataclasses import dataclass, asdict
+from httpx import MockTransport
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from logger import logger
+from tests.stand_ins import ApibayStandIn, TransmissionStandIn
+from torrent_manager import (MonitorOrchestrator, PBSearcher, PooledHttpClient, SearchCache, TokenBucket, RetryPolicy,
+                             ApibayProvider, ProviderFanOut, TransmissionClient, create_monitor_store)
+
+
+@dataclass
+class BenchmarkParams:
+    latency: float = 0
+    rows: int = 20
+    released_episodes: int = 2
+    release_every: int = 10
+    concurrency: int = 16
+    store: str = "json"
+    season_batch: bool = False
+    repeat: int = 3
+
+
+@dataclass
+class BenchmarkResult:
+    monitors: int
+    durations_s: list[float]
+    median_s: float
+    monitors_per_s: float
+    apibay_requests: int
+    found: int
+    download_submission_s: float
+    transmission_requests: int
+    peak_traced_memory_bytes: int
+    max_rss_bytes: int
+
+
+def monitor_settings(count: int) -> list[dict]:
+    return [{"owner_id": i % 50, "monitor_type": "show", "name": f"show {i}", "season": 1, "episode": 1,
+             "size_limit": 0, "uuid": f"benchmark-{i}"} for i in range(count)]
+
+
+def reset_searcher_state() -> None:
+    # the benchmark measures the orchestrator, not the politeness towards apibay
+    PBSearcher.search_cache = SearchCache()
+    provider = ApibayProvider(rate_limiter=TokenBucket(rate=10 ** 9, capacity=10 ** 9),
+                              retry_policy=RetryPolicy(attempts=1))
+    PBSearcher.search_providers = ProviderFanOut([provider])
+
+
+async def run_once(count: int, params: BenchmarkParams, directory: str) -> tuple[float, ApibayStandIn, list]:
+    reset_searcher_state()
+    apibay = ApibayStandIn(latency=params.latency, rows_per_response=params.rows,
+                           released_episodes=params.released_episodes, release_every=params.release_every)
+    http_client = PooledHttpClient(transport=MockTransport(apibay))
+    store = create_monitor_store(params.store, f"{directory}/monitors-{count}.json",
+                                 f"{directory}/monitors-{count}.sqlite")
+    store.upsert(monitor_settings(count))
+    orchestrator = MonitorOrchestrator(http_client=http_client, concurrency=params.concurrency,
+                                       job_timeout=3600, iteration_deadline=24 * 3600,
+                                       season_batch=params.season_batch, store=store)
+    try:
+        started_at = time.perf_counter()
+        found_items = await orchestrator.run_search_jobs(orchestrator.get_all_jobs())
+        return time.perf_counter() - started_at, apibay, found_items
+    finally:
+        await http_client.aclose()
+        store.close()
+
+
+async def submit_downloads(found_items: list, params: BenchmarkParams) -> tuple[float, int]:
+    transmission = TransmissionStandIn(latency=params.latency)
+    http_client = PooledHttpClient(transport=MockTransport(transmission))
+    client = TransmissionClient("transmission.local", http_client=http_client)
+    try:
+        started_at = time.perf_counter()
+        await client.add_downloads([(item.magnet_link, item.job_settings.searcher.monitor_type)
+                                    for item in found_items])
+        return time.perf_counter() - started_at, len(transmission.requests)
+    finally:
+        await http_client.aclose()
+
+
+def benchmark(count: int, params: BenchmarkParams) -> BenchmarkResult:
+    with tempfile.TemporaryDirectory() as directory:
+        durations, apibay, found_items = [], None, []
+        for _ in range(params.repeat):
+            duration, apibay, found_items = asyncio.run(run_once(count, params, directory))
+            durations.append(duration)
+        download_duration, transmission_requests = asyncio.run(submit_downloads(found_items, params))
+        # tracemalloc slows everything down, so memory gets its own run
+        tracemalloc.start()
+        try:
+            asyncio.run(run_once(count, params, directory))
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    median = statistics.median(durations)
+    return BenchmarkResult(
+        monitors=count, durations_s=durations, median_s=median, monitors_per_s=count / median if median else 0,
+        apibay_requests=apibay.requests, found=len(found_items), download_submission_s=download_duration,
+        transmission_requests=transmission_requests, peak_traced_memory_bytes=peak_memory,
+        # ru_maxrss is in kilobytes on linux and in bytes on macos
+        max_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    )
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(sizes: list[int], params: BenchmarkParams) -> dict:
+    return {
+        "benchmark": "orchestrator.run_search_jobs",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": asdict(params),
+        "results": [asdict(benchmark(count, params)) for count in sizes],
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--monitors", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every stand-in response")
+    parser.add_argument("--rows", type=int, default=20, help="rows in every non-empty apibay response")
+    parser.add_argument("--release-every", type=int, default=10, help="every n-th show has new episodes")
+    parser.add_argument("--released-episodes", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--store", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--season-batch", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the application logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.remove()
+    params = BenchmarkParams(latency=args.latency, rows=args.rows, released_episodes=args.released_episodes,
+                             release_every=args.release_every, concurrency=args.concurrency, store=args.store,
+                             season_batch=args.season_batch, repeat=args.repeat)
+    report = run_benchmarks(args.monitors, params)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -8,3 +8,45 @@ TG_BOT_TOKEN: str = getenv("TG_BOT_TOKEN") or ""
 ALLOWED_TG_IDS: str = getenv("ALLOWED_TG_IDS") or ""
 LOGTAIL_TOKEN: str = getenv("LOGTAIL_TOKEN") or ""
 HEARTBEAT_KEY: str = getenv("HEARTBEAT_KEY") or ""
+HTTP_POOL_MAX_CONNECTIONS: int = int(getenv("HTTP_POOL_MAX_CONNECTIONS") or 10)
+HTTP_POOL_MAX_KEEPALIVE: int = int(getenv("HTTP_POOL_MAX_KEEPALIVE") or 5)
+HTTP_KEEPALIVE_EXPIRY: float = float(getenv("HTTP_KEEPALIVE_EXPIRY") or 30)
+HTTP2_ENABLED: bool = getenv("HTTP2_ENABLED") == "1"
+MONITOR_CONCURRENCY: int = int(getenv("MONITOR_CONCURRENCY") or 16)
+MONITOR_JOB_TIMEOUT: float = float(getenv("MONITOR_JOB_TIMEOUT") or 60)
+MONITOR_ITERATION_DEADLINE: float = float(getenv("MONITOR_ITERATION_DEADLINE") or 300)
+SEARCH_CACHE_TTL: float = float(getenv("SEARCH_CACHE_TTL") or 600)
+SEARCH_CACHE_EMPTY_TTL: float = float(getenv("SEARCH_CACHE_EMPTY_TTL") or 60)
+SEARCH_CACHE_MAX_ENTRIES: int = int(getenv("SEARCH_CACHE_MAX_ENTRIES") or 512)
+SEARCH_CACHE_MAX_BYTES: int = int(getenv("SEARCH_CACHE_MAX_BYTES") or 8 * 1024 ** 2)
+MONITOR_SEASON_BATCH: bool = getenv("MONITOR_SEASON_BATCH") != "0"
+MONITOR_STORE: str = getenv("MONITOR_STORE") or "json"
+MONITOR_SQLITE_PATH: str = getenv("MONITOR_SQLITE_PATH") or ""
+MONITOR_INTERVAL: float = float(getenv("MONITOR_INTERVAL") or 60 * 60 * 8)
+MONITOR_JITTER: float = float(getenv("MONITOR_JITTER") or 0.1)
+MONITOR_CATCH_UP_WINDOW: float = float(getenv("MONITOR_CATCH_UP_WINDOW") or 300)
+MONITOR_ADAPTIVE_INTERVALS: bool = getenv("MONITOR_ADAPTIVE_INTERVALS") != "0"
+MONITOR_MIN_INTERVAL: float = float(getenv("MONITOR_MIN_INTERVAL") or 60 * 60)
+MONITOR_MAX_INTERVAL: float = float(getenv("MONITOR_MAX_INTERVAL") or 60 * 60 * 24 * 7)
+SEARCH_RATE_LIMIT: float = float(getenv("SEARCH_RATE_LIMIT") or 2)
+SEARCH_RATE_BURST: float = float(getenv("SEARCH_RATE_BURST") or 10)
+SEARCH_RETRY_ATTEMPTS: int = int(getenv("SEARCH_RETRY_ATTEMPTS") or 3)
+SEARCH_RETRY_BASE_DELAY: float = float(getenv("SEARCH_RETRY_BASE_DELAY") or 0.5)
+SEARCH_BREAKER_THRESHOLD: int = int(getenv("SEARCH_BREAKER_THRESHOLD") or 5)
+SEARCH_BREAKER_RECOVERY: float = float(getenv("SEARCH_BREAKER_RECOVERY") or 60)
+SEARCH_PROVIDERS: str = getenv("SEARCH_PROVIDERS") or "https://apibay.org"
+SEARCH_DEADLINE: float = float(getenv("SEARCH_DEADLINE") or 50)
+METRICS_PORT: int = int(getenv("METRICS_PORT") or 0)
+METRICS_HOST: str = getenv("METRICS_HOST") or "127.0.0.1"
+TRACING_ENABLED: bool = getenv("TRACING_ENABLED") == "1"
+TRACE_EXPORT_DIR: str = getenv("TRACE_EXPORT_DIR") or ""
+LOG_SHIP_QUEUE_SIZE: int = int(getenv("LOG_SHIP_QUEUE_SIZE") or 10000)
+LOG_SHIP_BATCH_SIZE: int = int(getenv("LOG_SHIP_BATCH_SIZE") or 100)
+LOG_SHIP_FLUSH_INTERVAL: float = float(getenv("LOG_SHIP_FLUSH_INTERVAL") or 1)
+LOG_DEBUG_SAMPLE_RATE: float = float(getenv("LOG_DEBUG_SAMPLE_RATE") or 1)
+LIVE_DOWNLOADS_INTERVAL: float = float(getenv("LIVE_DOWNLOADS_INTERVAL") or 5)
+LIVE_DOWNLOADS_MAX_DURATION: float = float(getenv("LIVE_DOWNLOADS_MAX_DURATION") or 60 * 60)
+COMPLETION_WATCH_INTERVAL: float = float(getenv("COMPLETION_WATCH_INTERVAL") or 45)
+NOTIFY_GLOBAL_RATE: float = float(getenv("NOTIFY_GLOBAL_RATE") or 25)
+NOTIFY_CHAT_RATE: float = float(getenv("NOTIFY_CHAT_RATE") or 1)
+NOTIFY_DIGEST_DELAY: float = float(getenv("NOTIFY_DIGEST_DELAY") or 3)
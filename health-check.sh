@@ -1,5 +1,15 @@
 #! /bin/bash
 
+# with the metrics endpoint enabled, ask the bot itself whether it's ready
+if [ -n "$METRICS_PORT" ] && [ "$METRICS_PORT" != "0" ];
+then
+        curl --silent --fail --max-time 5 "http://127.0.0.1:$METRICS_PORT/ready" || {
+                echo "healthcheck: readiness endpoint is failing"
+                exit 1
+        }
+        exit 0
+fi
+
 LOG_FOLDER=logs
 LOG_HEALTH_FLAG="search_torrent ran"
 TIME_THRESHOLD=$(date --date "8 hours ago" +'%s')
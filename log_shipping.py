@@ -0,0 +1,131 @@
+from collections import deque
+from datetime import timezone
+from typing import Any, Callable
+import atexit
+import random
+import threading
+
+SERIALIZABLE_TYPES = (str, int, float, bool, type(None), list, tuple, dict)
+
+
+def record_to_frame(record: dict) -> dict:
+    """Same shape as the frames logtail's own handler builds from stdlib log records"""
+    frame = {
+        "dt": record["time"].astimezone(timezone.utc).isoformat(),
+        "level": record["level"].name.lower(),
+        "severity": int(record["level"].no / 10),
+        "message": record["message"],
+        "context": {
+            "runtime": {"function": record["function"], "file": record["file"].path, "line": record["line"],
+                        "thread_id": record["thread"].id, "thread_name": record["thread"].name,
+                        "logger_name": record["name"]},
+            "system": {"pid": record["process"].id, "process_name": record["process"].name},
+        },
+    }
+    for key, value in record["extra"].items():
+        frame[key] = value if isinstance(value, SERIALIZABLE_TYPES) else str(value)
+    if record["exception"] is not None:
+        frame["exception"] = repr(record["exception"].value)
+    return frame
+
+
+class BatchedLogSink:
+    """Loguru sink that only appends the record to a bounded queue on the logging thread.
+    A background thread turns the records into frames and ships them in batches.
+    When the queue is full, the oldest record is dropped to make room."""
+
+    def __init__(self, ship: Callable[[list[dict]], Any], max_queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 1) -> None:
+        self.ship = ship
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.shipped = 0
+        self.failed_batches = 0
+        self._queue: deque[dict] = deque(maxlen=max_queue_size)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker: threading.Thread | None = None
+
+    def __repr__(self):
+        return f"BatchedLogSink(queued={len(self._queue)}, shipped={self.shipped}, dropped={self.dropped})"
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __call__(self, message) -> None:
+        self.put(message.record)
+
+    def put(self, record: dict) -> None:
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(record)
+            queued = len(self._queue)
+        if self._worker is None:
+            self._start_worker()
+        if queued >= self.batch_size:
+            self._wakeup.set()
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name="log-shipping", daemon=True)
+        self._worker.start()
+
+    def _take_batch(self) -> list[dict]:
+        with self._lock:
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            while batch := self._take_batch():
+                try:
+                    response = self.ship([record_to_frame(record) for record in batch])
+                except Exception:
+                    # there's nowhere left to log a failure of the log shipping itself
+                    self.failed_batches += 1
+                    continue
+                if getattr(response, "status_code", 200) >= 400:
+                    self.failed_batches += 1
+                    continue
+                self.shipped += len(batch)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        self.flush()
+
+
+class DebugSampler:
+    """Loguru filter letting through a `rate` share of the DEBUG records bound with sampled=True"""
+
+    def __init__(self, rate: float = 1, rng: Callable[[], float] = random.random) -> None:
+        self.rate = rate
+        self.rng = rng
+
+    def __call__(self, record: dict) -> bool:
+        if record["level"].name != "DEBUG" or not record["extra"].get("sampled"):
+            return True
+        return self.rate >= 1 or self.rng() < self.rate
+
+
+def create_logtail_sink(source_token: str, max_queue_size: int, batch_size: int, flush_interval: float) \
+        -> BatchedLogSink:
+    from logtail.uploader import Uploader
+    from logtail.handler import DEFAULT_HOST
+    sink = BatchedLogSink(Uploader(source_token, DEFAULT_HOST), max_queue_size=max_queue_size,
+                          batch_size=batch_size, flush_interval=flush_interval)
+    atexit.register(sink.stop)
+    return sink
@@ -1,7 +1,8 @@
 import sys
 from loguru import logger
-from logtail import LogtailHandler
-from config import LOGTAIL_TOKEN
+from config import LOGTAIL_TOKEN, LOG_SHIP_QUEUE_SIZE, LOG_SHIP_BATCH_SIZE, LOG_SHIP_FLUSH_INTERVAL, \
+    LOG_DEBUG_SAMPLE_RATE
+from log_shipping import BatchedLogSink, DebugSampler, create_logtail_sink
 
 logger.remove(0)
 
@@ -14,13 +15,18 @@ logger.add(
     enqueue=True
 )
 
+log_sink: BatchedLogSink | None = None
+
 if LOGTAIL_TOKEN:
-    logtail_handler = LogtailHandler(source_token=LOGTAIL_TOKEN)
+    # records are shipped in batches from a background thread, logging never waits on the network
+    log_sink = create_logtail_sink(LOGTAIL_TOKEN, max_queue_size=LOG_SHIP_QUEUE_SIZE,
+                                   batch_size=LOG_SHIP_BATCH_SIZE, flush_interval=LOG_SHIP_FLUSH_INTERVAL)
 
     logger.add(
-        logtail_handler,
+        log_sink,
         format="{message}",
         level="DEBUG",
+        filter=DebugSampler(LOG_DEBUG_SAMPLE_RATE),
         backtrace=False,
         diagnose=False
     )
@@ -1,52 +1,177 @@
-from time import sleep
-from telegram.ext import ApplicationBuilder
-from config import TRANSMISSION_HOST, TG_BOT_TOKEN, ALLOWED_TG_IDS, HEARTBEAT_KEY
-from logger import logger
-from httpx import AsyncClient
+from startup import startup
+from functools import cached_property
+from config import TRANSMISSION_HOST, TG_BOT_TOKEN, ALLOWED_TG_IDS, HEARTBEAT_KEY, \
+    HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED, \
+    MONITOR_CONCURRENCY, MONITOR_JOB_TIMEOUT, MONITOR_ITERATION_DEADLINE, MONITOR_SEASON_BATCH, \
+    MONITOR_STORE, MONITOR_SQLITE_PATH, MONITOR_INTERVAL, MONITOR_JITTER, MONITOR_CATCH_UP_WINDOW, \
+    MONITOR_ADAPTIVE_INTERVALS, MONITOR_MIN_INTERVAL, MONITOR_MAX_INTERVAL, METRICS_PORT, METRICS_HOST
+from logger import logger, log_sink
+from metrics import metrics, MetricsServer
+import argparse
 import asyncio
-
-from torrent_manager import TransmissionClient, MonitorOrchestrator, PBSearcher
-from tg_bot import TgBotRunner
+import os
 
 
 PERIOD_SECONDS = 60 * 60 * 8
-users_whitelist = [int(uid) for uid in ALLOWED_TG_IDS.split(",")]
-admin_tg_id = users_whitelist[0]
 
-torrent_searcher = PBSearcher()
-monitors_orchestrator = MonitorOrchestrator()
-transmission = TransmissionClient(TRANSMISSION_HOST)
+if log_sink is not None:
+    metrics.counter_callback("log_records_dropped_total", "Log records dropped because the shipping queue was full",
+                             lambda: log_sink.dropped)
+    metrics.counter_callback("log_records_shipped_total", "Log records shipped to logtail", lambda: log_sink.shipped)
+
+
+class App:
+    """Builds every component on first use, so a one-off monitor run never imports telegram
+    and nothing connects anywhere before it's needed"""
+
+    @cached_property
+    def torrent_manager(self):
+        return startup.import_module("torrent_manager")
+
+    @cached_property
+    def http_client(self):
+        return self.torrent_manager.PooledHttpClient(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                                                     max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                                                     keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                                                     http2=HTTP2_ENABLED)
+
+    @cached_property
+    def monitor_store(self):
+        with startup.phase("load monitor store"):
+            return self.torrent_manager.create_monitor_store(
+                MONITOR_STORE,
+                json_path=os.path.join(os.getcwd(), "data", "monitor_settings.json"),
+                sqlite_path=MONITOR_SQLITE_PATH or os.path.join(os.getcwd(), "data", "monitors.db"))
+
+    @cached_property
+    def monitors_orchestrator(self):
+        polling_policy = self.torrent_manager.PollingPolicy(base_interval=MONITOR_INTERVAL,
+                                                            min_interval=MONITOR_MIN_INTERVAL,
+                                                            max_interval=MONITOR_MAX_INTERVAL)
+        # a search cut off while it's still retrying never opens the breaker
+        self.torrent_manager.PBSearcher.search_providers.check_deadline(self.http_client.timeout, MONITOR_JOB_TIMEOUT)
+        with startup.phase("load monitors"):
+            return self.torrent_manager.MonitorOrchestrator(
+                store=self.monitor_store,
+                http_client=self.http_client,
+                concurrency=MONITOR_CONCURRENCY,
+                job_timeout=MONITOR_JOB_TIMEOUT,
+                iteration_deadline=MONITOR_ITERATION_DEADLINE,
+                season_batch=MONITOR_SEASON_BATCH,
+                polling_policy=polling_policy if MONITOR_ADAPTIVE_INTERVALS else None)
+
+    @cached_property
+    def transmission(self):
+        return self.torrent_manager.TransmissionClient(TRANSMISSION_HOST)
+
+    @cached_property
+    def runner(self):
+        telegram_ext = startup.import_module("telegram.ext")
+        tg_bot = startup.import_module("tg_bot")
+        with startup.phase("build telegram application"):
+            return tg_bot.TgBotRunner(tg_client=telegram_ext.ApplicationBuilder().token(TG_BOT_TOKEN).build(),
+                                      torrent_client=self.transmission,
+                                      torrent_searcher=self.torrent_manager.PBSearcher(http_client=self.http_client),
+                                      monitors_orchestrator=self.monitors_orchestrator,
+                                      tg_user_whitelist=[int(uid) for uid in ALLOWED_TG_IDS.split(",")])
+
+    @cached_property
+    def scheduler(self):
+        return self.torrent_manager.MonitorScheduler(self.monitors_orchestrator,
+                                                     on_finds=self.runner.download_found_items,
+                                                     interval=MONITOR_INTERVAL,
+                                                     jitter=MONITOR_JITTER,
+                                                     catch_up_window=MONITOR_CATCH_UP_WINDOW)
+
+    @cached_property
+    def metrics_server(self) -> MetricsServer | None:
+        return MetricsServer(metrics, host=METRICS_HOST, port=METRICS_PORT) if METRICS_PORT else None
+
+    def _built(self, component: str) -> bool:
+        return component in self.__dict__
+
+    async def download_found_items(self, found_items: list) -> list:
+        # one-off runs have no bot to notify anyone, the finds are only added
+        return await self.transmission.add_downloads([(found_item.magnet_link,
+                                                       found_item.job_settings.searcher.monitor_type)
+                                                      for found_item in found_items])
+
+    async def emit_heartbeat(self):
+        await self.http_client.get("https://uptime.betterstack.com/api/v1/heartbeat/" + HEARTBEAT_KEY)
 
-runner = TgBotRunner(tg_client=ApplicationBuilder().token(TG_BOT_TOKEN).build(),
-                     torrent_client=transmission,
-                     torrent_searcher=torrent_searcher,
-                     monitors_orchestrator=monitors_orchestrator,
-                     tg_user_whitelist=users_whitelist)
+    async def emit_heartbeats(self, period_seconds):
+        from httpx import HTTPError
+        while True:
+            try:
+                await self.emit_heartbeat()
+            except HTTPError as e:
+                logger.warning(f"heartbeat failed: {e!r}")
+            logger.debug("http connection stats", **self.http_client.stats.to_dict())
+            await asyncio.sleep(period_seconds)
 
+    async def shutdown(self):
+        # only what was actually built needs closing
+        if self._built("runner"):
+            await self.runner.notifications.aclose()
+        if self._built("metrics_server") and self.metrics_server is not None:
+            await self.metrics_server.aclose()
+        if self._built("http_client"):
+            await self.http_client.aclose()
+        if self._built("transmission"):
+            await self.transmission.aclose()
+        if self._built("monitor_store"):
+            self.monitor_store.close()
 
-async def emit_heartbeat():
-    async with AsyncClient(timeout=10) as client:
-        await client.get("https://uptime.betterstack.com/api/v1/heartbeat/" + HEARTBEAT_KEY)
+    def report_startup(self, milestone: str) -> None:
+        elapsed = startup.mark(milestone)
+        logger.info(f"{milestone} {elapsed:.3f}s after start: {startup.summary()}", milestone=milestone,
+                    elapsed=elapsed)
 
+    async def run_once(self) -> None:
+        try:
+            found_items = await self.monitors_orchestrator.run_search_jobs(self.monitors_orchestrator.get_all_jobs())
+            outcomes = await self.download_found_items(found_items)
+            logger.info("one-off monitor run finished", found=len(found_items),
+                        added=sum(outcome.status == "added" for outcome in outcomes))
+            self.report_startup("one-off run finished")
+        finally:
+            await self.shutdown()
 
-@logger.catch
-async def run_search_jobs_on_timer(timer_seconds):
-    logger.debug("run_search_jobs_on_timer running")
-    await emit_heartbeat()
-    await runner.download_new_finds(admin_tg_id)
-    sleep(timer_seconds)
-    await run_search_jobs_on_timer(timer_seconds)
+    async def run_bot(self) -> None:
+        # polling, the monitor scheduler and heartbeats share one event loop
+        runner, scheduler = self.runner, self.scheduler
+        metrics.add_readiness_check("telegram_polling", lambda: runner.tg_client.updater.running)
+        metrics.add_readiness_check("monitor_scheduler", lambda: scheduler.is_alive)
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        async with runner.tg_client:
+            await runner.tg_client.start()
+            await runner.tg_client.updater.start_polling()
+            logger.debug("bot polling started")
+            self.report_startup("polling started")
+            try:
+                await asyncio.gather(scheduler.run_forever(), runner.completion_watcher.run_forever(),
+                                     self.emit_heartbeats(PERIOD_SECONDS))
+            finally:
+                await runner.tg_client.updater.stop()
+                await runner.tg_client.stop()
+                await self.shutdown()
 
 
-# @logger.catch(level="WARNING")
-async def bot_poll():
-    logger.debug("bot_poll started")
-    runner.tg_client.run_polling()
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="telegram interface and release monitor for transmission")
+    parser.add_argument("--once", action="store_true",
+                        help="run every monitor once, add the finds to transmission and exit, without the bot")
+    return parser.parse_args(argv)
 
 
-async def main():
-    await asyncio.gather(run_search_jobs_on_timer(PERIOD_SECONDS), bot_poll())
+async def main(argv: list[str] | None = None):
+    app = App()
+    if parse_args(argv).once:
+        await app.run_once()
+    else:
+        await app.run_bot()
 
 
 if __name__ == '__main__':
-    asyncio.run(run_search_jobs_on_timer(PERIOD_SECONDS))
+    asyncio.run(main())
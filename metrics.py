@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import asyncio
+import bisect
+import time
+from logger import logger
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(labelname, "")) for labelname in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+
+
+class CallbackCounter(Counter):
+    """Counter kept by some other object, read at scrape time"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self.read = read
+
+    def value(self, **labels) -> float:
+        return self.read()
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_format_value(self.read())}"
+
+
+class Histogram(Counter):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[key] = self._values.get(key, 0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in self._counts.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative_count += bucket_count
+                le = "+Inf" if upper_bound == float("inf") else _format_value(upper_bound)
+                yield f"{self.name}_bucket{_format_labels(labels | {'le': le})} {cumulative_count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(self._values[key])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative_count}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter] = {}
+        self._readiness_checks: dict[str, Callable[[], bool]] = {}
+
+    def _register(self, metric: Counter) -> Counter:
+        # modules are imported once, but a metric defined twice should still end up in a single family
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def counter_callback(self, name: str, documentation: str, read: Callable[[], float]) -> Counter:
+        return self._register(CallbackCounter(name, documentation, read))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def add_readiness_check(self, name: str, check: Callable[[], bool]) -> None:
+        self._readiness_checks[name] = check
+
+    def readiness(self) -> dict[str, bool]:
+        results = {}
+        for name, check in self._readiness_checks.items():
+            try:
+                results[name] = bool(check())
+            except Exception as e:
+                logger.warning(f"readiness check {name} failed: {e!r}")
+                results[name] = False
+        return results
+
+
+class MetricsServer:
+    """Minimal http endpoint serving /metrics in prometheus text format and /ready for health checks"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    def __repr__(self):
+        return f"MetricsServer(host={self.host}, port={self.port})"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("metrics endpoint started", host=self.host, port=self.port)
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _route(self, path: str) -> tuple[int, str, str]:
+        match path:
+            case "/metrics":
+                return 200, "text/plain; version=0.0.4", self.registry.render()
+            case "/ready":
+                readiness = self.registry.readiness()
+                body = "".join(f"{name} {'ok' if ready else 'failing'}\n" for name, ready in readiness.items())
+                return (200 if all(readiness.values()) else 503), "text/plain", body
+            case _:
+                return 404, "text/plain", "not found\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            _, path, *_ = request_line.decode("latin-1").split() or ["", ""]
+            status, content_type, body = self._route(path.split("?")[0])
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            writer.close()
+            return
+        payload = body.encode()
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                     f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Callable, Iterator
+import importlib
+import sys
+import time
+
+
+class StartupTimer:
+    """Times the startup phases, measured from the moment this module got imported.
+    Doesn't depend on anything but the stdlib, so it can be imported before the heavy modules."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.started_at = clock()
+        self.phases: dict[str, float] = {}
+        self.milestones: dict[str, float] = {}
+
+    def __repr__(self):
+        return f"StartupTimer(phases={len(self.phases)}, milestones={list(self.milestones)})"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + self.clock() - started_at
+
+    def import_module(self, name: str) -> ModuleType:
+        if name in sys.modules:
+            return sys.modules[name]
+        with self.phase(f"import {name}"):
+            return importlib.import_module(name)
+
+    def mark(self, milestone: str) -> float:
+        self.milestones[milestone] = self.clock() - self.started_at
+        return self.milestones[milestone]
+
+    def to_dict(self) -> dict:
+        return {"phases": dict(self.phases), "milestones": dict(self.milestones)}
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {duration:.3f}s" for name, duration in self.phases.items())
+
+
+startup = StartupTimer()
@@ -1,20 +1,23 @@
 import pytest
 from typing import Callable
-from torrent_manager.pb_client import requests
+from httpx import MockTransport, Request, Response, ReadTimeout
+from torrent_manager import PBSearcher, PooledHttpClient, SearchCache, TokenBucket, RetryPolicy, CircuitBreaker, \
+    ApibayProvider, ProviderFanOut
 from dataclasses import dataclass, field
 from enum import Enum
 import json
+import re
 
 
 @dataclass
 class PBResponse:
-    data: dict = field(default_factory=dict)
+    data: list = field(default_factory=list)
     status_code: int = 200
-    text: str = ""
 
-    def __post_init__(self):
+    def to_response(self) -> Response:
         if self.data:
-            self.text = json.dumps(self.data)
+            return Response(self.status_code, json=self.data)
+        return Response(self.status_code)
 
 
 @dataclass
@@ -28,6 +31,8 @@ class ResponseType(Enum):
     EMPTY = "empty"
     NOT_FOUND = "not found"
     ITERATION = "iteration"
+    TIMEOUT = "timeout"
+    SEASON = "season"
 
 
 with open("tests/fixtures/pb_response_no_data.json", "r") as file:
@@ -38,62 +43,89 @@ with open("tests/fixtures/pb_response.json", "r") as file:
     data = json.load(file)
     pb_response = PBResponse(data)
 
+with open("tests/fixtures/pb_response_season.json", "r") as file:
+    data = json.load(file)
+    pb_response_season = PBResponse(data)
+
 
-def generate_mock_get(response_type: ResponseType | None = None) \
-        -> tuple[Callable[[str, any], PBResponse], Buffer]:
+def generate_mock_handler(response_type: ResponseType | None = None) \
+        -> tuple[Callable[[Request], Response], Buffer]:
     buffer = Buffer()
 
-    def mock_get(url: str = "", **kwargs) -> PBResponse:
-        query = kwargs.get("params", {}).get("q")
-        buffer.urls.append(url)
-        buffer.queries.append(query)
+    def mock_handler(request: Request) -> Response:
+        buffer.urls.append(str(request.url.copy_with(query=None)))
+        buffer.queries.append(request.url.params.get("q"))
         buffer.calls += 1
 
         match response_type:
             case ResponseType.EMPTY:
-                return pb_response_no_results
+                return pb_response_no_results.to_response()
             case ResponseType.NOT_FOUND:
-                return PBResponse(status_code=404)
+                return PBResponse(status_code=404).to_response()
+            case ResponseType.TIMEOUT:
+                raise ReadTimeout("timeout", request=request)
+            case ResponseType.SEASON:
+                if re.search(r"s\d\d$", buffer.queries[-1]):
+                    return pb_response_season.to_response()
+                return pb_response.to_response()
             case ResponseType.ITERATION:
                 if buffer.calls > 5:
-                    return pb_response_no_results
-                return pb_response
+                    return pb_response_no_results.to_response()
+                return pb_response.to_response()
             case _:
-                return pb_response
+                return pb_response.to_response()
+
+    return mock_handler, buffer
+
+
+def mock_search_host(monkeypatch: pytest.MonkeyPatch, response_type: ResponseType | None = None) -> Buffer:
+    mock_handler, buffer = generate_mock_handler(response_type)
+    monkeypatch.setattr(PBSearcher, "http_client", PooledHttpClient(transport=MockTransport(mock_handler)))
+    return buffer
+
+
+@pytest.fixture(autouse=True)
+def fresh_search_cache(monkeypatch: pytest.MonkeyPatch) -> SearchCache:
+    search_cache = SearchCache()
+    monkeypatch.setattr(PBSearcher, "search_cache", search_cache)
+    return search_cache
 
-    return mock_get, buffer
+
+@pytest.fixture(autouse=True)
+def fast_resilience_policies(monkeypatch: pytest.MonkeyPatch) -> CircuitBreaker:
+    circuit_breaker = CircuitBreaker()
+    provider = ApibayProvider(rate_limiter=TokenBucket(rate=10 ** 6, capacity=10 ** 6),
+                              retry_policy=RetryPolicy(attempts=3, base_delay=0.001, max_delay=0.001),
+                              circuit_breaker=circuit_breaker)
+    monkeypatch.setattr(PBSearcher, "search_providers", ProviderFanOut([provider]))
+    return circuit_breaker
 
 
 @pytest.fixture
 def mock_response(monkeypatch: pytest.MonkeyPatch):
-    mock_get, buffer = generate_mock_get()
-    monkeypatch.setattr(requests, "get", mock_get)
-    return buffer
+    return mock_search_host(monkeypatch)
 
 
 @pytest.fixture
 def mock_response_iteration(monkeypatch: pytest.MonkeyPatch):
-    mock_get, buffer = generate_mock_get(ResponseType.ITERATION)
-    monkeypatch.setattr(requests, "get", mock_get)
-    return buffer
+    return mock_search_host(monkeypatch, ResponseType.ITERATION)
+
+
+@pytest.fixture
+def mock_response_season(monkeypatch: pytest.MonkeyPatch):
+    return mock_search_host(monkeypatch, ResponseType.SEASON)
 
 
 @pytest.fixture
 def mock_response_empty(monkeypatch: pytest.MonkeyPatch):
-    mock_get, buffer = generate_mock_get(ResponseType.EMPTY)
-    monkeypatch.setattr(requests, "get", mock_get)
-    return buffer
+    return mock_search_host(monkeypatch, ResponseType.EMPTY)
 
 
 @pytest.fixture
 def mock_response_404(monkeypatch: pytest.MonkeyPatch):
-    mock_get, buffer = generate_mock_get(ResponseType.NOT_FOUND)
-    monkeypatch.setattr(requests, "get", mock_get)
-    return buffer
+    return mock_search_host(monkeypatch, ResponseType.NOT_FOUND)
 
 
 @pytest.fixture
 def mock_timeout(monkeypatch: pytest.MonkeyPatch):
-    def throw_timeout(*args, **kwargs):
-        raise requests.exceptions.ReadTimeout
-    monkeypatch.setattr(requests, "get", throw_timeout)
+    return mock_search_host(monkeypatch, ResponseType.TIMEOUT)
@@ -0,0 +1,190 @@
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs
+from httpx import Request, Response
+from telegram.request import BaseRequest, RequestData
+
+STATUS_CODES = {"stopped": 0, "check pending": 1, "checking": 2, "download pending": 3, "downloading": 4,
+                "seed pending": 5, "seeding": 6}
+
+
+@dataclass
+class TransmissionStandIn:
+    """In-process stand-in for the transmission rpc server, usable as an httpx.MockTransport handler"""
+    session_id: str = "stand-in-session-1"
+    latency: float = 0
+    torrents: dict[int, dict] = field(default_factory=dict)
+    requests: list[dict] = field(default_factory=list)
+    recently_active: set[int] = field(default_factory=set)
+    removed: list[int] = field(default_factory=list)
+    session_rejections: int = 0
+
+    def add(self, name: str, info_hash: str, status: str = "downloading", percent_done: float = 0.5,
+            size_when_done: int = 10 ** 9, added_date: float | None = None) -> dict:
+        torrent_id = max(self.torrents, default=0) + 1
+        self.torrents[torrent_id] = {
+            "id": torrent_id, "name": name, "hashString": info_hash.lower(), "status": STATUS_CODES[status],
+            "addedDate": int(added_date or time.time()), "percentDone": percent_done,
+            "sizeWhenDone": size_when_done, "leftUntilDone": int(size_when_done * (1 - percent_done)),
+            "downloadDir": "/downloads", "error": 0, "errorString": "",
+        }
+        self.recently_active.add(torrent_id)
+        return self.torrents[torrent_id]
+
+    def update(self, torrent_id: int, **fields) -> None:
+        self.torrents[torrent_id] |= fields
+        self.recently_active.add(torrent_id)
+
+    def remove(self, torrent_id: int) -> None:
+        del self.torrents[torrent_id]
+        self.recently_active.discard(torrent_id)
+        self.removed.append(torrent_id)
+
+    def rotate_session(self, session_id: str) -> None:
+        self.session_id = session_id
+
+    async def __call__(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.headers.get("X-Transmission-Session-Id") != self.session_id:
+            self.session_rejections += 1
+            return Response(409, headers={"X-Transmission-Session-Id": self.session_id})
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        arguments = payload.get("arguments", {})
+        match payload["method"]:
+            case "torrent-get":
+                return self._response(self._torrent_get(arguments))
+            case "torrent-add":
+                return self._response(self._torrent_add(arguments))
+            case method:
+                return self._response({}, result=f"method {method} not supported by stand-in")
+
+    @staticmethod
+    def _response(arguments: dict, result: str = "success") -> Response:
+        return Response(200, json={"arguments": arguments, "result": result})
+
+    def _torrent_get(self, arguments: dict) -> dict:
+        ids = arguments.get("ids")
+        response = {}
+        if ids == "recently-active":
+            torrents = [self.torrents[torrent_id] for torrent_id in self.recently_active if torrent_id in self.torrents]
+            response["removed"] = self.removed
+            self.recently_active, self.removed = set(), []
+        elif ids is None:
+            torrents = list(self.torrents.values())
+        else:
+            ids = ids if isinstance(ids, list) else [ids]
+            torrents = [torrent for torrent in self.torrents.values()
+                        if torrent["id"] in ids or torrent["hashString"] in ids]
+        fields = arguments.get("fields") or []
+        response["torrents"] = [{key: value for key, value in torrent.items() if key in fields}
+                                for torrent in torrents]
+        return response
+
+    def _torrent_add(self, arguments: dict) -> dict:
+        if "metainfo" in arguments:
+            name, info_hash = base64.b64decode(arguments["metainfo"]).decode().split(":")
+        else:
+            magnet_params = parse_qs(arguments["filename"].split("?", 1)[1])
+            info_hash = magnet_params["xt"][0].split(":")[-1]
+            name = magnet_params.get("dn", [info_hash])[0].strip()
+        existing = next((t for t in self.torrents.values() if t["hashString"] == info_hash.lower()), None)
+        if existing:
+            return {"torrent-duplicate": {key: existing[key] for key in ("id", "name", "hashString")}}
+        torrent = self.add(name, info_hash, status="download pending", percent_done=0)
+        torrent["downloadDir"] = arguments.get("download-dir", "")
+        return {"torrent-added": {key: torrent[key] for key in ("id", "name", "hashString")}}
+
+
+NO_RESULTS_ROW = {"id": "0", "name": "No results returned", "info_hash": "0" * 40, "leechers": "0", "seeders": "0",
+                  "num_files": "0", "size": "0", "username": "", "added": "0", "status": "member", "category": "0",
+                  "imdb": "", "total_found": "1"}
+
+
+@dataclass
+class ApibayStandIn:
+    """In-process stand-in for the apibay search api, usable as an httpx.MockTransport handler.
+    Shows named "show <n>" have `released_episodes` episodes in season 1 when n is divisible by `release_every`,
+    every other query comes back empty."""
+    latency: float = 0
+    rows_per_response: int = 20
+    released_episodes: int = 2
+    release_every: int = 10
+    requests: int = 0
+
+    _show_pattern = re.compile(r"^show (\d+) s(\d\d)(?:e(\d\d))?$")
+
+    async def __call__(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests += 1
+        return Response(200, json=self.rows(request.url.params.get("q", "")))
+
+    def rows(self, query: str) -> list[dict]:
+        if not (match := self._show_pattern.match(query)):
+            return [NO_RESULTS_ROW]
+        show_number, season, episode = int(match.group(1)), int(match.group(2)), match.group(3)
+        if show_number % self.release_every or season != 1:
+            return [NO_RESULTS_ROW]
+        episodes = [int(episode)] if episode else list(range(1, self.released_episodes + 1))
+        episodes = [episode for episode in episodes if episode <= self.released_episodes]
+        if not episodes:
+            return [NO_RESULTS_ROW]
+        return [self._row(show_number, episodes[i % len(episodes)], i) for i in range(self.rows_per_response)]
+
+    @staticmethod
+    def _row(show_number: int, episode: int, release: int) -> dict:
+        name = f"Show {show_number} S01E{episode:02d} 1080p WEB release {release}"
+        return {"id": str(show_number * 1000 + release), "name": name,
+                "info_hash": hashlib.sha1(name.encode()).hexdigest().upper(), "leechers": "3",
+                "seeders": str((show_number + release * 7) % 500), "num_files": "1",
+                "size": str(10 ** 9 + release), "username": "uploader", "added": "1700000000",
+                "status": ("vip", "trusted", "member")[release % 3], "category": "208", "imdb": ""}
+
+
+class TelegramStandIn(BaseRequest):
+    """Answers bot api calls locally, so an Application can process synthetic updates without the network"""
+
+    def __init__(self, latency: float = 0, bot_id: int = 123456) -> None:
+        self.latency = latency
+        self.bot_id = bot_id
+        self.calls: Counter[str] = Counter()
+        self._message_ids = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         *args, **kwargs) -> tuple[int, bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        parameters = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self.result(api_method, parameters)}).encode()
+
+    def result(self, api_method: str, parameters: dict) -> dict | bool | list:
+        match api_method:
+            case "getMe":
+                return {"id": self.bot_id, "is_bot": True, "first_name": "stand-in", "username": "stand_in_bot",
+                        "can_join_groups": False, "can_read_all_group_messages": False,
+                        "supports_inline_queries": False}
+            case "sendMessage" | "editMessageText":
+                self._message_ids += 1
+                return {"message_id": self._message_ids, "date": int(time.time()),
+                        "chat": {"id": int(parameters.get("chat_id", 0)), "type": "private"},
+                        "text": parameters.get("text", "")}
+            case "getUpdates":
+                return []
+            case _:
+                return True
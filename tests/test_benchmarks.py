@@ -0,0 +1,54 @@
+import asyncio
+import time
+from benchmarks.bot_handlers import LoadTestParams, LoopLagMonitor, percentile, run_load_test
+from benchmarks.orchestrator import BenchmarkParams, benchmark
+from tests.stand_ins import ApibayStandIn
+
+
+class TestApibayStandIn:
+    def test_released_episodes(self):
+        apibay = ApibayStandIn(rows_per_response=3, released_episodes=2, release_every=5)
+        assert [row["name"] for row in apibay.rows("show 5 s01e02")] == [
+            "Show 5 S01E02 1080p WEB release 0", "Show 5 S01E02 1080p WEB release 1",
+            "Show 5 S01E02 1080p WEB release 2"]
+        assert len({row["info_hash"] for row in apibay.rows("show 5 s01")}) == 3
+
+    def test_no_results(self):
+        apibay = ApibayStandIn(released_episodes=2, release_every=5)
+        for query in ("show 5 s01e03", "show 6 s01e01", "show 5 s02e01", "the matrix"):
+            assert apibay.rows(query)[0]["name"] == "No results returned"
+
+
+class TestOrchestratorBenchmark:
+    def test_small_run(self):
+        result = benchmark(20, BenchmarkParams(repeat=1, release_every=10, released_episodes=2))
+        # shows 0 and 10 find two episodes each and miss on the third query
+        assert (result.found, result.apibay_requests) == (4, 24)
+        assert result.transmission_requests == 5
+        assert result.peak_traced_memory_bytes > 0
+
+
+class TestBotLoadTest:
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (.5, .95, .99)
+        assert percentile([], 50) == 0
+
+    def test_blocking_call_shows_up_as_lag(self):
+        async def block_loop(lag_monitor):
+            task = asyncio.create_task(lag_monitor.run())
+            await asyncio.sleep(0.01)
+            time.sleep(0.05)
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        lag_monitor = LoopLagMonitor(interval=0.001)
+        asyncio.run(block_loop(lag_monitor))
+        assert lag_monitor.summary()["max_ms"] >= 40
+
+    def test_every_handler_runs(self):
+        report = run_load_test(LoadTestParams(users=3, rounds=2, torrents=2))
+        assert set(report["handlers"]) == {"search_pb", "callback_full_name", "callback_mag_link",
+                                           "callback_download_type", "get_recent_downloads"}
+        assert all(handler["count"] == 6 and handler["errors"] == 0 for handler in report["handlers"].values())
+        assert report["bot_api_calls"]["editMessageText"] == 6
@@ -0,0 +1,110 @@
+import asyncio
+from httpx import MockTransport
+from torrent_manager import CompletionWatcher, TransmissionClient, PooledHttpClient, PBSearcher, TorrentDetails
+from torrent_manager.pb_orchestrator import JobResult, MonitorSetting
+from torrent_manager.transmission_client import DownloadOutcome
+from tests.stand_ins import TransmissionStandIn
+
+
+def found_item(name: str, owner_id: int, silent: bool = False) -> JobResult:
+    return JobResult(TorrentDetails(name, "", 10, 1, "vip", ""), MonitorSetting(owner_id, PBSearcher(name), silent))
+
+
+class TestCompletionWatcher:
+    def setup_method(self, method):
+        self.notifications = []
+        self.stand_in = TransmissionStandIn()
+        self.torrent_id = self.stand_in.add("Severance S02E01", "a" * 40, percent_done=0.5)["id"]
+        client = TransmissionClient("localhost", http_client=PooledHttpClient(transport=MockTransport(self.stand_in)),
+                                    snapshot_min_age=0)
+        self.watcher = CompletionWatcher(client, self.notify, interval=0)
+
+    def notify(self, chat_id, text):
+        self.notifications.append((chat_id, text))
+
+    def tick(self):
+        asyncio.run(self.watcher.tick())
+
+    def test_notifies_owner_once_finished(self):
+        self.watcher.watch("A" * 40, 1, "Severance S02E01")
+        self.tick()
+        assert self.notifications == []
+        self.stand_in.update(self.torrent_id, status=6, percentDone=1.)
+        self.tick()
+        self.tick()
+        assert self.notifications == [(1, "Severance S02E01 finished downloading")]
+        assert self.watcher.watched == {}
+
+    def test_one_refresh_serves_every_owner(self):
+        self.stand_in.add("Akira", "b" * 40, status="seeding", percent_done=1)
+        self.watcher.watch("a" * 40, 1, "Severance S02E01")
+        self.watcher.watch("a" * 40, 2, "Severance S02E01")
+        self.watcher.watch("b" * 40, 3, "Akira")
+        self.tick()
+        assert len(self.stand_in.requests) == 1
+        assert self.notifications == [(3, "Akira finished downloading")]
+        self.stand_in.update(self.torrent_id, status=6, percentDone=1.)
+        self.tick()
+        assert sorted(self.notifications[1:]) == [(1, "Severance S02E01 finished downloading"),
+                                                  (2, "Severance S02E01 finished downloading")]
+
+    def test_idle_without_watched_downloads(self):
+        self.tick()
+        assert self.stand_in.requests == []
+
+    def test_error_removed_and_stopped(self):
+        self.stand_in.add("Akira", "b" * 40)
+        stopped_id = self.stand_in.add("Dune", "c" * 40, percent_done=0.25)["id"]
+        for owner_id, (info_hash, name) in enumerate([("a" * 40, "Severance S02E01"), ("b" * 40, "Akira"),
+                                                      ("c" * 40, "Dune")]):
+            self.watcher.watch(info_hash, owner_id, name)
+        self.tick()
+        self.stand_in.update(self.torrent_id, error=3, errorString="No data found")
+        self.stand_in.remove(self.torrent_id + 1)
+        self.stand_in.update(stopped_id, status=0)
+        self.tick()
+        assert sorted(self.notifications) == [(0, "Severance S02E01 failed: No data found"),
+                                              (1, "Akira was removed before it finished"),
+                                              (2, "Dune was stopped at 25%")]
+        # a stopped download may still be resumed
+        assert list(self.watcher.watched) == ["c" * 40]
+
+    def test_watch_finds_skips_silent_and_failed(self):
+        found_items = [found_item("loud", 1), found_item("quiet", 2, silent=True), found_item("broken", 3)]
+        outcomes = [DownloadOutcome("", "show", "a" * 40, "added"), DownloadOutcome("", "show", "b" * 40, "added"),
+                    DownloadOutcome("", "show", "c" * 40, "error")]
+        self.watcher.watch_finds(found_items, outcomes)
+        assert list(self.watcher.watched) == ["a" * 40]
+        assert self.watcher.watched["a" * 40].owner_ids == {1}
+
+    def test_survives_unexpected_errors(self):
+        ticks = []
+
+        async def broken_tick():
+            ticks.append(1)
+            raise ValueError("transmission answered with html")
+        self.watcher.tick = broken_tick
+
+        async def run_briefly():
+            try:
+                await asyncio.wait_for(self.watcher.run_forever(), 0.05)
+            except asyncio.TimeoutError:
+                pass
+        asyncio.run(run_briefly())
+        assert len(ticks) > 1
+
+    def test_default_interval_keeps_delta_refreshes(self):
+        assert CompletionWatcher(self.watcher.torrent_client, self.notify).interval < \
+            self.watcher.torrent_client.snapshot_max_delta_age
+
+    def test_failing_notify_doesnt_stop_others(self):
+        def notify(chat_id, text):
+            if chat_id == 1:
+                raise RuntimeError("queue closed")
+            self.notifications.append((chat_id, text))
+        self.watcher.notify = notify
+        self.watcher.watch("a" * 40, 1, "Severance S02E01")
+        self.watcher.watch("a" * 40, 2, "Severance S02E01")
+        self.stand_in.update(self.torrent_id, status=6, percentDone=1.)
+        self.tick()
+        assert self.notifications == [(2, "Severance S02E01 finished downloading")]
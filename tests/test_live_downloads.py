@@ -0,0 +1,104 @@
+import asyncio
+from httpx import MockTransport
+from telegram.error import BadRequest, RetryAfter
+from tg_bot import LiveDownloads
+from torrent_manager import TransmissionClient, PooledHttpClient
+from tests.stand_ins import TransmissionStandIn
+
+
+class FakeBot:
+    def __init__(self, error: Exception | None = None):
+        self.edits = []
+        self.error = error
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        if self.error is not None:
+            raise self.error
+        self.edits.append((chat_id, message_id, text))
+
+
+class TestLiveDownloads:
+    def setup_method(self, method):
+        self.now = 0.
+        self.renders = 0
+        self.stand_in = TransmissionStandIn()
+        self.torrent_id = self.stand_in.add("Severance S02E01", "a" * 40, percent_done=0.5)["id"]
+        self.stand_in.add("Akira", "b" * 40, status="seeding", percent_done=1)
+        client = TransmissionClient("localhost", http_client=PooledHttpClient(transport=MockTransport(self.stand_in)),
+                                    snapshot_min_age=0)
+        self.live_downloads = LiveDownloads(client, self.render, refresh_interval=5, max_duration=60,
+                                            clock=lambda: self.now)
+
+    def render(self, torrents):
+        self.renders += 1
+        return ", ".join(f"{torrent.name} {torrent.progress}%" for torrent in torrents)
+
+    def watch(self, bot, chat_id=1):
+        async def fetch_and_watch():
+            return self.live_downloads.watch(bot, chat_id, 10, await self.live_downloads.fetch())
+        return asyncio.run(fetch_and_watch())
+
+    def tick(self, seconds=5):
+        self.now += seconds
+        asyncio.run(self.live_downloads.tick())
+
+    def test_render_cached_per_snapshot(self):
+        async def fetch_twice():
+            return await self.live_downloads.fetch(), await self.live_downloads.fetch()
+        first, second = asyncio.run(fetch_twice())
+        assert first is second
+        assert self.renders == 1
+
+    def test_edits_only_changed_table(self):
+        bot = FakeBot()
+        assert self.watch(bot)
+        self.tick()
+        assert bot.edits == []
+        self.stand_in.update(self.torrent_id, percentDone=0.75)
+        self.tick()
+        assert bot.edits == [(1, 10, "<pre>Severance S02E01 75.0%, Akira 100.0%</pre>")]
+        assert self.renders == 2
+
+    def test_edits_throttled(self):
+        bot = FakeBot()
+        self.watch(bot)
+        self.stand_in.update(self.torrent_id, percentDone=0.75)
+        self.tick(seconds=2)
+        assert bot.edits == []
+        self.tick(seconds=3)
+        assert len(bot.edits) == 1
+
+    def test_stops_when_tracked_torrents_finish(self):
+        bot = FakeBot()
+        self.watch(bot)
+        self.stand_in.update(self.torrent_id, percentDone=1, status=6)
+        self.tick()
+        assert bot.edits[-1][2].endswith("\nall downloads finished")
+        assert self.live_downloads.views == {}
+
+    def test_nothing_to_watch(self):
+        self.stand_in.update(self.torrent_id, percentDone=1, status=6)
+        assert not self.watch(FakeBot())
+        assert self.live_downloads.views == {}
+
+    def test_expires(self):
+        self.watch(FakeBot())
+        self.tick(seconds=60)
+        assert self.live_downloads.views == {}
+
+    def test_deleted_message_drops_view(self):
+        self.watch(FakeBot(BadRequest("Message to edit not found")))
+        self.stand_in.update(self.torrent_id, percentDone=0.75)
+        self.tick()
+        assert self.live_downloads.views == {}
+
+    def test_flood_control_postpones_edit(self):
+        bot = FakeBot(RetryAfter(30))
+        self.watch(bot)
+        self.stand_in.update(self.torrent_id, percentDone=0.75)
+        self.tick()
+        bot.error = None
+        self.tick()
+        assert bot.edits == []
+        self.tick(seconds=30)
+        assert len(bot.edits) == 1
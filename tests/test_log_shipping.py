@@ -0,0 +1,102 @@
+import asyncio
+from loguru import logger
+from log_shipping import BatchedLogSink, DebugSampler
+from torrent_manager import PBMonitor
+
+
+class CapturedRecords:
+    def __init__(self, level="DEBUG", **add_options):
+        self.records = []
+        self.add_options = add_options | {"level": level}
+
+    def __enter__(self):
+        self.handler_id = logger.add(lambda message: self.records.append(message.record), **self.add_options)
+        return self.records
+
+    def __exit__(self, *exc_info):
+        logger.remove(self.handler_id)
+
+
+class TestBatchedLogSink:
+    def setup_method(self, method):
+        self.batches = []
+        self.sink = BatchedLogSink(self.batches.append, max_queue_size=3, batch_size=2, flush_interval=60)
+
+    def test_ships_frames_in_batches(self):
+        with CapturedRecords() as records:
+            for i in range(3):
+                logger.info("record {}", i, attempt=i)
+        for record in records:
+            self.sink.put(record)
+        self.sink.stop()
+        messages = [[frame["message"] for frame in batch] for batch in self.batches]
+        assert messages == [["record 0", "record 1"], ["record 2"]]
+        frame = self.batches[0][1]
+        assert (frame["level"], frame["severity"], frame["attempt"]) == ("info", 2, 1)
+        assert frame["context"]["runtime"]["function"] == "test_ships_frames_in_batches"
+        assert self.sink.shipped == 3
+
+    def test_drops_oldest_when_full(self):
+        with CapturedRecords() as records:
+            for i in range(5):
+                logger.info("record {}", i)
+        self.sink._worker = object()  # keep the worker from draining the queue while it fills up
+        for record in records:
+            self.sink.put(record)
+        assert (len(self.sink), self.sink.dropped) == (3, 2)
+        self.sink.flush()
+        messages = [frame["message"] for batch in self.batches for frame in batch]
+        assert messages == ["record 2", "record 3", "record 4"]
+
+    def test_failed_batches_counted(self):
+        def broken_upload(frames):
+            raise ConnectionError("logtail is down")
+
+        sink = BatchedLogSink(broken_upload, batch_size=2, flush_interval=60)
+        with CapturedRecords() as records:
+            logger.warning("can't ship this", details=object())
+        sink._worker = object()
+        sink.put(records[0])
+        sink.flush()
+        assert (sink.failed_batches, sink.shipped, len(sink)) == (1, 0, 0)
+
+    def test_as_loguru_sink(self):
+        handler_id = logger.add(self.sink, level="INFO")
+        try:
+            logger.info("shipped from a thread")
+        finally:
+            logger.remove(handler_id)
+        self.sink.stop()
+        assert self.batches[0][0]["message"] == "shipped from a thread"
+
+
+class TestDebugSampler:
+    def test_only_sampled_debug_records_dropped(self):
+        draws = iter([0.7, 0.2])
+        with CapturedRecords(filter=DebugSampler(0.5, rng=lambda: next(draws))) as records:
+            logger.bind(sampled=True).debug("dropped")
+            logger.bind(sampled=True).debug("kept")
+            logger.debug("never sampled")
+            logger.bind(sampled=True).info("not debug")
+        assert [record["message"] for record in records] == ["kept", "never sampled", "not debug"]
+
+
+class TestLazyMonitorLogging:
+    def test_fields_added_when_accepted(self, mock_response_empty):
+        monitor = PBMonitor("the bear", 2, 1)
+        with CapturedRecords(level="INFO") as records:
+            asyncio.run(monitor.look())
+        assert records[0]["message"] == "Monitor running: (S) / the bear s02e01"
+        assert (records[0]["extra"]["show_name"], records[0]["extra"]["uuid"]) == ("the bear", monitor.uuid)
+
+    def test_nothing_built_when_no_sink_accepts(self, monkeypatch, mock_response_empty):
+        built = []
+        monitor = PBMonitor("the bear", 2, 1)
+        monkeypatch.setattr(monitor, "to_dict", lambda: built.append("fields") or {})
+        monkeypatch.setattr(monitor, "__str__", lambda: built.append("message") or "")
+        logger.disable("torrent_manager")
+        try:
+            asyncio.run(monitor.look())
+        finally:
+            logger.enable("torrent_manager")
+        assert built == []
@@ -0,0 +1,89 @@
+import asyncio
+from httpx import AsyncClient
+from metrics import MetricsRegistry, MetricsServer, metrics
+from torrent_manager import PBSearcher
+
+
+class TestMetricsRegistry:
+    def setup_method(self, method):
+        self.registry = MetricsRegistry()
+
+    def test_counter_rendering(self):
+        counter = self.registry.counter("searches_total", "Searches", ("result",))
+        counter.inc(result="hit")
+        counter.inc(2, result="miss \"quoted\"")
+        assert self.registry.render() == ('# HELP searches_total Searches\n'
+                                          '# TYPE searches_total counter\n'
+                                          'searches_total{result="hit"} 1\n'
+                                          'searches_total{result="miss \\"quoted\\""} 2\n')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        assert self.registry.render().splitlines()[2:] == ['latency_seconds_bucket{le="0.1"} 2',
+                                                           'latency_seconds_bucket{le="1"} 3',
+                                                           'latency_seconds_bucket{le="+Inf"} 4',
+                                                           'latency_seconds_sum 3.65',
+                                                           'latency_seconds_count 4']
+
+    def test_histogram_timer(self):
+        histogram = self.registry.histogram("rpc_seconds", "Rpc latency", ("method",))
+        with histogram.time(method="torrent-get"):
+            pass
+        assert histogram.count(method="torrent-get") == 1
+        assert histogram.count(method="torrent-add") == 0
+
+    def test_counter_callback(self):
+        dropped = [0]
+        self.registry.counter_callback("log_records_dropped_total", "Dropped", lambda: dropped[0])
+        dropped[0] = 3
+        assert self.registry.render().splitlines()[2] == "log_records_dropped_total 3"
+
+    def test_metric_defined_twice_shared(self):
+        assert self.registry.counter("errors_total", "Errors") is self.registry.counter("errors_total", "Errors")
+
+    def test_readiness(self):
+        def broken_check():
+            raise RuntimeError("not started")
+        self.registry.add_readiness_check("polling", lambda: True)
+        self.registry.add_readiness_check("scheduler", broken_check)
+        assert self.registry.readiness() == {"polling": True, "scheduler": False}
+
+
+class TestMetricsServer:
+    def test_endpoints(self):
+        registry = MetricsRegistry()
+        registry.counter("up_total", "Up").inc()
+        ready = [False]
+        registry.add_readiness_check("scheduler", lambda: ready[0])
+
+        async def scrape():
+            server = MetricsServer(registry, port=0)
+            await server.start()
+            try:
+                async with AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                    responses = [await client.get("/metrics"), await client.get("/ready")]
+                    ready[0] = True
+                    return responses + [await client.get("/ready"), await client.get("/missing")]
+            finally:
+                await server.aclose()
+
+        metrics_response, not_ready, ready_response, missing = asyncio.run(scrape())
+        assert "up_total 1" in metrics_response.text
+        assert (not_ready.status_code, not_ready.text) == (503, "scheduler failing\n")
+        assert ready_response.status_code == 200
+        assert missing.status_code == 404
+
+
+class TestInstrumentation:
+    def test_search_metrics(self, mock_response):
+        cache_lookups = metrics.counter("search_cache_lookups_total", "")
+        latency = metrics.histogram("apibay_request_duration_seconds", "")
+        hits, misses, requests = cache_lookups.value(result="hit"), cache_lookups.value(result="miss"), \
+            latency.count(status=200)
+        asyncio.run(PBSearcher("akira").search_torrent())
+        asyncio.run(PBSearcher("akira").search_torrent())
+        assert cache_lookups.value(result="hit") - hits == 1
+        assert cache_lookups.value(result="miss") - misses == 1
+        assert latency.count(status=200) - requests == 1
@@ -0,0 +1,102 @@
+import json
+import os
+import pytest
+from torrent_manager import JsonMonitorStore, SqliteMonitorStore, create_monitor_store
+
+settings = [
+    {"owner_id": 1, "silent": True, "name": "akira", "monitor_type": "movie", "uuid": "a"},
+    {"owner_id": 2, "silent": True, "name": "chainsaw man", "monitor_type": "show",
+     "season": 2, "episode": 1, "size_limit": 3, "uuid": "b"},
+    {"owner_id": 1, "silent": False, "name": "perfect blue", "monitor_type": "movie", "uuid": "c"},
+]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    match request.param:
+        case "json":
+            store = JsonMonitorStore(str(tmp_path / "settings.json"))
+        case "sqlite":
+            store = SqliteMonitorStore(str(tmp_path / "monitors.db"))
+    store.load()
+    yield store
+    store.close()
+
+
+class TestMonitorStore:
+    def test_upsert_keeps_order(self, store):
+        store.upsert(settings)
+        assert [s["uuid"] for s in store.load()] == ["a", "b", "c"]
+
+    def test_upsert_updates_in_place(self, store):
+        store.upsert(settings)
+        store.upsert([settings[1] | {"episode": 2}])
+        loaded = store.load()
+        assert [s["uuid"] for s in loaded] == ["a", "b", "c"]
+        assert loaded[1]["episode"] == 2
+
+    def test_delete(self, store):
+        store.upsert(settings)
+        store.delete(["a", "missing"])
+        assert [s["uuid"] for s in store.load()] == ["b", "c"]
+
+
+class TestJsonMonitorStore:
+    def test_missing_uuids_assigned(self, tmp_path):
+        path = tmp_path / "settings.json"
+        path.write_text(json.dumps([{"owner_id": 1, "name": "akira", "monitor_type": "movie"}]))
+        store = JsonMonitorStore(str(path))
+        uuid = store.load()[0]["uuid"]
+        assert uuid
+        assert json.loads(path.read_text())[0]["uuid"] == uuid
+
+    def test_no_tmp_file_left(self, tmp_path):
+        store = JsonMonitorStore(str(tmp_path / "settings.json"))
+        store.load()
+        store.upsert(settings)
+        assert os.listdir(tmp_path) == ["settings.json"]
+
+
+class TestSqliteMonitorStore:
+    def test_wal_mode(self, tmp_path):
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"))
+        assert store._connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_load_by_owner_id(self, tmp_path):
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"))
+        store.upsert(settings)
+        assert [s["uuid"] for s in store.load_by_owner_id(1)] == ["a", "c"]
+
+    def test_json_import_runs_once(self, tmp_path):
+        json_path = tmp_path / "settings.json"
+        json_path.write_text(json.dumps(settings))
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"), json_import_path=str(json_path))
+        assert len(store) == 3
+        store.delete(["a"])
+        assert store.import_json(str(json_path)) == 0
+        assert len(store) == 2
+
+    def test_deleted_monitors_not_reimported(self, tmp_path):
+        json_path = tmp_path / "settings.json"
+        json_path.write_text(json.dumps(settings))
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"), json_import_path=str(json_path))
+        store.delete([setting["uuid"] for setting in settings])
+        store.close()
+        reopened = SqliteMonitorStore(str(tmp_path / "monitors.db"), json_import_path=str(json_path))
+        assert reopened.load() == []
+
+    def test_existing_database_not_imported_into(self, tmp_path):
+        json_path = tmp_path / "settings.json"
+        json_path.write_text(json.dumps(settings))
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"))
+        store.upsert(settings[:1])
+        assert store.import_json(str(json_path)) == 0
+        store.delete([settings[0]["uuid"]])
+        assert store.import_json(str(json_path)) == 0
+        assert len(store) == 0
+
+    def test_create_monitor_store(self, tmp_path):
+        assert isinstance(create_monitor_store("json", str(tmp_path / "s.json"), ""), JsonMonitorStore)
+        assert isinstance(create_monitor_store("sqlite", "", str(tmp_path / "m.db")), SqliteMonitorStore)
+        with pytest.raises(ValueError):
+            create_monitor_store("redis", "", "")
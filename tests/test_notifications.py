@@ -0,0 +1,104 @@
+import asyncio
+from telegram.error import Forbidden, NetworkError, RetryAfter
+from tg_bot import NotificationDispatcher
+
+
+class TestNotificationDispatcher:
+    def setup_method(self, method):
+        self.now = 0.
+        self.sent = []
+        self.errors = {}
+        self.dispatcher = NotificationDispatcher(self.send, global_rate=32, chat_rate=1, digest_delay=3,
+                                                 max_attempts=3, retry_delay=2, clock=lambda: self.now,
+                                                 sleep=self.sleep)
+
+    async def sleep(self, seconds):
+        # time only moves when the dispatcher waits, so every send lands at an exact moment
+        self.now += seconds
+        await asyncio.sleep(0)
+
+    async def send(self, chat_id, text):
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append((self.now, chat_id, text))
+
+    async def drain(self):
+        while self.dispatcher.pending:
+            await asyncio.sleep(0)
+
+    def run(self, *notifications):
+        async def notify_and_drain():
+            for chat_id, text in notifications:
+                self.dispatcher.notify(chat_id, text)
+            await self.drain()
+        asyncio.run(notify_and_drain())
+
+    def test_coalesces_texts_per_chat(self):
+        self.run((1, "Found Severance S02E01"), (2, "Found Akira"), (1, "Found Severance S02E02"))
+        assert self.sent == [(3, 1, "2 updates:\n• Found Severance S02E01\n• Found Severance S02E02"),
+                             (3, 2, "Found Akira")]
+
+    def test_chat_rate_limit(self):
+        self.dispatcher.digest_delay = 0
+
+        async def scenario():
+            self.dispatcher.notify(1, "first")
+            await self.drain()
+            self.dispatcher.notify(1, "second")
+            self.dispatcher.notify(2, "other chat")
+            await self.drain()
+        asyncio.run(scenario())
+        assert self.sent == [(0, 1, "first"), (0, 2, "other chat"), (1, 1, "second")]
+
+    def test_global_rate_limit(self):
+        self.dispatcher.digest_delay = 0
+        self.run(*[(chat_id, "Found Akira") for chat_id in range(40)])
+        sent_at = [at for at, _, _ in self.sent]
+        # 32 go out right away, the other 8 are spread over the next quarter of a second
+        assert len(sent_at) == 40
+        assert sent_at.count(0) == 32
+        assert max(sent_at) == 0.25
+
+    def test_retry_after(self):
+        self.errors[1] = [RetryAfter(30)]
+        self.run((1, "Found Akira"))
+        assert self.sent == [(33, 1, "Found Akira")]
+
+    def test_blocked_chat_dropped(self):
+        self.errors[1] = [Forbidden("bot was blocked by the user")]
+        self.run((1, "Found Akira"), (2, "Found Dune"))
+        assert self.sent == [(3, 2, "Found Dune")]
+
+    def test_gives_up_after_max_attempts(self):
+        self.errors[1] = [NetworkError("connection reset")] * 3
+        self.run((1, "Found Akira"))
+        assert self.sent == []
+        # backoff of 2s, then 4s before the last attempt
+        assert self.now == 9
+
+    def test_digest_fits_one_message(self):
+        texts = [str(i) * 1000 for i in range(10)]
+        digest, taken = NotificationDispatcher.build_digest(texts)
+        assert taken == 4
+        assert len(digest) <= 4096
+        assert digest.startswith("4 updates:\n• 000")
+
+    def test_notify_doesnt_wait_for_sending(self):
+        async def notify():
+            self.dispatcher.notify(1, "Found Akira")
+            self.dispatcher.notify(1, "Found Dune")
+            return list(self.sent)
+        assert asyncio.run(notify()) == []
+
+    def test_close_flushes_pending(self):
+        self.errors[2] = [NetworkError("connection reset")]
+
+        async def notify_and_close():
+            self.dispatcher.notify(1, "Found Akira")
+            self.dispatcher.notify(1, "Found Dune")
+            self.dispatcher.notify(2, "Found Heat")
+            await self.dispatcher.aclose()
+        asyncio.run(notify_and_close())
+        assert self.sent == [(0, 1, "2 updates:\n• Found Akira\n• Found Dune")]
+        assert self.dispatcher.pending == {}
+        assert self.dispatcher._task.cancelled()
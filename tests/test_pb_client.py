@@ -1,4 +1,7 @@
-from torrent_manager import PBSearcher, PBMonitor
+import asyncio
+import pytest
+from httpx import MockTransport, Response, ConnectError
+from torrent_manager import PBSearcher, PBMonitor, PooledHttpClient, SearchUnavailableError
 
 
 class TestPBSearcher:
@@ -6,32 +9,117 @@ class TestPBSearcher:
         self.searcher = PBSearcher("akira")
 
     def test_search_torrent_sorting(self, mock_response):
-        results = self.searcher.search_torrent()
+        results = asyncio.run(self.searcher.search_torrent())
         torrent_names = [result.name for result in results]
         assert torrent_names == ["Torrent 3", "Torrent 1", "Torrent 2"]
 
+    def test_search_torrent_limit(self, mock_response):
+        results = asyncio.run(self.searcher.search_torrent(limit=2))
+        assert [result.name for result in results] == ["Torrent 3", "Torrent 1"]
+
+    def test_search_torrent_limit_with_filter(self, mock_response):
+        results = asyncio.run(self.searcher.search_torrent(limit=1, where=lambda x: x.size_gb < 1))
+        assert [result.name for result in results] == ["Torrent 1"]
+
+    def test_search_torrent_cached_rows_served_with_any_limit(self, mock_response):
+        assert len(asyncio.run(self.searcher.search_torrent(limit=1))) == 1
+        assert len(asyncio.run(self.searcher.search_torrent())) == 3
+        assert mock_response.calls == 1
+
     def test_search_torrent_no_results(self, mock_response_empty):
-        results = self.searcher.search_torrent("non existing")
+        results = asyncio.run(self.searcher.search_torrent("non existing"))
         assert results == []
 
     def test_search_torrent_http_error_handling(self, mock_response_404):
-        assert self.searcher.search_torrent("its not working") == []
+        assert asyncio.run(self.searcher.search_torrent("its not working")) == []
 
     def test_search_torrent_http_timeout(self, mock_timeout):
-        results = self.searcher.search_torrent()
-        assert results == []
+        with pytest.raises(SearchUnavailableError):
+            asyncio.run(self.searcher.search_torrent())
+        assert mock_timeout.calls == 3
 
     def test_look(self, mock_response):
-        results = self.searcher.look()
+        results = asyncio.run(self.searcher.look())
         assert results
 
     def test_look_no_results(self, mock_response_empty):
-        results = self.searcher.look()
+        results = asyncio.run(self.searcher.look())
         assert results is None
 
     def test_look_http_timeout(self, mock_timeout):
-        results = self.searcher.look()
-        assert results is None
+        with pytest.raises(SearchUnavailableError):
+            asyncio.run(self.searcher.look())
+
+    def test_injected_http_client(self, mock_response):
+        injected_client = PooledHttpClient(transport=MockTransport(lambda request: Response(404)))
+        searcher = PBSearcher("akira", http_client=injected_client)
+        assert asyncio.run(searcher.search_torrent()) == []
+        assert injected_client.stats.requests == 1
+        assert mock_response.calls == 0
+
+    def test_shared_http_client_stats(self, mock_response):
+        async def search_twice():
+            await self.searcher.search_torrent()
+            await PBSearcher("perfect blue").search_torrent()
+            await PBSearcher.http_client.aclose()
+        asyncio.run(search_twice())
+        assert PBSearcher.http_client.stats.requests == 2
+        assert mock_response.calls == 2
+
+    def test_concurrent_identical_searches_coalesced(self, mock_response):
+        async def search_concurrently():
+            return await asyncio.gather(self.searcher.search_torrent(), PBSearcher("AKIRA ").search_torrent(),
+                                        PBSearcher("perfect blue").search_torrent())
+        akira_results, akira_results_upper, other_results = asyncio.run(search_concurrently())
+        assert mock_response.calls == 2
+        assert mock_response.queries == ["akira", "perfect blue"]
+        assert akira_results == akira_results_upper
+        assert akira_results is not akira_results_upper
+
+    def test_sequential_searches_cached(self, mock_response, fresh_search_cache):
+        first_results = asyncio.run(self.searcher.search_torrent())
+        second_results = asyncio.run(PBSearcher().search_torrent("Akira"))
+        assert mock_response.calls == 1
+        assert first_results == second_results
+        assert fresh_search_cache.stats.hits == 1
+
+    def test_search_bypass_cache(self, mock_response):
+        asyncio.run(self.searcher.search_torrent())
+        asyncio.run(self.searcher.search_torrent(bypass_cache=True))
+        assert mock_response.calls == 2
+
+    def test_empty_results_cached(self, mock_response_empty, fresh_search_cache):
+        asyncio.run(self.searcher.search_torrent())
+        assert asyncio.run(self.searcher.search_torrent()) == []
+        assert mock_response_empty.calls == 1
+
+    def test_errors_not_cached(self, mock_response_404, fresh_search_cache):
+        asyncio.run(self.searcher.search_torrent())
+        asyncio.run(self.searcher.search_torrent())
+        assert mock_response_404.calls == 2
+        assert len(fresh_search_cache) == 0
+
+    def test_transient_errors_retried(self, monkeypatch):
+        responses = iter([Response(503), Response(429, headers={"Retry-After": "0"}), Response(200, json=[])])
+        monkeypatch.setattr(PBSearcher, "http_client",
+                            PooledHttpClient(transport=MockTransport(lambda request: next(responses))))
+        assert asyncio.run(self.searcher.search_torrent()) == []
+
+    def test_circuit_opens_after_repeated_failures(self, fast_resilience_policies, monkeypatch):
+        calls = []
+
+        def refuse(request):
+            calls.append(request)
+            raise ConnectError("connection refused", request=request)
+        monkeypatch.setattr(PBSearcher, "http_client", PooledHttpClient(transport=MockTransport(refuse)))
+        for query in map(str, range(fast_resilience_policies.failure_threshold)):
+            with pytest.raises(SearchUnavailableError):
+                asyncio.run(self.searcher.search_torrent(query))
+        assert fast_resilience_policies.is_open
+        with pytest.raises(SearchUnavailableError) as e:
+            asyncio.run(self.searcher.search_torrent("short-circuited"))
+        assert e.value.retry_after > 0
+        assert len(calls) == fast_resilience_policies.failure_threshold * 3
 
 
 class TestPBMonitor:
@@ -41,43 +129,73 @@ class TestPBMonitor:
 
     def test_look(self, mock_response):
         assert self.monitor.episode_number == 1
-        self.monitor.look()
+        asyncio.run(self.monitor.look())
         assert self.monitor.episode_number == 2
 
     def test_look_max_seeders(self, mock_response):
-        result = self.monitor.look()
+        result = asyncio.run(self.monitor.look())
         assert result.name == "Torrent 3"
 
     def test_look_no_episodes(self, mock_response_empty):
         assert self.monitor.episode_number == 1
-        result = self.monitor.look()
+        result = asyncio.run(self.monitor.look())
         assert result is None
         assert self.monitor.episode_number == 1
 
     def test_look_max_seeders_with_size_limit(self, mock_response):
         self.monitor.size_limit_gb = 1
-        result = self.monitor.look()
+        result = asyncio.run(self.monitor.look())
         assert result.name == "Torrent 1"
 
     def test_look_max_seeders_with_small_size_limit(self, mock_response):
         assert self.monitor.episode_number == 1
         self.monitor.size_limit_gb = 0.5
-        result = self.monitor.look()
+        result = asyncio.run(self.monitor.look())
         assert result is None
         assert self.monitor.episode_number == 1
 
     def test_look_http_error(self, mock_response_404):
-        self.monitor.look()
+        asyncio.run(self.monitor.look())
         assert self.monitor.episode_number == 1
 
     def test_look_timeout(self, mock_timeout):
-        self.monitor.look()
+        with pytest.raises(SearchUnavailableError):
+            asyncio.run(self.monitor.look())
         assert self.monitor.episode_number == 1
 
     def test_look_zero_episode(self, mock_response):
         self.monitor.episode_number = 0
         self.monitor.season_number = 0
-        self.monitor.look()
+        asyncio.run(self.monitor.look())
         assert mock_response.queries[0] == "attack on titan s00e00"
-        self.monitor.look()
+        asyncio.run(self.monitor.look())
         assert mock_response.queries[1] == "attack on titan s00e01"
+
+    def test_look_coalesced_with_own_filters(self, mock_response):
+        small_episode_monitor = PBMonitor("attack on titan", episode_number=1, season_number=1, size_limit_gb=1)
+
+        async def look_concurrently():
+            return await asyncio.gather(self.monitor.look(), small_episode_monitor.look())
+        result, small_episode_result = asyncio.run(look_concurrently())
+        assert mock_response.calls == 1
+        assert result.name == "Torrent 3"
+        assert small_episode_result.name == "Torrent 1"
+
+    def test_look_season(self, mock_response_season):
+        self.monitor.show_name = "the last of us"
+        self.monitor.episode_number = 11
+        results = asyncio.run(self.monitor.look_season())
+        torrent_names = [result.name for result in results]
+        assert torrent_names == ["The Last of Us S01E11 720p WEB x264", "The.Last.of.Us.S01E12.1080p.WEB"]
+        assert mock_response_season.queries == ["the last of us s01"]
+        assert self.monitor.episode_number == 13
+
+    def test_look_season_only_vips(self, mock_response_season):
+        monitor = PBMonitor("the last of us", season_number=1, episode_number=11, only_vips=True)
+        results = asyncio.run(monitor.look_season())
+        assert results[0].name == "The Last of Us S01E11 1080p WEB x265"
+
+    def test_look_season_nothing_new(self, mock_response_season):
+        self.monitor.episode_number = 15
+        assert asyncio.run(self.monitor.look_season()) == []
+        assert self.monitor.episode_number == 15
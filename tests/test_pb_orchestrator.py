@@ -1,7 +1,9 @@
+import asyncio
 import pytest
 import os
 import json
-from torrent_manager import MonitorOrchestrator, MonitorSetting, PBSearcher, PBMonitor, JobResult
+from torrent_manager import MonitorOrchestrator, MonitorSetting, PBSearcher, PBMonitor, JobResult, TorrentDetails, \
+    SqliteMonitorStore
 
 jobs = [
     {
@@ -43,7 +45,7 @@ def read_settings_file() -> dict:
 class TestMonitorOrchestrator:
     def setup_method(self, method):
         self.orchestrator = MonitorOrchestrator("settings.json")
-        [self.orchestrator.add_monitor_job_from_dict(job, False) for job in jobs]
+        [asyncio.run(self.orchestrator.add_monitor_job_from_dict(job, False)) for job in jobs]
         self.owner_id = 1111111
         self.loaded_monitors = self.orchestrator.get_user_monitors(self.owner_id)
 
@@ -57,19 +59,19 @@ class TestMonitorOrchestrator:
 
     def test_job_from_dict_invalid_monitor_type(self):
         with pytest.raises(ValueError):
-            self.orchestrator.add_monitor_job_from_dict({
+            asyncio.run(self.orchestrator.add_monitor_job_from_dict({
                 "monitor_type": "invalid_monitor_type"
-            })
+            }))
 
     def test_search_results(self, mock_response):
-        jobs_results = self.orchestrator.run_search_job_iteration(owner_id=self.owner_id)
+        jobs_results = asyncio.run(self.orchestrator.run_search_job_iteration(owner_id=self.owner_id))
         jobs_results_list = list(jobs_results)
         torrent_names = [job.result.name for job in jobs_results_list]
         assert torrent_names == ["Torrent 3", "Torrent 1", "Torrent 3"]
         assert len(jobs_results_list) == 3
 
     def test_run_search_jobs(self, mock_response_iteration):
-        jobs_results = self.orchestrator.run_search_jobs(owner_id=self.owner_id)
+        jobs_results = asyncio.run(self.orchestrator.run_search_jobs(owner_id=self.owner_id))
         jobs_results_list = list(jobs_results)
 
         assert len(jobs_results_list) == 5
@@ -82,14 +84,14 @@ class TestMonitorOrchestrator:
         assert len(self.loaded_monitors) == 3
         assert self.loaded_monitors[0].searcher.episode_number == 10
 
-        jobs_results = self.orchestrator.run_search_job_iteration(owner_id=self.owner_id)
+        jobs_results = asyncio.run(self.orchestrator.run_search_job_iteration(owner_id=self.owner_id))
         jobs_results_list = list(jobs_results)
         assert len(jobs_results_list) == 0
         assert len(self.loaded_monitors) == 3  # without search results JobSetting didn't change
         assert self.loaded_monitors[0].searcher.episode_number == 10
 
     def test_search_results_error(self, mock_response_404):
-        jobs_results = self.orchestrator.run_search_job_iteration(owner_id=self.owner_id)
+        jobs_results = asyncio.run(self.orchestrator.run_search_job_iteration(owner_id=self.owner_id))
         jobs_results_list = list(jobs_results)
         assert len(jobs_results_list) == 0
 
@@ -97,7 +99,7 @@ class TestMonitorOrchestrator:
         assert len(self.loaded_monitors) == 3
         assert self.loaded_monitors[0].searcher.episode_number == 10
 
-        self.orchestrator.run_search_job_iteration(owner_id=self.owner_id)
+        asyncio.run(self.orchestrator.run_search_job_iteration(owner_id=self.owner_id))
         self.loaded_monitors = self.orchestrator.get_user_monitors(self.owner_id)
         assert len(self.loaded_monitors) == 2
         assert self.loaded_monitors[0].searcher.episode_number == 11
@@ -107,13 +109,14 @@ class TestMonitorOrchestrator:
         assert len(saved_settings) == 3
         assert saved_settings[0]["episode"] == 10
 
-        self.orchestrator.run_search_job_iteration(owner_id=self.owner_id)
+        asyncio.run(self.orchestrator.run_search_job_iteration(owner_id=self.owner_id))
         saved_settings = read_settings_file()
         assert len(saved_settings) == 2
         assert saved_settings[0]["episode"] == 11
 
     def test_add_job(self):
-        result = self.orchestrator.add_monitor_job(MonitorSetting(self.owner_id, PBSearcher("New Job")), False)
+        setting = MonitorSetting(self.owner_id, PBSearcher("New Job"))
+        result = asyncio.run(self.orchestrator.add_monitor_job(setting, False))
         assert len(result) == 0
 
         monitor_list = self.orchestrator.get_user_monitors(self.owner_id)
@@ -123,22 +126,152 @@ class TestMonitorOrchestrator:
         assert saved_settings[-1]["name"] == "New Job"
 
     def test_add_job_autostart(self, mock_response):
-        result = self.orchestrator.add_monitor_job(MonitorSetting(self.owner_id, PBSearcher("New Job")), True)
+        setting = MonitorSetting(self.owner_id, PBSearcher("New Job"))
+        result = asyncio.run(self.orchestrator.add_monitor_job(setting, True))
         assert isinstance(result, list)
         assert len(result) == 1
         assert isinstance(result[0], JobResult)
         assert mock_response.calls == 1
 
     def test_add_job_autostart_multiple_results(self, mock_response_iteration):
-        result = self.orchestrator.add_monitor_job(MonitorSetting(self.owner_id, PBMonitor("New Job", 1, 1)), True)
+        setting = MonitorSetting(self.owner_id, PBMonitor("New Job", 1, 1))
+        result = asyncio.run(self.orchestrator.add_monitor_job(setting, True))
         assert isinstance(result, list)
         assert len(result) == 5
         assert isinstance(result[0], JobResult)
         assert mock_response_iteration.calls == 6  # check that only this job was using search
 
     def test_remove_job(self):
-        self.orchestrator.delete_monitor_job(self.loaded_monitors[1])
+        asyncio.run(self.orchestrator.delete_monitor_job(self.loaded_monitors[1]))
         self.loaded_monitors = self.orchestrator.get_user_monitors(self.owner_id)
         assert len(self.loaded_monitors) == 2
         saved_settings = read_settings_file()
         assert len(saved_settings) == 2
+
+    def test_run_search_jobs_season_batch(self, mock_response_season):
+        self.orchestrator.season_batch = True
+        jobs_results = asyncio.run(self.orchestrator.run_search_jobs([self.loaded_monitors[0]]))
+        assert [job.result.name for job in jobs_results] == ["Torrent 3", "The Last of Us S01E11 720p WEB x264",
+                                                             "The.Last.of.Us.S01E12.1080p.WEB"]
+        assert mock_response_season.queries == ["the last of us s01e10", "the last of us s01"]
+        assert read_settings_file()[0]["episode"] == 13
+
+    def test_get_monitor_by_uuid(self):
+        monitor = self.orchestrator.get_monitor_by_uuid("8C7C1197-1EB3-451F-B4F5-CC906560387E")
+        assert monitor.searcher.show_name == "chainsaw man"
+        assert self.orchestrator.get_monitor_by_uuid("missing") is None
+
+    def test_get_user_monitors_by_str_id(self):
+        assert len(self.orchestrator.get_user_monitors(str(self.owner_id))) == 3
+        assert self.orchestrator.get_user_monitors(42) == []
+
+    def test_jobs_not_reloaded_without_changes(self, monkeypatch):
+        def fail_load():
+            raise AssertionError("store shouldn't be read")
+        monkeypatch.setattr(self.orchestrator._store, "load", fail_load)
+        assert len(list(self.orchestrator.get_jobs_by_owner_id(self.owner_id))) == 3
+
+    def test_jobs_reloaded_after_external_change(self):
+        saved_settings = read_settings_file()
+        saved_settings[0]["episode"] = 20
+        del saved_settings[2]
+        with open("settings.json", "w") as file:
+            json.dump(saved_settings, file, indent=4)
+        unchanged_monitor = self.loaded_monitors[1]
+        jobs = list(self.orchestrator.get_jobs_by_owner_id(self.owner_id))
+        assert len(jobs) == 2
+        assert jobs[0].searcher.episode_number == 20
+        assert jobs[1] is unchanged_monitor
+
+
+class TestSqliteBackedOrchestrator:
+    def test_iteration_persists_changes(self, mock_response, tmp_path):
+        store = SqliteMonitorStore(str(tmp_path / "monitors.db"))
+        orchestrator = MonitorOrchestrator(store=store)
+        [asyncio.run(orchestrator.add_monitor_job_from_dict(job, False)) for job in jobs]
+        asyncio.run(orchestrator.run_search_job_iteration(owner_id=1111111))
+        saved_settings = store.load()
+        assert [s["name"] for s in saved_settings] == ["the last of us", "chainsaw man"]
+        assert saved_settings[0]["episode"] == 11
+        assert len(MonitorOrchestrator(store=store).get_user_monitors(1111111)) == 2
+
+
+class SlowSearcher(PBSearcher):
+    def __init__(self, default_query: str, delay: float, concurrency_tracker: list | None = None):
+        super().__init__(default_query)
+        self.delay = delay
+        self.concurrency_tracker = concurrency_tracker if concurrency_tracker is not None else [0, 0]
+
+    async def look(self):
+        self.concurrency_tracker[0] += 1
+        self.concurrency_tracker[1] = max(self.concurrency_tracker)
+        await asyncio.sleep(self.delay)
+        self.concurrency_tracker[0] -= 1
+        return TorrentDetails(self.default_query, "", 1, 1, "vip", "")
+
+
+class TestConcurrentIteration:
+    def setup_method(self, method):
+        self.orchestrator = MonitorOrchestrator("settings.json", concurrency=2, job_timeout=0.5,
+                                                iteration_deadline=1)
+
+    def teardown_method(self, method):
+        os.remove("settings.json")
+
+    def test_results_in_stable_order(self):
+        jobs = [MonitorSetting(1, SlowSearcher(str(i), delay)) for i, delay in enumerate((0.05, 0.01, 0.03))]
+        results = asyncio.run(self.orchestrator._run_jobs_concurrently(jobs))
+        assert [result.name for result in results] == ["0", "1", "2"]
+
+    def test_bounded_concurrency(self):
+        tracker = [0, 0]
+        jobs = [MonitorSetting(1, SlowSearcher(str(i), 0.01, tracker)) for i in range(6)]
+        results = asyncio.run(self.orchestrator._run_jobs_concurrently(jobs))
+        assert all(results)
+        assert tracker[1] == 2
+
+    def test_job_timeout(self):
+        jobs = [MonitorSetting(1, SlowSearcher("slow", 2)), MonitorSetting(1, SlowSearcher("fast", 0))]
+        results = asyncio.run(self.orchestrator._run_jobs_concurrently(jobs))
+        assert isinstance(results[0], asyncio.TimeoutError)
+        assert results[1].name == "fast"
+
+    def test_iteration_deadline_partial_results(self):
+        self.orchestrator.job_timeout = 5
+        jobs = [MonitorSetting(1, SlowSearcher("fast", 0)), MonitorSetting(1, SlowSearcher("slow", 3))]
+        results = asyncio.run(self.orchestrator._run_jobs_concurrently(jobs))
+        assert results[0].name == "fast"
+        assert isinstance(results[1], asyncio.TimeoutError)
+
+    @pytest.mark.parametrize("job_timeout, iteration_deadline", [(0.2, 1), (5, 0.2)])
+    def test_timed_out_monitors_postponed(self, job_timeout, iteration_deadline):
+        # a monitor stopped by its own timeout or cancelled at the iteration deadline wasn't checked
+        self.orchestrator.clock = lambda: 1000
+        self.orchestrator.job_timeout, self.orchestrator.iteration_deadline = job_timeout, iteration_deadline
+        slow = MonitorSetting(1, SlowSearcher("slow", 2), last_checked=10, misses=2)
+        fast = MonitorSetting(1, SlowSearcher("fast", 0), last_checked=10)
+        for job in (slow, fast):
+            self.orchestrator._index_setting(job)
+        results = asyncio.run(self.orchestrator.run_search_jobs([slow, fast]))
+        assert [result.result.name for result in results] == ["fast"]
+        assert (slow.last_checked, slow.misses) == (10, 2)
+        assert fast.last_checked == 1000
+
+
+class TestSearchUnavailable:
+    def setup_method(self, method):
+        self.orchestrator = MonitorOrchestrator("settings.json", clock=lambda: 1000)
+        asyncio.run(self.orchestrator.add_monitor_job_from_dict(jobs[0], False))
+        self.monitor = self.orchestrator.get_user_monitors(1111111)[0]
+
+    def teardown_method(self, method):
+        os.remove("settings.json")
+
+    def test_monitors_postponed_while_circuit_open(self, mock_timeout, fast_resilience_policies):
+        fast_resilience_policies.failure_threshold = 1
+        assert asyncio.run(self.orchestrator.run_search_jobs(owner_id=1111111)) == []
+        assert asyncio.run(self.orchestrator.run_search_jobs(owner_id=1111111)) == []
+        assert mock_timeout.calls == 3  # second run short-circuited
+        assert (self.monitor.last_checked, self.monitor.misses) == (0, 0)
+        assert read_settings_file()[0]["last_checked"] == 0
+        assert self.orchestrator.search_retry_after() > 0
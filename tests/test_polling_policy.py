@@ -0,0 +1,95 @@
+import asyncio
+import os
+from torrent_manager import PollingPolicy, MonitorOrchestrator, MonitorSetting, PBMonitor, PBSearcher
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+def simulate_checks(orchestrator: MonitorOrchestrator, setting: MonitorSetting, released_count, duration: float) \
+        -> tuple[int, list[float]]:
+    """Drives a monitor through `duration` seconds, returns the number of checks and the pickup delays"""
+    checks, found_count, previous_check, pickup_delays = 0, 0, 0, []
+    now = 0.
+    while now < duration:
+        setting.last_checked = now
+        checks += 1
+        released, released_at = released_count(now)
+        orchestrator._record_check(setting, released > found_count, previous_check)
+        if released > found_count:
+            pickup_delays.append(now - released_at)
+            found_count = released
+        previous_check = now
+        now += orchestrator.next_check_interval(setting)
+    return checks, pickup_delays
+
+
+class TestPollingPolicy:
+    policy = PollingPolicy(base_interval=8 * HOUR, min_interval=HOUR, max_interval=WEEK)
+
+    def test_backoff_on_misses(self):
+        assert [self.policy.next_interval(0, misses) / HOUR for misses in range(7)] == [8, 16, 32, 64, 128, 168, 168]
+
+    def test_base_pace_until_cadence_known(self):
+        assert self.policy.next_interval(10 * DAY, misses=5, last_release=DAY) == 8 * HOUR
+
+    def test_waits_for_expected_release(self):
+        assert self.policy.next_interval(DAY, 0, last_release=DAY, cadence=WEEK) == WEEK
+        assert self.policy.next_interval(7 * DAY, 3, last_release=DAY, cadence=WEEK) == DAY
+
+    def test_tight_polling_when_overdue(self):
+        assert self.policy.next_interval(8 * DAY, 1, last_release=DAY, cadence=WEEK) == HOUR
+        assert self.policy.next_interval(8 * DAY + 4 * HOUR, 2, last_release=DAY, cadence=WEEK) == 2 * HOUR
+        assert self.policy.next_interval(10 * DAY, 5, last_release=DAY, cadence=WEEK) == 8 * HOUR
+        assert self.policy.next_interval(40 * DAY, 9, last_release=DAY, cadence=WEEK) == WEEK
+
+    def test_cadence_smoothing(self):
+        assert self.policy.next_cadence(0, WEEK) == WEEK
+        assert self.policy.next_cadence(WEEK, 9 * DAY) == 8 * DAY
+        assert self.policy.next_cadence(WEEK, HOUR / 2) == WEEK
+
+
+class TestAdaptiveIntervals:
+    def setup_method(self, method):
+        self.orchestrator = MonitorOrchestrator("settings.json", polling_policy=PollingPolicy())
+
+    def teardown_method(self, method):
+        os.remove("settings.json")
+
+    def test_dormant_movie_traffic(self):
+        checks, _ = simulate_checks(self.orchestrator, MonitorSetting(1, PBSearcher("dormant")),
+                                    lambda now: (0, 0), 12 * WEEK)
+        fixed_interval_checks = 12 * WEEK / (8 * HOUR)
+        assert checks * 10 <= fixed_interval_checks
+
+    def test_weekly_show_picked_up_quickly(self):
+        first_release = 3 * DAY + 5 * HOUR
+
+        def released_count(now):
+            if now < first_release:
+                return 0, 0
+            released = int((now - first_release) // WEEK) + 1
+            return released, first_release + (released - 1) * WEEK
+
+        checks, pickup_delays = simulate_checks(self.orchestrator, MonitorSetting(1, PBMonitor("weekly", 1, 1)),
+                                                released_count, 10 * WEEK)
+        assert len(pickup_delays) == 10
+        assert max(pickup_delays[1:]) <= 8 * HOUR
+        assert checks * 2 <= 10 * WEEK / (8 * HOUR)
+
+    def test_history_recorded_once_per_run(self, mock_response_iteration):
+        setting = MonitorSetting(1, PBMonitor("the last of us", 1, 10), last_checked=HOUR)
+        self.orchestrator.clock = lambda: 2 * HOUR
+        asyncio.run(self.orchestrator.add_monitor_job(setting, True))
+        assert setting.misses == 0
+        assert setting.last_release == 1.5 * HOUR
+        saved_setting = self.orchestrator._store.load()[0]
+        assert (saved_setting["misses"], saved_setting["last_release"]) == (0, 1.5 * HOUR)
+
+    def test_miss_recorded(self, mock_response_empty):
+        setting = MonitorSetting(1, PBSearcher("the matrix"))
+        asyncio.run(self.orchestrator.add_monitor_job(setting, True))
+        asyncio.run(self.orchestrator.run_search_jobs([setting]))
+        assert setting.misses == 2
+        assert self.orchestrator.next_check_interval(setting) == 4 * 8 * HOUR
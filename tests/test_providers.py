@@ -0,0 +1,148 @@
+import asyncio
+import pytest
+from httpx import MockTransport, Response
+from torrent_manager import PBSearcher, PBMonitor, PooledHttpClient, SearchProvider, ProviderFanOut, \
+    ApibayProvider, SearchCache, SearchUnavailableError, CircuitBreaker, RetryPolicy
+
+
+def row(name: str, seeds: int, info_hash: str) -> dict:
+    return {"id": "1", "name": name, "size": "1", "seeders": str(seeds), "status": "vip", "info_hash": info_hash}
+
+
+class StubProvider(SearchProvider):
+    def __init__(self, name: str, rows: list[dict] | None = None, delay: float = 0,
+                 error: Exception | None = None) -> None:
+        self.name = name
+        self.rows = rows
+        self.delay = delay
+        self.error = error
+        self.queries = []
+
+    async def search(self, query, http_client):
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.rows
+
+
+class TestProviderFanOut:
+    def search(self, *providers, deadline=1):
+        return asyncio.run(ProviderFanOut(list(providers), deadline=deadline).search("akira", PBSearcher.http_client))
+
+    def test_merges_by_info_hash_keeping_best_seeds(self):
+        first = StubProvider("first", [row("Akira 1080p", 10, "aa"), row("Akira 720p", 5, "bb")])
+        second = StubProvider("second", [row("Akira.1080p", 30, "AA"), row("Akira 4k", 1, "cc")])
+        fan_out = self.search(first, second)
+        assert sorted((row["name"], row["seeders"]) for row in fan_out.rows) == \
+            [("Akira 4k", "1"), ("Akira 720p", "5"), ("Akira.1080p", "30")]
+        assert fan_out.failed == []
+        assert first.queries == second.queries == ["akira"]
+
+    def test_slow_provider_misses_deadline(self):
+        fast = StubProvider("fast", [row("Akira", 10, "aa")])
+        slow = StubProvider("slow", [row("Akira", 99, "aa")], delay=10)
+        fan_out = self.search(fast, slow, deadline=0.05)
+        assert fan_out.rows == [row("Akira", 10, "aa")]
+        assert fan_out.failed == ["slow"]
+
+    def test_failing_provider_skipped(self):
+        fan_out = self.search(StubProvider("broken", error=ValueError("not json")),
+                              StubProvider("error", rows=None), StubProvider("ok", [row("Akira", 1, "aa")]))
+        assert [row["name"] for row in fan_out.rows] == ["Akira"]
+        assert sorted(fan_out.failed) == ["broken", "error"]
+
+    def test_unavailable_when_nobody_answers(self):
+        with pytest.raises(SearchUnavailableError) as e:
+            self.search(StubProvider("down", error=SearchUnavailableError("down", retry_after=30)),
+                        StubProvider("flaky", error=SearchUnavailableError("flaky", retry_after=5)),
+                        StubProvider("slow", delay=10), deadline=0.05)
+        assert e.value.retry_after == 5
+
+    def test_only_error_answers(self):
+        assert self.search(StubProvider("error", rows=None)).rows is None
+
+
+class TestSearchThroughProviders:
+    @pytest.fixture(autouse=True)
+    def stub_providers(self, monkeypatch):
+        self.fast = StubProvider("fast", [row("Akira 720p", 5, "bb"), row("Akira 1080p", 10, "aa")])
+        self.slow = StubProvider("slow", [row("Akira 1080p", 50, "aa")], delay=10)
+        monkeypatch.setattr(PBSearcher, "search_providers", ProviderFanOut([self.fast, self.slow], deadline=0.05))
+        self.now = 0.
+        self.search_cache = SearchCache(ttl=600, empty_ttl=60, clock=lambda: self.now)
+        monkeypatch.setattr(PBSearcher, "search_cache", self.search_cache)
+
+    def test_search_returns_what_arrived_in_time(self):
+        results = asyncio.run(PBSearcher("akira").search_torrent(limit=1))
+        assert [(result.name, result.seeds) for result in results] == [("Akira 1080p", 10)]
+        # kept only as long as an empty answer, the slow provider may have more next time
+        self.now = 61
+        assert self.search_cache.get("akira") is None
+
+    def test_only_selected_rows_parsed(self, monkeypatch):
+        self.slow.delay = 0
+        parsed = []
+        row_to_details = PBSearcher._row_to_details
+
+        def counting_row_to_details(searcher, search_row):
+            parsed.append(search_row["name"])
+            return row_to_details(searcher, search_row)
+        monkeypatch.setattr(PBSearcher, "_row_to_details", counting_row_to_details)
+        asyncio.run(PBSearcher("akira").search_torrent(limit=1))
+        assert parsed == ["Akira 1080p"]
+        # the cache keeps the raw rows, a later selection parses only what it picks
+        assert sorted(self.search_cache.get("akira"), key=lambda cached: cached["name"]) == \
+            [row("Akira 1080p", 50, "aa"), row("Akira 720p", 5, "bb")]
+
+    def test_complete_answer_cached_for_full_ttl(self):
+        self.slow.delay = 0
+        results = asyncio.run(PBSearcher("akira").search_torrent())
+        assert [(result.name, result.seeds) for result in results] == [("Akira 1080p", 50), ("Akira 720p", 5)]
+        self.now = 61
+        assert self.search_cache.get("akira") is not None
+
+    def test_monitor_looks_through_providers(self):
+        self.fast.rows = [row("Akira S01E01", 5, "aa")]
+        result = asyncio.run(PBMonitor("akira", 1, 1).look())
+        assert result.name == "Akira S01E01"
+        assert self.fast.queries == ["akira s01e01"]
+
+
+class TestProviderDeadline:
+    def test_deadline_misses_open_breaker(self):
+        async def hang(request):
+            await asyncio.sleep(10)
+        breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=60)
+        fan_out = ProviderFanOut([ApibayProvider(circuit_breaker=breaker)], deadline=0.01)
+        http_client = PooledHttpClient(transport=MockTransport(hang))
+        for _ in range(5):
+            with pytest.raises(SearchUnavailableError):
+                asyncio.run(fan_out.search("akira", http_client))
+        assert breaker.state == breaker.OPEN
+        # the next search is skipped right away, for as long as the breaker stays open
+        with pytest.raises(SearchUnavailableError) as e:
+            asyncio.run(asyncio.wait_for(fan_out.search("akira", http_client), 0.005))
+        assert 0 < e.value.retry_after <= 60
+
+    def test_check_deadline(self):
+        provider = ApibayProvider(retry_policy=RetryPolicy(attempts=3, max_delay=8))
+        assert ProviderFanOut([provider], deadline=50).check_deadline(request_timeout=10, job_timeout=60)
+        assert not ProviderFanOut([provider], deadline=20).check_deadline(request_timeout=10)
+        assert not ProviderFanOut([provider], deadline=50).check_deadline(request_timeout=10, job_timeout=30)
+
+
+class TestApibayProvider:
+    def test_mirror_host(self):
+        urls = []
+
+        def handler(request):
+            urls.append(str(request.url.copy_with(query=None)))
+            return Response(200, json=[{"id": "1", "name": "Akira", "size": "1", "seeders": "3", "status": "vip",
+                                        "info_hash": "aa"}])
+        provider = ApibayProvider("https://apibay.example/")
+        results = asyncio.run(provider.search("akira", PooledHttpClient(transport=MockTransport(handler))))
+        assert provider.name == "apibay.example"
+        assert urls == ["https://apibay.example/q.php"]
+        assert results == [{"id": "1", "name": "Akira", "size": "1", "seeders": "3", "status": "vip",
+                            "info_hash": "aa"}]
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import time
+from torrent_manager import TokenBucket, RetryPolicy, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+        clock.now += 0.5
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+        clock.now += 10
+        assert sum(bucket.try_acquire() for _ in range(10)) == 3
+
+    def test_acquire_waits_for_tokens(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        async def acquire_all():
+            await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+
+        started_at = time.monotonic()
+        asyncio.run(acquire_all())
+        assert time.monotonic() - started_at >= 4 / 50 * 0.9
+
+
+class TestRetryPolicy:
+    def test_delays_bounded_by_exponential_backoff(self):
+        policy = RetryPolicy(attempts=6, base_delay=1, max_delay=4)
+        delays = list(policy.delays(random.Random(0)))
+        assert len(delays) == 5
+        assert all(0 <= delay <= bound for delay, bound in zip(delays, (1, 2, 4, 4, 4)))
+
+    def test_single_attempt_never_retries(self):
+        assert list(RetryPolicy(attempts=1).delays()) == []
+
+    def test_budget(self):
+        assert RetryPolicy(attempts=3, base_delay=0.5, max_delay=8).budget(request_timeout=10) == 46
+
+
+class TestCircuitBreaker:
+    def setup_method(self, method):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30, clock=self.clock)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        assert self.breaker.allow_request()
+        self.breaker.record_failure()
+        assert self.breaker.is_open
+        assert not self.breaker.allow_request()
+        assert self.breaker.retry_after == 30
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        assert not self.breaker.is_open
+
+    def test_half_open_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 30
+        assert self.breaker.allow_request()
+        assert self.breaker.state == CircuitBreaker.HALF_OPEN
+        assert not self.breaker.allow_request()
+        self.breaker.record_success()
+        assert self.breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 30
+        assert self.breaker.allow_request()
+        self.breaker.record_failure()
+        assert self.breaker.is_open
+        assert self.breaker.retry_after == 30
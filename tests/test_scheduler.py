@@ -0,0 +1,196 @@
+import asyncio
+import time
+import random
+import pytest
+from torrent_manager import MonitorOrchestrator, MonitorScheduler, MonitorSetting, PBSearcher, PBMonitor, JobResult, \
+    JsonMonitorStore, TorrentDetails, PollingPolicy
+
+HOUR = 60 * 60
+
+
+class FakeClock:
+    def __init__(self, now: float = 100 * HOUR) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingSearcher(PBSearcher):
+    def __init__(self, default_query: str, runs: list[str], delay: float = 0, finds: bool = False):
+        super().__init__(default_query)
+        self.runs = runs
+        self.delay = delay
+        self.finds = finds
+
+    async def look(self):
+        self.runs.append(self.default_query)
+        await asyncio.sleep(self.delay)
+        if self.finds:
+            return TorrentDetails(self.default_query, "", 1, 1, "vip", "")
+
+
+class EndlessShow(PBMonitor):
+    """Finds the next episode every time it looks"""
+
+    def __init__(self, runs: list[str], delay: float):
+        super().__init__("show", 1, 1)
+        self.runs = runs
+        self.delay = delay
+
+    async def look(self):
+        self.runs.append(self.default_query)
+        await asyncio.sleep(self.delay)
+        self.episode_number += 1
+        return TorrentDetails(self.default_query, "", 1, 1, "vip", "")
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def orchestrator(tmp_path, clock) -> MonitorOrchestrator:
+    return MonitorOrchestrator(store=JsonMonitorStore(str(tmp_path / "monitors.json")), clock=clock)
+
+
+def add_monitor(orchestrator: MonitorOrchestrator, searcher: PBSearcher, last_checked: float = 0) -> MonitorSetting:
+    setting = MonitorSetting(1, searcher, last_checked=last_checked)
+    asyncio.run(orchestrator.add_monitor_job(setting, False))
+    return setting
+
+
+class TestMonitorScheduler:
+    def setup_method(self, method):
+        self.runs = []
+
+    def scheduler(self, orchestrator, clock, **kwargs) -> MonitorScheduler:
+        return MonitorScheduler(orchestrator, clock=clock, rng=random.Random(0),
+                                **{"interval": 8 * HOUR, "jitter": 0.1, "catch_up_window": 300} | kwargs)
+
+    def test_missed_runs_caught_up_within_window(self, orchestrator, clock):
+        add_monitor(orchestrator, CountingSearcher("never checked", self.runs))
+        add_monitor(orchestrator, CountingSearcher("checked long ago", self.runs), last_checked=clock.now - 24 * HOUR)
+        add_monitor(orchestrator, CountingSearcher("checked recently", self.runs), last_checked=clock.now - HOUR)
+        scheduler = self.scheduler(orchestrator, clock)
+        scheduler.sync()
+        due_times = sorted(due_at for due_at, _ in scheduler._queue)
+        assert clock.now <= due_times[0] <= due_times[1] <= clock.now + 300
+        assert clock.now + 6 * HOUR <= due_times[2] <= clock.now + 8 * HOUR
+
+    def test_runs_only_due_monitors(self, orchestrator, clock):
+        add_monitor(orchestrator, CountingSearcher("due", self.runs), last_checked=clock.now - 9 * HOUR)
+        add_monitor(orchestrator, CountingSearcher("not due", self.runs), last_checked=clock.now - HOUR)
+        scheduler = self.scheduler(orchestrator, clock, jitter=0)
+        scheduler.sync()
+        clock.now += 300
+        asyncio.run(scheduler.run_due())
+        assert self.runs == ["due"]
+        assert scheduler.next_due_at() == clock.now - 300 + 7 * HOUR
+
+    def test_rescheduled_after_run(self, orchestrator, clock):
+        setting = add_monitor(orchestrator, CountingSearcher("movie", self.runs))
+        scheduler = self.scheduler(orchestrator, clock, catch_up_window=0, jitter=0)
+        asyncio.run(scheduler.run_due())
+        assert self.runs == ["movie"]
+        assert setting.last_checked == clock.now
+        assert scheduler.next_due_at() == clock.now + 8 * HOUR
+        assert asyncio.run(scheduler.run_due()) == []
+        assert self.runs == ["movie"]
+
+    def test_last_checked_persisted(self, orchestrator, clock):
+        add_monitor(orchestrator, CountingSearcher("movie", self.runs))
+        asyncio.run(self.scheduler(orchestrator, clock, catch_up_window=0).run_due())
+        assert orchestrator._store.load()[0]["last_checked"] == clock.now
+
+    def test_finds_passed_to_callback(self, orchestrator, clock):
+        add_monitor(orchestrator, CountingSearcher("movie", self.runs, finds=True))
+        found = []
+
+        async def on_finds(results: list[JobResult]):
+            found.extend(results)
+
+        scheduler = self.scheduler(orchestrator, clock, catch_up_window=0, on_finds=on_finds)
+        asyncio.run(scheduler.run_due())
+        assert [result.result.name for result in found] == ["movie"]
+        assert scheduler.next_due_at() is None
+
+    def test_manual_run_postpones_scheduled_one(self, orchestrator, clock):
+        add_monitor(orchestrator, CountingSearcher("movie", self.runs), last_checked=clock.now - 7 * HOUR)
+        scheduler = self.scheduler(orchestrator, clock, jitter=0)
+        scheduler.sync()
+        clock.now += HOUR
+        asyncio.run(orchestrator.run_search_jobs(owner_id=1))
+        asyncio.run(scheduler.run_due())
+        assert self.runs == ["movie"]
+        assert scheduler.next_due_at() == clock.now + 8 * HOUR
+
+    def test_deleted_monitor_unscheduled(self, orchestrator, clock):
+        setting = add_monitor(orchestrator, CountingSearcher("movie", self.runs))
+        scheduler = self.scheduler(orchestrator, clock, catch_up_window=0)
+        scheduler.sync()
+        asyncio.run(orchestrator.delete_monitor_job(setting))
+        asyncio.run(scheduler.run_due())
+        assert self.runs == []
+        assert scheduler.next_due_at() is None
+
+    def test_manual_and_scheduled_runs_serialized(self, orchestrator, clock):
+        setting = add_monitor(orchestrator, CountingSearcher("movie", self.runs, delay=0.05))
+        in_flight = []
+
+        async def run_concurrently():
+            async def run():
+                in_flight.append(orchestrator._run_lock.locked())
+                await orchestrator.run_search_jobs([setting])
+            await asyncio.gather(run(), run())
+
+        asyncio.run(run_concurrently())
+        assert in_flight == [False, True]
+        assert len(self.runs) == 2
+
+    def test_run_forever_keeps_period(self, orchestrator):
+        add_monitor(orchestrator, CountingSearcher("movie", self.runs))
+        orchestrator.clock = time.time
+        scheduler = MonitorScheduler(orchestrator, interval=0.05, jitter=0, catch_up_window=0, resync_interval=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(scheduler.run_forever(), 0.3))
+        assert 3 <= len(self.runs) <= 7
+
+    def test_interval_from_polling_policy(self, orchestrator, clock):
+        orchestrator.polling_policy = PollingPolicy(base_interval=8 * HOUR)
+        add_monitor(orchestrator, CountingSearcher("dormant", self.runs)).misses = 3
+        scheduler = self.scheduler(orchestrator, clock, catch_up_window=0, jitter=0)
+        asyncio.run(scheduler.run_due())
+        assert scheduler.next_due_at() == clock.now + 8 * HOUR * 2 ** 4
+
+    def test_alive_while_long_run_progresses(self, orchestrator):
+        orchestrator.job_timeout, orchestrator.iteration_deadline = 0.05, 0.05
+        orchestrator.clock = time.time
+        # a show that keeps finding the next episode is searched again and again within the same run
+        add_monitor(orchestrator, EndlessShow(self.runs, delay=0.03))
+        scheduler = MonitorScheduler(orchestrator, interval=HOUR, catch_up_window=0, resync_interval=0.01)
+        alive = []
+
+        async def run_and_probe():
+            run = asyncio.create_task(scheduler.run_forever())
+            for _ in range(20):
+                await asyncio.sleep(0.02)
+                alive.append(scheduler.is_alive)
+            run.cancel()
+        asyncio.run(run_and_probe())
+        # far longer than the allowed tick gap of 0.12s, all in the first run
+        assert len(self.runs) > 8
+        assert all(alive)
+
+    def test_stalled_run_not_alive(self, orchestrator):
+        scheduler = MonitorScheduler(orchestrator, resync_interval=0.01)
+        orchestrator.job_timeout, orchestrator.iteration_deadline = 0.01, 0.01
+        scheduler._ticked_at = orchestrator.progressed_at = time.monotonic() - 1
+        scheduler._running = True
+        assert not scheduler.is_alive
+        orchestrator.progressed_at = time.monotonic()
+        assert scheduler.is_alive
+        # progress from runs outside the scheduler doesn't count once its loop is idle
+        scheduler._running = False
+        assert not scheduler.is_alive
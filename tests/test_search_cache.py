@@ -0,0 +1,66 @@
+from torrent_manager import SearchCache, TorrentDetails
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def generate_results(count: int, name: str = "torrent") -> list[TorrentDetails]:
+    return [TorrentDetails(f"{name} {i}", "link", 1, i, "vip", "0" * 40) for i in range(count)]
+
+
+class TestSearchCache:
+    def setup_method(self, method):
+        self.clock = FakeClock()
+        self.cache = SearchCache(ttl=10, empty_ttl=2, max_entries=3, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        assert self.cache.get("akira") is None
+        self.cache.set("akira", generate_results(2))
+        assert len(self.cache.get("akira")) == 2
+        assert self.cache.stats.hits == 1
+        assert self.cache.stats.misses == 1
+
+    def test_ttl_expiration(self):
+        self.cache.set("akira", generate_results(2))
+        self.clock.now = 10
+        assert self.cache.get("akira") is None
+        assert self.cache.stats.expirations == 1
+        assert len(self.cache) == 0
+
+    def test_empty_results_short_ttl(self):
+        self.cache.set("nothing", [])
+        self.clock.now = 1
+        assert self.cache.get("nothing") == []
+        self.clock.now = 2
+        assert self.cache.get("nothing") is None
+
+    def test_lru_eviction(self):
+        for query in ("a", "b", "c"):
+            self.cache.set(query, generate_results(1))
+        self.cache.get("a")
+        self.cache.set("d", generate_results(1))
+        assert self.cache.get("b") is None
+        assert self.cache.get("a") is not None
+        assert self.cache.stats.evictions == 1
+
+    def test_memory_cap(self):
+        entry_size = SearchCache._estimate_size(generate_results(10))
+        cache = SearchCache(max_bytes=entry_size * 2, clock=self.clock)
+        for query in ("a", "b", "c"):
+            cache.set(query, generate_results(10))
+        assert len(cache) == 2
+        assert cache.size_bytes <= entry_size * 2
+        cache.set("huge", generate_results(100))
+        assert cache.get("huge") is None
+
+    def test_overwrite_keeps_size_consistent(self):
+        self.cache.set("akira", generate_results(5))
+        self.cache.set("akira", generate_results(1))
+        assert self.cache.size_bytes == SearchCache._estimate_size(generate_results(1))
+        self.cache.clear()
+        assert self.cache.size_bytes == 0
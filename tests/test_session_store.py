@@ -0,0 +1,62 @@
+from torrent_manager import TorrentDetails
+from tg_bot.session_store import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def generate_results(*hashes: str) -> list[TorrentDetails]:
+    return [TorrentDetails(f"torrent {info_hash}", "link", 1, 1, "vip", info_hash) for info_hash in hashes]
+
+
+class TestSessionStore:
+    def setup_method(self, method):
+        self.clock = FakeClock()
+        self.store = SessionStore(max_results_per_chat=3, idle_ttl=100, eviction_interval=10, clock=self.clock)
+
+    def test_lookup_by_hash(self):
+        self.store.save_search_results(1, generate_results("a", "b"))
+        assert self.store.get_search_result(1, "b").name == "torrent b"
+        assert self.store.get_search_result(1, "c") is None
+
+    def test_sessions_isolated_per_chat(self):
+        self.store.save_search_results(1, generate_results("a"))
+        self.store.get(1).item_chosen = "a"
+        self.store.get(2).active_torrent = "magnet:?xt=urn:btih:b"
+        assert self.store.get_search_result(2, "a") is None
+        assert self.store.get(2).item_chosen is None
+        assert self.store.get(1).active_torrent is None
+        assert self.store.get(1).chosen_search_result.info_hash == "a"
+
+    def test_results_bounded_per_chat(self):
+        self.store.save_search_results(1, generate_results("a", "b"))
+        self.store.save_search_results(1, generate_results("c", "d"))
+        assert self.store.get_search_result(1, "a") is None
+        assert [r.info_hash for r in self.store.get(1).search_results.values()] == ["b", "c", "d"]
+
+    def test_repeated_result_refreshed(self):
+        self.store.save_search_results(1, generate_results("a", "b", "c"))
+        self.store.save_search_results(1, generate_results("a", "d"))
+        assert list(self.store.get(1).search_results) == ["c", "a", "d"]
+
+    def test_idle_sessions_evicted(self):
+        self.store.get(1)
+        self.clock.now = 50
+        self.store.get(2)
+        self.clock.now = 120
+        self.store.get(2)
+        assert 1 not in self.store
+        assert 2 in self.store
+
+    def test_memory_usage(self):
+        self.store.save_search_results(1, generate_results("a", "b"))
+        self.store.save_search_results(2, generate_results("c"))
+        usage = self.store.memory_usage()
+        assert usage["sessions"] == 2
+        assert usage["search_results"] == 3
+        assert usage["size_bytes"] > 0
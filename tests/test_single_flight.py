@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from torrent_manager.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    def setup_method(self, method):
+        self.single_flight = SingleFlight()
+        self.calls = 0
+
+    async def fetch(self, value, delay=0.01):
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return value
+
+    def test_same_key_shares_call(self):
+        async def run():
+            return await asyncio.gather(*(self.single_flight.do("key", lambda: self.fetch(1)) for _ in range(5)))
+        assert asyncio.run(run()) == [1] * 5
+        assert self.calls == 1
+        assert self.single_flight.shared == 4
+        assert len(self.single_flight) == 0
+
+    def test_different_keys_run_separately(self):
+        async def run():
+            return await asyncio.gather(self.single_flight.do("a", lambda: self.fetch("a")),
+                                        self.single_flight.do("b", lambda: self.fetch("b")))
+        assert asyncio.run(run()) == ["a", "b"]
+        assert self.calls == 2
+
+    def test_cancelled_waiter_doesnt_cancel_others(self):
+        async def run():
+            first = asyncio.create_task(self.single_flight.do("key", lambda: self.fetch(1, 0.05)))
+            second = asyncio.create_task(self.single_flight.do("key", lambda: self.fetch(1, 0.05)))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+        assert asyncio.run(run()) == 1
+        assert self.calls == 1
+
+    def test_exception_propagates_to_all_waiters(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError
+
+        async def run():
+            return await asyncio.gather(self.single_flight.do("key", fail), self.single_flight.do("key", fail),
+                                        return_exceptions=True)
+        results = asyncio.run(run())
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):
+            asyncio.run(self.single_flight.do("key", fail))
@@ -0,0 +1,47 @@
+import asyncio
+import subprocess
+import sys
+from httpx import MockTransport
+from startup import StartupTimer
+from tests.stand_ins import ApibayStandIn, TransmissionStandIn
+from torrent_manager import MonitorOrchestrator, PooledHttpClient, TransmissionClient, JsonMonitorStore
+import main
+
+
+class TestStartupTimer:
+    def test_phases_and_milestones(self):
+        now = [0.]
+        timer = StartupTimer(clock=lambda: now[0])
+        with timer.phase("load monitors"):
+            now[0] += 0.25
+        now[0] += 0.5
+        assert timer.mark("polling started") == 0.75
+        assert timer.to_dict() == {"phases": {"load monitors": 0.25}, "milestones": {"polling started": 0.75}}
+        assert timer.summary() == "load monitors 0.250s"
+
+    def test_imported_modules_not_timed_again(self):
+        timer = StartupTimer()
+        assert timer.import_module("json") is sys.modules["json"]
+        assert timer.phases == {}
+
+
+class TestApp:
+    def test_import_is_light(self):
+        check = "import main, sys; print(sorted({'telegram', 'prettytable', 'logtail', 'torrent_manager'} " \
+                "& set(sys.modules)))"
+        output = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "[]"
+
+    def test_run_once_without_the_bot(self, tmp_path):
+        apibay, transmission = ApibayStandIn(release_every=1, released_episodes=1), TransmissionStandIn()
+        app = main.App()
+        app.http_client = PooledHttpClient(transport=MockTransport(apibay))
+        app.monitor_store = JsonMonitorStore(str(tmp_path / "monitors.json"))
+        app.monitor_store.upsert([{"owner_id": 1, "monitor_type": "show", "name": "show 1", "season": 1,
+                                   "episode": 1, "uuid": "show-1"}])
+        app.monitors_orchestrator = MonitorOrchestrator(http_client=app.http_client, store=app.monitor_store)
+        app.transmission = TransmissionClient("transmission.local",
+                                              http_client=PooledHttpClient(transport=MockTransport(transmission)))
+        asyncio.run(app.run_once())
+        assert [torrent["name"][:14] for torrent in transmission.torrents.values()] == ["Show 1 S01E01 "]
+        assert "runner" not in app.__dict__
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import pytest
+from tracing import Tracer, NULL_SPAN, tracer
+from torrent_manager import MonitorOrchestrator, MonitorSetting, PBMonitor
+
+
+class TestTracer:
+    def test_disabled_tracer_is_a_no_op(self):
+        disabled_tracer = Tracer(enabled=False)
+        with disabled_tracer.run("run") as run:
+            assert disabled_tracer.span("stage") is NULL_SPAN
+        assert run is NULL_SPAN
+        assert disabled_tracer.last_run is None
+
+    def test_spans_outside_runs_not_recorded(self):
+        assert Tracer(enabled=True).span("stage") is NULL_SPAN
+
+    def test_breakdown(self):
+        enabled_tracer = Tracer(enabled=True)
+
+        @enabled_tracer.traced("parse")
+        def parse():
+            pass
+
+        @enabled_tracer.traced()
+        async def fetch():
+            parse()
+
+        async def run():
+            with enabled_tracer.run("monitor_run"):
+                await asyncio.gather(fetch(), fetch())
+                with enabled_tracer.span("save"):
+                    pass
+
+        asyncio.run(run())
+        breakdown = enabled_tracer.last_run.breakdown()
+        assert {name: count for name, (_, count) in breakdown.items()} == \
+            {"TestTracer.test_breakdown.<locals>.fetch": 2, "parse": 2, "save": 1}
+
+    def test_nested_run_becomes_span(self):
+        enabled_tracer = Tracer(enabled=True)
+        with enabled_tracer.run("download_new_finds"):
+            with enabled_tracer.run("monitor_run"):
+                pass
+        assert enabled_tracer.last_run.name == "download_new_finds"
+        assert [span.name for span in enabled_tracer.last_run.spans] == ["monitor_run"]
+
+    def test_chrome_trace_export(self, tmp_path):
+        enabled_tracer = Tracer(enabled=True, export_dir=str(tmp_path))
+
+        async def stage(name):
+            with enabled_tracer.span(name, query=name):
+                await asyncio.sleep(0)
+
+        async def run():
+            with enabled_tracer.run("monitor_run"):
+                await asyncio.gather(stage("a"), stage("b"))
+
+        asyncio.run(run())
+        [trace_file] = tmp_path.iterdir()
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        spans = [event for event in events if event.get("cat") == "span"]
+        assert {span["args"]["query"] for span in spans} == {"a", "b"}
+        assert len({span["tid"] for span in spans}) == 2
+        assert all(span["ph"] == "X" and span["dur"] >= 0 for span in spans)
+
+
+class TestPipelineTracing:
+    @pytest.fixture(autouse=True)
+    def enable_tracing(self, monkeypatch):
+        monkeypatch.setattr(tracer, "enabled", True)
+        monkeypatch.setattr(tracer, "last_run", None)
+
+    def test_monitor_run_stages(self, mock_response_iteration, tmp_path):
+        orchestrator = MonitorOrchestrator(str(tmp_path / "monitors.json"))
+        asyncio.run(orchestrator.add_monitor_job(MonitorSetting(1, PBMonitor("the last of us", 1, 10)), True))
+        stages = tracer.last_run.breakdown()
+        assert tracer.last_run.name == "monitor_run"
+        assert {"iteration", "monitor", "apibay.request", "apibay.parse", "select_top", "save_settings"} <= \
+            stages.keys()
+        assert stages["monitor"][1] == 6
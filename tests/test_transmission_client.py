@@ -0,0 +1,186 @@
+import asyncio
+import time
+import pytest
+from httpx import MockTransport, ConnectError, Response
+from transmission_rpc.error import TransmissionError
+from torrent_manager import TransmissionClient, PooledHttpClient
+from tests.stand_ins import TransmissionStandIn
+
+magnet_link = "magnet:?xt=urn:btih:5A548DD0C08D7FFC1E359D5E4977FAA28E4D0850&dn=Akira"
+
+
+@pytest.fixture
+def transmission_stand_in() -> TransmissionStandIn:
+    return TransmissionStandIn()
+
+
+@pytest.fixture
+def transmission(transmission_stand_in) -> TransmissionClient:
+    return TransmissionClient("localhost", http_client=PooledHttpClient(
+        transport=MockTransport(transmission_stand_in)))
+
+
+class TestTransmissionClient:
+    def test_lazy_connection(self, transmission, transmission_stand_in):
+        assert transmission.url == "http://localhost:9091/transmission/rpc"
+        assert transmission_stand_in.session_rejections == 0
+        assert transmission.http_client.stats.requests == 0
+
+    def test_session_id_negotiation(self, transmission, transmission_stand_in):
+        asyncio.run(transmission.get_torrents())
+        asyncio.run(transmission.get_torrents())
+        assert transmission_stand_in.session_rejections == 1
+        transmission_stand_in.rotate_session("stand-in-session-2")
+        asyncio.run(transmission.get_torrents())
+        assert transmission_stand_in.session_rejections == 2
+        assert len(transmission_stand_in.requests) == 3
+
+    def test_add_download(self, transmission, transmission_stand_in):
+        download = asyncio.run(transmission.add_download(magnet_link, "movie"))
+        assert download.name == "Akira"
+        assert transmission_stand_in.torrents[download.id]["downloadDir"] == transmission.download_paths["movie"]
+
+    def test_add_duplicate_download(self, transmission, transmission_stand_in):
+        first_download = asyncio.run(transmission.add_download(magnet_link, "movie"))
+        second_download = asyncio.run(transmission.add_download(magnet_link, "movie"))
+        assert first_download.id == second_download.id
+        assert len(transmission_stand_in.torrents) == 1
+
+    def test_download_from_file(self, transmission, transmission_stand_in, tmp_path):
+        torrent_file = tmp_path / "akira.torrent"
+        torrent_file.write_bytes(b"Akira:5a548dd0c08d7ffc1e359d5e4977faa28e4d0850")
+        download = asyncio.run(transmission.download_from_file(str(torrent_file), "other"))
+        assert download.hashString == "5a548dd0c08d7ffc1e359d5e4977faa28e4d0850"
+
+    def test_add_download_unreachable(self):
+        def refuse(request):
+            raise ConnectError("connection refused", request=request)
+        transmission = TransmissionClient("localhost", http_client=PooledHttpClient(transport=MockTransport(refuse)))
+        assert asyncio.run(transmission.add_download(magnet_link, "movie")) is None
+
+    def test_html_reply(self):
+        proxy_page = MockTransport(lambda request: Response(200, text="<html>502 bad gateway</html>"))
+        transmission = TransmissionClient("localhost", http_client=PooledHttpClient(transport=proxy_page))
+        assert asyncio.run(transmission.add_download(magnet_link, "movie")) is None
+        assert [outcome.status for outcome in asyncio.run(transmission.add_downloads([(magnet_link, "movie")]))] == \
+            ["error"]
+
+    def test_reply_missing_fields(self):
+        reply = {"result": "success", "arguments": {}}
+        transmission = TransmissionClient("localhost", http_client=PooledHttpClient(
+            transport=MockTransport(lambda request: Response(200, json=reply))))
+        with pytest.raises(TransmissionError, match="torrents"):
+            asyncio.run(transmission.get_torrents())
+        assert asyncio.run(transmission.add_download(magnet_link, "movie")) is None
+
+    def test_get_info_hash(self):
+        assert TransmissionClient.get_info_hash(magnet_link) == "5a548dd0c08d7ffc1e359d5e4977faa28e4d0850"
+        assert TransmissionClient.get_info_hash(
+            "magnet:?xt=urn:btih:ljki3ugarv77yhrvtvpes572ukhe2ccq") == "5a548dd0c08d7ffc1e359d5e4977faa28e4d0850"
+        assert TransmissionClient.get_info_hash("magnet:?dn=Akira") == ""
+
+    def test_add_downloads_deduplicates(self, transmission, transmission_stand_in):
+        transmission_stand_in.add("Perfect Blue", "b" * 40)
+        outcomes = asyncio.run(transmission.add_downloads([
+            (magnet_link, "movie"),
+            (magnet_link.replace("Akira", "Akira 4K"), "movie"),
+            (f"magnet:?xt=urn:btih:{'B' * 40}&dn=Perfect Blue", "movie"),
+            (f"magnet:?xt=urn:btih:{'c' * 40}&dn=Paprika", "movie"),
+        ]))
+        assert [outcome.status for outcome in outcomes] == ["added", "duplicate", "exists", "added"]
+        assert outcomes[2].torrent.name == "Perfect Blue"
+        assert len(transmission_stand_in.torrents) == 3
+        assert sum(request["method"] == "torrent-add" for request in transmission_stand_in.requests) == 2
+
+    def test_add_downloads_submits_concurrently(self, transmission, transmission_stand_in):
+        transmission_stand_in.latency = 0.05
+        asyncio.run(transmission.get_torrents())
+        started_at = time.monotonic()
+        outcomes = asyncio.run(transmission.add_downloads(
+            [(f"magnet:?xt=urn:btih:{str(i) * 40}&dn={i}", "show") for i in range(8)], max_parallel=8))
+        assert all(outcome.status == "added" for outcome in outcomes)
+        assert time.monotonic() - started_at < 0.05 * 4
+
+    def test_add_downloads_unreachable(self):
+        def refuse(request):
+            raise ConnectError("connection refused", request=request)
+        transmission = TransmissionClient("localhost", http_client=PooledHttpClient(transport=MockTransport(refuse)))
+        outcomes = asyncio.run(transmission.add_downloads([(magnet_link, "movie")]))
+        assert [outcome.status for outcome in outcomes] == ["error"]
+
+    def test_find_torrent(self, transmission, transmission_stand_in):
+        transmission_stand_in.add("Akira", "a" * 40)
+        transmission_stand_in.add("Perfect Blue", "b" * 40)
+        assert asyncio.run(transmission.find_torrent("Perfect Blue")).hashString == "b" * 40
+        assert asyncio.run(transmission.find_torrent("Paprika")) is None
+
+    def test_get_recent_downloads(self, transmission, transmission_stand_in):
+        week_ago = time.time() - 60 * 60 * 24 * 7
+        transmission_stand_in.add("old and seeding", "a" * 40, status="seeding", percent_done=1, added_date=week_ago)
+        transmission_stand_in.add("old and downloading", "b" * 40, added_date=week_ago)
+        transmission_stand_in.add("new", "c" * 40, status="seeding", percent_done=1)
+        recent_downloads = asyncio.run(transmission.get_recent_downloads())
+        assert [torrent.name for torrent in recent_downloads] == ["new", "old and downloading"]
+        assert recent_downloads[1].progress == 50
+
+
+class TestTorrentSnapshot:
+    def test_find_torrent_requests_only_lookup_fields(self, transmission, transmission_stand_in):
+        transmission_stand_in.add("Akira", "a" * 40)
+        asyncio.run(transmission.find_torrent("Akira"))
+        assert sorted(transmission_stand_in.requests[-1]["arguments"]["fields"]) == ["hashString", "id", "name"]
+
+    def test_delta_refresh(self, transmission, transmission_stand_in):
+        transmission.snapshot_min_age = 0
+        akira = transmission_stand_in.add("Akira", "a" * 40)
+        transmission_stand_in.add("Perfect Blue", "b" * 40)
+        asyncio.run(transmission.get_recent_downloads())
+        transmission_stand_in.update(akira["id"], percentDone=1.)
+        recent_downloads = asyncio.run(transmission.get_recent_downloads())
+        assert transmission_stand_in.requests[-1]["arguments"]["ids"] == "recently-active"
+        assert {t.name: t.progress for t in recent_downloads} == {"Akira": 100, "Perfect Blue": 50}
+
+    def test_version_bumped_only_on_changes(self, transmission, transmission_stand_in):
+        transmission.snapshot_min_age = 0
+        akira = transmission_stand_in.add("Akira", "a" * 40)
+        asyncio.run(transmission.get_recent_downloads())
+        version = transmission.snapshot.version
+        transmission_stand_in.update(akira["id"])
+        asyncio.run(transmission.get_recent_downloads())
+        assert transmission.snapshot.version == version
+        transmission_stand_in.update(akira["id"], percentDone=0.75)
+        asyncio.run(transmission.get_recent_downloads())
+        assert transmission.snapshot.version == version + 1
+
+    def test_removed_torrents_unindexed(self, transmission, transmission_stand_in):
+        transmission.snapshot_min_age = 0
+        akira = transmission_stand_in.add("Akira", "a" * 40)
+        assert asyncio.run(transmission.find_torrent_by_hash("A" * 40)).name == "Akira"
+        transmission_stand_in.remove(akira["id"])
+        assert asyncio.run(transmission.find_torrent("Akira")) is None
+        assert transmission.snapshot.ids_by_hash == {}
+
+    def test_new_fields_trigger_full_refresh(self, transmission, transmission_stand_in):
+        transmission.snapshot_min_age = 0
+        transmission_stand_in.add("Akira", "a" * 40)
+        asyncio.run(transmission.find_torrent("Akira"))
+        asyncio.run(transmission.get_recent_downloads())
+        assert "ids" not in transmission_stand_in.requests[-1]["arguments"]
+        assert "percentDone" in transmission.snapshot.fields
+
+    def test_fresh_snapshot_reused(self, transmission, transmission_stand_in):
+        asyncio.run(transmission.find_torrent("Akira"))
+        asyncio.run(transmission.find_torrent("Akira"))
+        assert len(transmission_stand_in.requests) == 1
+
+    def test_add_marks_snapshot_stale(self, transmission, transmission_stand_in):
+        assert asyncio.run(transmission.find_torrent("Akira")) is None
+        asyncio.run(transmission.add_download(magnet_link, "movie"))
+        assert asyncio.run(transmission.find_torrent("Akira")).name == "Akira"
+
+    def test_old_snapshot_refreshed_in_full(self, transmission, transmission_stand_in):
+        transmission.snapshot_min_age = 0
+        transmission.snapshot_max_delta_age = 0
+        asyncio.run(transmission.find_torrent("Akira"))
+        asyncio.run(transmission.find_torrent("Akira"))
+        assert "ids" not in transmission_stand_in.requests[-1]["arguments"]
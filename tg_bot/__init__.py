@@ -1 +1,4 @@
 from .tg_bot import TgBotRunner
+from .session_store import SessionStore, ChatSession
+from .live_downloads import LiveDownloads, LiveView
+from .notifications import NotificationDispatcher, PendingChat
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from torrent_manager import Torrent, TransmissionClient
+from logger import logger
+from metrics import metrics
+
+live_view_edits = metrics.counter("live_downloads_edits_total", "Edits of live /downloads messages", ("result",))
+
+
+@dataclass
+class LiveView:
+    chat_id: int
+    message_id: int
+    tracked_ids: set[int]
+    started_at: float
+    text: str = ""
+    edited_at: float = 0
+
+
+@dataclass
+class RenderedDownloads:
+    snapshot_version: int
+    torrents: list[Torrent] = field(default_factory=list)
+    table: str = ""
+
+
+class LiveDownloads:
+    """Keeps /downloads messages up to date by editing them in place.
+    All views share one loop: a tick fetches the snapshot once, renders it once and edits only the changed views."""
+
+    def __init__(self, torrent_client: TransmissionClient, render_table: Callable[[list[Torrent]], str],
+                 refresh_interval: float = 5, max_duration: float = 60 * 60,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.torrent_client = torrent_client
+        self.render_table = render_table
+        self.refresh_interval = refresh_interval
+        self.max_duration = max_duration
+        self.clock = clock
+        self.views: dict[int, LiveView] = {}
+        self._rendered: RenderedDownloads | None = None
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+
+    def __repr__(self):
+        return f"LiveDownloads(views={len(self.views)}, refresh_interval={self.refresh_interval})"
+
+    @staticmethod
+    def format_message(table: str, finished: bool = False) -> str:
+        text = f"<pre>{table}</pre>" if table else "no recent downloads"
+        if finished:
+            text += "\nall downloads finished"
+        return text
+
+    @staticmethod
+    def is_pending(torrent: Torrent) -> bool:
+        return torrent.status in TransmissionClient._pending_statuses
+
+    async def fetch(self) -> RenderedDownloads:
+        torrents = await self.torrent_client.get_recent_downloads()
+        version = self.torrent_client.snapshot.version
+        # every viewer of the same snapshot gets the same table, it's rendered once
+        if self._rendered is None or self._rendered.snapshot_version != version:
+            self._rendered = RenderedDownloads(version, torrents, self.render_table(torrents) if torrents else "")
+        return self._rendered
+
+    def watch(self, bot: Bot, chat_id: int, message_id: int, rendered: RenderedDownloads) -> bool:
+        tracked_ids = {torrent.id for torrent in rendered.torrents if self.is_pending(torrent)}
+        if not tracked_ids:
+            return False
+        now = self.clock()
+        # a chat has a single live view, asking again moves it to the new message
+        self.views[chat_id] = LiveView(chat_id, message_id, tracked_ids, started_at=now,
+                                       text=self.format_message(rendered.table), edited_at=now)
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="live-downloads")
+        return True
+
+    async def run(self) -> None:
+        while self.views:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"live downloads refresh failed: {e!r}", views=len(self.views))
+
+    async def tick(self) -> None:
+        if not self.views:
+            return
+        rendered = await self.fetch()
+        pending_ids = {torrent.id for torrent in rendered.torrents if self.is_pending(torrent)}
+        now = self.clock()
+        for view in list(self.views.values()):
+            finished = not view.tracked_ids & pending_ids
+            expired = now - view.started_at >= self.max_duration
+            text = self.format_message(rendered.table, finished)
+            if text != view.text and now - view.edited_at >= self.refresh_interval:
+                await self._edit(view, text, now)
+            # a finished view stays until its final state made it into the message
+            if (finished and view.text == text) or expired:
+                self.views.pop(view.chat_id, None)
+
+    async def _edit(self, view: LiveView, text: str, now: float) -> None:
+        try:
+            await self._bot.edit_message_text(text=text, chat_id=view.chat_id, message_id=view.message_id,
+                                              parse_mode="html")
+        except RetryAfter as e:
+            # flood control, the view catches up on a later tick
+            view.edited_at = now + e.retry_after
+            live_view_edits.inc(result="throttled")
+            return
+        except (BadRequest, Forbidden) as e:
+            if "not modified" not in str(e).lower():
+                # the message got deleted or the bot was blocked, nothing left to update
+                logger.debug(f"live downloads view dropped: {e}", chat_id=view.chat_id)
+                self.views.pop(view.chat_id, None)
+                live_view_edits.inc(result="dropped")
+                return
+        except TelegramError as e:
+            logger.warning(f"live downloads edit failed: {e!r}", chat_id=view.chat_id)
+            live_view_edits.inc(result="error")
+            return
+        view.text, view.edited_at = text, now
+        live_view_edits.inc(result="edited")
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from torrent_manager import TokenBucket
+from logger import logger
+from metrics import metrics
+
+notifications_sent = metrics.counter("telegram_notifications_total", "Outbound notification messages by outcome",
+                                     ("result",))
+notifications_coalesced = metrics.counter("telegram_notifications_coalesced_total",
+                                          "Notifications folded into a digest with others for the same chat")
+
+# telegram refuses longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass
+class PendingChat:
+    chat_id: int
+    texts: list[str] = field(default_factory=list)
+    not_before: float = 0
+    attempts: int = 0
+
+
+class NotificationDispatcher:
+    """Outbound queue for the messages nobody is waiting on, like monitor finds and finished downloads.
+    Notifying only queues the text, a single task sends them within the global and per chat limits.
+    Texts queued for the same chat within `digest_delay` go out together as one digest message."""
+
+    def __init__(self, send: Callable[[int, str], Awaitable[Any]], global_rate: float = 25, chat_rate: float = 1,
+                 digest_delay: float = 3, max_attempts: int = 5, retry_delay: float = 2, max_queued: int = 500,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep) -> None:
+        self.send = send
+        self.chat_rate = chat_rate
+        self.digest_delay = digest_delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_queued = max_queued
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock, sleep)
+        self.pending: dict[int, PendingChat] = {}
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._task: asyncio.Task | None = None
+
+    def __repr__(self):
+        return f"NotificationDispatcher(chats={len(self.pending)}, queued={self.queued})"
+
+    @property
+    def queued(self) -> int:
+        return sum(len(chat.texts) for chat in self.pending.values())
+
+    def notify(self, chat_id: int, text: str) -> None:
+        if chat_id not in self.pending:
+            self.pending[chat_id] = PendingChat(chat_id, not_before=self.clock() + self.digest_delay)
+        chat = self.pending[chat_id]
+        chat.texts.append(text)
+        if len(chat.texts) > self.max_queued:
+            # telegram has been refusing this chat for a while, the oldest news matter least
+            del chat.texts[0]
+            notifications_sent.inc(result="dropped")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="notifications")
+
+    @staticmethod
+    def build_digest(texts: list[str], max_length: int = MAX_MESSAGE_LENGTH) -> tuple[str, int]:
+        """Joins as many of the texts as fit into one message, returns it with the number of texts it took"""
+        if len(texts) == 1:
+            return texts[0][:max_length], 1
+        lines = []
+        # room for the header
+        length = 32
+        for text in texts:
+            line = f"• {text}"
+            if lines and length + len(line) + 1 > max_length:
+                break
+            lines.append(line[:max_length - length])
+            length += len(line) + 1
+        return "\n".join([f"{len(lines)} updates:", *lines]), len(lines)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1, self.clock, self.sleep)
+        return self._chat_buckets[chat_id]
+
+    async def run(self) -> None:
+        # nothing is due before the first digest delay runs out
+        delay = self.digest_delay
+        while self.pending:
+            await self.sleep(delay)
+            try:
+                delay = await self.tick()
+            except Exception as e:
+                logger.warning(f"notification dispatch failed: {e!r}", queued=self.queued)
+                delay = self.retry_delay
+
+    async def tick(self) -> float:
+        """Sends whatever is due and allowed by the limits, returns how long to wait before the next tick"""
+        for chat in list(self.pending.values()):
+            if chat.not_before > self.clock():
+                continue
+            if not self._chat_bucket(chat.chat_id).try_acquire():
+                chat.not_before = self.clock() + 1 / self.chat_rate
+                continue
+            await self.global_bucket.acquire()
+            await self._send(chat)
+        if not self.pending:
+            return 0
+        # a chat notified for the first time waits out its digest delay anyway, so sleeping up to that is safe.
+        # every pending chat is in the future by now, the floor only keeps a zero digest delay from spinning
+        next_due = min(chat.not_before for chat in self.pending.values()) - self.clock()
+        return min(max(next_due, 0), max(self.digest_delay, 1 / self.chat_rate))
+
+    async def flush(self) -> None:
+        """Sends everything queued right away, ignoring digest delays and retry backoffs but not the rate limits.
+        A chat that fails once is given up on."""
+        for chat in list(self.pending.values()):
+            while chat.texts and chat.chat_id in self.pending:
+                await self._chat_bucket(chat.chat_id).acquire()
+                await self.global_bucket.acquire()
+                if not await self._send(chat):
+                    break
+        if self.pending:
+            logger.warning("notifications lost on shutdown", queued=self.queued)
+            notifications_sent.inc(self.queued, result="dropped")
+            self.pending.clear()
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _send(self, chat: PendingChat) -> bool:
+        text, taken = self.build_digest(chat.texts)
+        try:
+            await self.send(chat.chat_id, text)
+        except RetryAfter as e:
+            # flood control, telegram says exactly when to come back
+            chat.not_before = self.clock() + e.retry_after
+            notifications_sent.inc(result="throttled")
+            return False
+        except (BadRequest, Forbidden) as e:
+            # the bot got blocked or the chat is gone, retrying won't change that
+            logger.warning(f"notifications dropped: {e}", chat_id=chat.chat_id, texts=len(chat.texts))
+            self.pending.pop(chat.chat_id, None)
+            notifications_sent.inc(result="dropped")
+            return False
+        except TelegramError as e:
+            chat.attempts += 1
+            if chat.attempts >= self.max_attempts:
+                logger.warning(f"notifications dropped after {chat.attempts} attempts: {e!r}", chat_id=chat.chat_id,
+                               texts=len(chat.texts))
+                self.pending.pop(chat.chat_id, None)
+                notifications_sent.inc(result="dropped")
+                return False
+            chat.not_before = self.clock() + self.retry_delay * 2 ** (chat.attempts - 1)
+            notifications_sent.inc(result="error")
+            return False
+        notifications_sent.inc(result="sent")
+        if taken > 1:
+            notifications_coalesced.inc(taken)
+        del chat.texts[:taken]
+        chat.attempts = 0
+        if not chat.texts:
+            self.pending.pop(chat.chat_id, None)
+        return True
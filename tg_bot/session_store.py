@@ -0,0 +1,84 @@
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, astuple
+from typing import Callable
+
+from torrent_manager import TorrentDetails
+from logger import logger
+
+
+@dataclass
+class ChatSession:
+    search_results: OrderedDict[str, TorrentDetails] = field(default_factory=OrderedDict)
+    item_chosen: str | None = None
+    active_torrent: str | None = None
+    last_seen: float = 0
+
+    @property
+    def chosen_search_result(self) -> TorrentDetails | None:
+        if self.item_chosen is None:
+            return
+        return self.search_results.get(self.item_chosen)
+
+    def clear_choice(self) -> None:
+        self.item_chosen = None
+        self.active_torrent = None
+
+
+class SessionStore:
+    def __init__(self, max_results_per_chat: int = 50, idle_ttl: float = 60 * 60 * 24,
+                 eviction_interval: float = 60 * 10, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_results_per_chat = max_results_per_chat
+        self.idle_ttl = idle_ttl
+        self.eviction_interval = eviction_interval
+        self._clock = clock
+        self._sessions: dict[int, ChatSession] = {}
+        self._last_eviction = clock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._sessions
+
+    def get(self, chat_id: int) -> ChatSession:
+        now = self._clock()
+        if now - self._last_eviction >= self.eviction_interval:
+            self.evict_idle()
+        session = self._sessions.get(chat_id)
+        if session is None:
+            session = self._sessions[chat_id] = ChatSession()
+        session.last_seen = now
+        return session
+
+    def save_search_results(self, chat_id: int, results: list[TorrentDetails]) -> None:
+        search_results = self.get(chat_id).search_results
+        for result in results:
+            search_results.pop(result.info_hash, None)
+            search_results[result.info_hash] = result
+        while len(search_results) > self.max_results_per_chat:
+            search_results.popitem(last=False)
+
+    def get_search_result(self, chat_id: int, info_hash: str) -> TorrentDetails | None:
+        return self.get(chat_id).search_results.get(info_hash)
+
+    def evict_idle(self) -> int:
+        now = self._clock()
+        self._last_eviction = now
+        idle_chats = [chat_id for chat_id, session in self._sessions.items()
+                      if now - session.last_seen >= self.idle_ttl]
+        for chat_id in idle_chats:
+            del self._sessions[chat_id]
+        logger.debug("idle chat sessions evicted", evicted=len(idle_chats), **self.memory_usage())
+        return len(idle_chats)
+
+    def memory_usage(self) -> dict:
+        size_bytes = sys.getsizeof(self._sessions)
+        results_count = 0
+        for session in self._sessions.values():
+            results_count += len(session.search_results)
+            size_bytes += sys.getsizeof(session) + sys.getsizeof(session.search_results)
+            size_bytes += sum(sys.getsizeof(result) + sum(map(sys.getsizeof, astuple(result)))
+                              for result in session.search_results.values())
+        return {"sessions": len(self._sessions), "search_results": results_count, "size_bytes": size_bytes}
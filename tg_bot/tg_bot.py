@@ -1,14 +1,20 @@
 import os
+import functools
 from urllib.parse import unquote, parse_qs
-from dataclasses import dataclass, field
 from typing import Optional
 
 from torrent_manager import PBSearcher, MonitorSetting, MonitorOrchestrator, \
-    Torrent, TransmissionClient, TorrentDetails
+    Torrent, TransmissionClient, TorrentDetails, JobResult, DownloadOutcome, SearchUnavailableError, CompletionWatcher
 from logger import logger
+from metrics import metrics
+from tracing import tracer
+from tg_bot.session_store import SessionStore
+from tg_bot.live_downloads import LiveDownloads
+from tg_bot.notifications import NotificationDispatcher
+from config import LIVE_DOWNLOADS_INTERVAL, LIVE_DOWNLOADS_MAX_DURATION, COMPLETION_WATCH_INTERVAL, \
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_DIGEST_DELAY
 
 import asyncio
-import prettytable as pt
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, \
     ReplyKeyboardMarkup, ReplyKeyboardRemove, CallbackQuery
 from telegram.ext import Application, ContextTypes, filters, CommandHandler, \
@@ -16,13 +22,10 @@ from telegram.ext import Application, ContextTypes, filters, CommandHandler, \
 
 
 MONITOR_TYPE, SEARCH_QUERY, SEASON_AND_EPISODE, SIZE_LIMIT, SILENT = range(5)
-
-
-@dataclass
-class Storage:
-    saved_search_results: list[TorrentDetails | None] = field(default_factory=list)
-    item_chosen: str | None = None
-    active_torrent: str | None = None
+handler_duration = metrics.histogram("telegram_handler_duration_seconds", "Latency of telegram update handlers",
+                                     ("handler",))
+handler_errors = metrics.counter("telegram_handler_errors_total", "Telegram update handlers that raised",
+                                 ("handler",))
 
 
 class TgBotRunner:
@@ -35,7 +38,14 @@ class TgBotRunner:
         self.torrent_searcher = torrent_searcher
         self.monitors_orchestrator = monitors_orchestrator
         self.tg_user_whitelist = tg_user_whitelist or []
-        self._storage = Storage([None] * 50)
+        self.sessions = SessionStore()
+        self.live_downloads = LiveDownloads(torrent_client, self.generate_progress_table,
+                                            refresh_interval=LIVE_DOWNLOADS_INTERVAL,
+                                            max_duration=LIVE_DOWNLOADS_MAX_DURATION)
+        self.notifications = NotificationDispatcher(self.send_notification, global_rate=NOTIFY_GLOBAL_RATE,
+                                                    chat_rate=NOTIFY_CHAT_RATE, digest_delay=NOTIFY_DIGEST_DELAY)
+        self.completion_watcher = CompletionWatcher(torrent_client, notify=self.notifications.notify,
+                                                    interval=COMPLETION_WATCH_INTERVAL)
         self.tg_client.add_error_handler(callback=self.error_handler)
 
         # TODO: refactor with filters in command handlers
@@ -108,41 +118,36 @@ class TgBotRunner:
 
         self.tg_client.add_handler(unknown_handler)
         self.tg_client.add_handler(unknown_file_handler)
+        self._instrument_handlers()
+
+    def _instrument_handlers(self) -> None:
+        handlers = [handler for group in self.tg_client.handlers.values() for handler in group]
+        while handlers:
+            handler = handlers.pop()
+            if isinstance(handler, ConversationHandler):
+                handlers.extend(handler.entry_points + handler.fallbacks)
+                handlers.extend(state_handler for state_handlers in handler.states.values()
+                                for state_handler in state_handlers)
+            else:
+                handler.callback = self._timed(handler.callback)
 
-    @property
-    def item_chosen(self):
-        try:
-            return next(
-                filter(lambda i: i and i.info_hash == self._storage.item_chosen, self._storage.saved_search_results))
-        except StopIteration:
-            return
+    @staticmethod
+    def _timed(callback):
+        @functools.wraps(callback)
+        async def timed_callback(update, context):
+            with handler_duration.time(handler=callback.__name__):
+                try:
+                    return await callback(update, context)
+                except Exception:
+                    handler_errors.inc(handler=callback.__name__)
+                    raise
+        return timed_callback
 
     # !DOESN'T WORK
     @staticmethod
     async def error_handler(update: Optional[object], context: CallbackContext):
         logger.warning(context.error)
 
-    @item_chosen.setter
-    def item_chosen(self, item: TorrentDetails):
-        self._storage.item_chosen = item.info_hash
-
-    @property
-    def active_torrent(self):
-        return self._storage.active_torrent
-
-    @active_torrent.setter
-    def active_torrent(self, link):
-        self._storage.active_torrent = link
-
-    @property
-    def saved_search_results(self):
-        return self._storage.saved_search_results
-
-    @saved_search_results.setter
-    def saved_search_results(self, results: list):
-        self._storage.saved_search_results = results + \
-            self._storage.saved_search_results[:-len(results)]
-
     @staticmethod
     def get_param_value(val):
         return val[val.find("=") + 1:]
@@ -156,11 +161,8 @@ class TgBotRunner:
             self.tg_client.bot.send_message(chat_id=chat_id,
                                             text=text, parse_mode=parse_mode))
 
-    def get_search_result(self, hash: str):
-        try:
-            return next(filter(lambda item: item and item.info_hash == hash, self.saved_search_results))
-        except StopIteration:
-            return
+    def get_search_result(self, chat_id: int, hash: str) -> TorrentDetails | None:
+        return self.sessions.get_search_result(chat_id, hash)
 
     def get_active_monitor(self, update: Update) -> MonitorSetting:
         query = update.callback_query
@@ -169,13 +171,25 @@ class TgBotRunner:
         return active_monitor
 
     async def download_new_finds(self, job_owner_id: int) -> None:
-        for found_item in await self.monitors_orchestrator.run_search_jobs(owner_id=job_owner_id):
-            download_type = found_item.job_settings.searcher.monitor_type
-            self.torrent_client.add_download(found_item.magnet_link, download_type)
-
-    def clear_storage(self):
-        self._storage.item_chosen = None
-        self._storage.active_torrent = None
+        with tracer.run("download_new_finds"):
+            found_items = await self.monitors_orchestrator.run_search_jobs(owner_id=job_owner_id)
+            await self.download_found_items(found_items)
+
+    async def download_found_items(self, found_items: list[JobResult]) -> list[DownloadOutcome]:
+        outcomes = await self.torrent_client.add_downloads([(found_item.magnet_link,
+                                                             found_item.job_settings.searcher.monitor_type)
+                                                            for found_item in found_items])
+        for found_item, outcome in zip(found_items, outcomes):
+            if outcome.status != "error" and not found_item.job_settings.silent:
+                self.notifications.notify(found_item.job_settings.owner_id, f"Found {found_item.result.name}")
+        self.completion_watcher.watch_finds(found_items, outcomes)
+        return outcomes
+
+    async def send_notification(self, chat_id: int, text: str) -> None:
+        await self.tg_client.bot.send_message(chat_id=chat_id, text=text)
+
+    def clear_storage(self, chat_id: int):
+        self.sessions.get(chat_id).clear_choice()
 
     @staticmethod
     def generate_search_results_keyboard(results: list[TorrentDetails], search_query: str)\
@@ -193,6 +207,7 @@ class TgBotRunner:
 
     @staticmethod
     def generate_progress_table(torrents: list[Torrent]) -> str:
+        import prettytable as pt  # deferred, only /downloads needs it
         table = pt.PrettyTable(["name", "size", "progress",])
         table.align["name"] = "l"
         table.align["size"] = "l"
@@ -231,11 +246,15 @@ class TgBotRunner:
             reply_text = "You need to use this command with search query, like <i>/search Game of thrones s03</i>"
             return await context.bot.send_message(chat_id=update.effective_chat.id,
                                                   text=reply_text, parse_mode="html")
-        search_results = (await self.torrent_searcher.search_torrent(search_query))[:5]
+        try:
+            search_results = await self.torrent_searcher.search_torrent(search_query, limit=5)
+        except SearchUnavailableError:
+            return await context.bot.send_message(chat_id=update.effective_chat.id,
+                                                  text="search is unavailable at the moment, try again later")
         if not search_results:
             return await context.bot.send_message(chat_id=update.effective_chat.id,
                                                   text="couldn't find anything")
-        self.saved_search_results = search_results
+        self.sessions.save_search_results(update.effective_chat.id, search_results)
         text = "here's a top results i've found:"
         results_keyboard = self.generate_search_results_keyboard(
             search_results, search_query)
@@ -262,8 +281,7 @@ class TgBotRunner:
                 "size_limit", 0)
         results = await self.monitors_orchestrator.add_monitor_job_from_dict(
             orchestrator_params)
-        for result in results:
-            self.torrent_client.add_download(result.magnet_link, result.job_settings.searcher.monitor_type)
+        await self.download_found_items(results)
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text="Added monitor job", reply_markup=ReplyKeyboardRemove())
@@ -363,12 +381,13 @@ class TgBotRunner:
         # callback handlers
     async def callback_full_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         item_hash = self.get_param_value(update.callback_query.data)
-        full_name = self.get_search_result(item_hash).name
-        await update.callback_query.answer(full_name)
+        if not (search_result := self.get_search_result(update.effective_chat.id, item_hash)):
+            return await update.callback_query.answer("search result expired, please search again")
+        await update.callback_query.answer(search_result.name)
 
     async def callback_mag_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         item_hash = self.get_param_value(update.callback_query.data)
-        self.item_chosen = self.get_search_result(item_hash)
+        self.sessions.get(update.effective_chat.id).item_chosen = item_hash
         await self.verify_download_type(update, context, "search")
 
     async def download_added(self, added_download: Torrent, download_type: str, query: CallbackQuery):
@@ -385,25 +404,29 @@ class TgBotRunner:
     async def callback_download_type(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
         download_type = self.get_param_value(query.data)
+        session = self.sessions.get(update.effective_chat.id)
         if query.data.startswith("download_type_search"):
+            if not (item_chosen := session.chosen_search_result):
+                await query.edit_message_text(text="search result expired, please search again")
+                return await query.answer()
             magnet_link = self.torrent_searcher.generate_magnet_link(
-                self.item_chosen)
-            added_download = self.torrent_client.add_download(
+                item_chosen)
+            added_download = await self.torrent_client.add_download(
                 magnet_link, download_type)
             await self.download_added(added_download, download_type, query)
 
         elif query.data.startswith("download_type_maglink"):
-            magnet_link = self.active_torrent
-            added_download = self.torrent_client.add_download(
+            magnet_link = session.active_torrent
+            added_download = await self.torrent_client.add_download(
                 magnet_link, download_type)
             await self.download_added(added_download, download_type, query)
 
         elif query.data.startswith("download_type_file"):
-            added_download = self.torrent_client.download_from_file(
-                self.active_torrent, download_type)
+            added_download = await self.torrent_client.download_from_file(
+                session.active_torrent, download_type)
             await self.download_added(added_download, download_type, query)
 
-        self.clear_storage()
+        self.clear_storage(update.effective_chat.id)
 
     async def callback_monitor_full_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         active_monitor = self.get_active_monitor(update)
@@ -411,27 +434,30 @@ class TgBotRunner:
 
     async def callback_monitor_delete(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         active_monitor = self.get_active_monitor(update)
-        self.monitors_orchestrator.delete_monitor_job(active_monitor)
+        await self.monitors_orchestrator.delete_monitor_job(active_monitor)
         await update.callback_query.answer("Deleted")
         await self.view_monitors(update, context)
 
     async def get_recent_downloads(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        pending_downloads = self.torrent_client.get_recent_downloads()
-        if not pending_downloads:
+        rendered_downloads = await self.live_downloads.fetch()
+        if not rendered_downloads.torrents:
             return await context.bot.send_message(chat_id=update.effective_chat.id,
                                                   text="no pending downloads at the moment")
-        output_table = self.generate_progress_table(pending_downloads)
-        await context.bot.send_message(chat_id=update.effective_chat.id,
-                                       text=f'<pre>{output_table}</pre>', parse_mode="html")
+        message = await context.bot.send_message(chat_id=update.effective_chat.id,
+                                                 text=self.live_downloads.format_message(rendered_downloads.table),
+                                                 parse_mode="html")
+        # "/downloads live" keeps editing the table until the pending downloads finish
+        if context.args and context.args[0].lower() == "live":
+            self.live_downloads.watch(context.bot, update.effective_chat.id, message.message_id, rendered_downloads)
 
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        self.clear_storage()
+        self.clear_storage(update.effective_chat.id)
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text="Canceled", reply_markup=ReplyKeyboardRemove())
 
         # text / file handlers
     async def accept_magnet_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        self.active_torrent = update.message.text
+        self.sessions.get(update.effective_chat.id).active_torrent = update.message.text
         await self.verify_download_type(update, context, "maglink")
 
     async def save_torrent_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -439,7 +465,7 @@ class TgBotRunner:
         save_path = os.path.join(
             os.getcwd(), "data", "torrent-files", update.message.document.file_name)
         await file.download_to_drive(save_path)
-        self.active_torrent = save_path
+        self.sessions.get(update.effective_chat.id).active_torrent = save_path
         await self.verify_download_type(update, context, "file")
 
     @staticmethod
@@ -1,3 +1,11 @@
-from .pb_client import PBMonitor, PBSearcher, TorrentDetails
+from .pb_client import PBMonitor, PBSearcher, TorrentDetails, Monitor, ApibayProvider
+from .providers import SearchProvider, ProviderFanOut, FanOutResult
 from .pb_orchestrator import MonitorSetting, MonitorOrchestrator, JobResult
-from .transmission_client import TransmissionClient, Torrent
+from .transmission_client import TransmissionClient, TorrentSnapshot, DownloadOutcome, Torrent
+from .http_client import PooledHttpClient, ConnectionStats
+from .search_cache import SearchCache, CacheStats
+from .monitor_store import MonitorStore, JsonMonitorStore, SqliteMonitorStore, create_monitor_store
+from .scheduler import MonitorScheduler
+from .polling_policy import PollingPolicy
+from .resilience import TokenBucket, RetryPolicy, CircuitBreaker, SearchUnavailableError
+from .completion_watcher import CompletionWatcher, WatchedDownload
@@ -0,0 +1,114 @@
+from dataclasses import dataclass, field
+from typing import Callable
+import asyncio
+from transmission_rpc import Torrent, error as transmission_error
+from torrent_manager.pb_orchestrator import JobResult
+from torrent_manager.transmission_client import TransmissionClient, DownloadOutcome
+from logger import logger
+from metrics import metrics
+
+completion_notifications = metrics.counter("completion_notifications_total",
+                                           "Download state changes pushed to their owners", ("state",))
+
+# states worth a message to the owner; the ones in TERMINAL_STATES also end the watch
+NOTIFIED_STATES = ("finished", "error", "stopped", "removed")
+TERMINAL_STATES = ("finished", "error", "removed")
+
+
+@dataclass
+class WatchedDownload:
+    info_hash: str
+    name: str
+    owner_ids: set[int] = field(default_factory=set)
+    state: str = "added"
+
+
+class CompletionWatcher:
+    """Follows the downloads submitted for monitor finds and tells their owners how they ended.
+    One snapshot refresh per tick serves every watched download, whoever owns it."""
+    watch_fields = ["id", "name", "hashString", "status", "percentDone", "error", "errorString"]
+
+    def __init__(self, torrent_client: TransmissionClient, notify: Callable[[int, str], None],
+                 interval: float = 45) -> None:
+        self.torrent_client = torrent_client
+        self.notify = notify
+        self.interval = interval
+        # ticks further apart than the delta window re-fetch the whole torrent list every time
+        if interval >= torrent_client.snapshot_max_delta_age:
+            logger.warning("completion watch interval outlasts the snapshot delta window, every tick is a full refresh",
+                           interval=interval, max_delta_age=torrent_client.snapshot_max_delta_age)
+        self.watched: dict[str, WatchedDownload] = {}
+
+    def __repr__(self):
+        return f"CompletionWatcher(watched={len(self.watched)}, interval={self.interval})"
+
+    def watch(self, info_hash: str, owner_id: int, name: str) -> None:
+        if not info_hash:
+            return
+        watched = self.watched.setdefault(info_hash.lower(), WatchedDownload(info_hash.lower(), name))
+        watched.owner_ids.add(int(owner_id))
+
+    def watch_finds(self, found_items: list[JobResult], outcomes: list[DownloadOutcome]) -> None:
+        # outcomes come back in submission order, ownership is whatever the monitor said at that moment
+        for found_item, outcome in zip(found_items, outcomes):
+            if outcome.status == "error" or found_item.job_settings.silent:
+                continue
+            self.watch(outcome.info_hash, found_item.job_settings.owner_id, found_item.result.name)
+
+    @staticmethod
+    def state_of(torrent: Torrent | None) -> str:
+        if torrent is None:
+            return "removed"
+        if torrent.error:
+            return "error"
+        if torrent.status in ("seeding", "seed pending") or torrent.percent_done >= 1:
+            return "finished"
+        if torrent.status == "stopped":
+            return "stopped"
+        if torrent.status == "downloading":
+            return "downloading"
+        return "added"
+
+    @staticmethod
+    def format_notification(watched: WatchedDownload, torrent: Torrent | None) -> str:
+        match watched.state:
+            case "finished":
+                return f"{watched.name} finished downloading"
+            case "error":
+                return f"{watched.name} failed: {torrent.error_string}"
+            case "stopped":
+                return f"{watched.name} was stopped at {torrent.progress:.0f}%"
+            case _:
+                return f"{watched.name} was removed before it finished"
+
+    async def tick(self) -> None:
+        if not self.watched:
+            return
+        snapshot = await self.torrent_client.refresh_snapshot(self.watch_fields)
+        for info_hash, watched in list(self.watched.items()):
+            torrent = snapshot.get_by_hash(info_hash)
+            if (state := self.state_of(torrent)) == watched.state:
+                continue
+            logger.debug("watched download changed state", name=watched.name, previous=watched.state, state=state)
+            watched.state = state
+            if state in TERMINAL_STATES:
+                del self.watched[info_hash]
+            if state in NOTIFIED_STATES:
+                completion_notifications.inc(state=state)
+                text = self.format_notification(watched, torrent)
+                for owner_id in watched.owner_ids:
+                    try:
+                        self.notify(owner_id, text)
+                    except Exception as e:
+                        logger.warning(f"couldn't notify the owner of a download: {e!r}", owner_id=owner_id)
+
+    async def run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except transmission_error.TransmissionError as e:
+                logger.warning(f"completion watcher couldn't refresh downloads: {e}", watched=len(self.watched))
+            except Exception as e:
+                # it shares the bot's gather, a crash here would stop polling too
+                logger.exception(f"completion watcher tick failed: {e!r}", watched=len(self.watched))
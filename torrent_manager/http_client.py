@@ -0,0 +1,70 @@
+from dataclasses import dataclass, asdict
+from importlib.util import find_spec
+from httpx import AsyncClient, AsyncBaseTransport, Limits, Request
+from logger import logger
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    connections_opened: int = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened, 0)
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {"connections_reused": self.connections_reused}
+
+
+class PooledHttpClient:
+    """Lazily created httpx.AsyncClient shared between searchers, so keep-alive connections get reused"""
+
+    def __init__(self, timeout: float = 10, max_connections: int = 10, max_keepalive_connections: int = 5,
+                 keepalive_expiry: float = 30, http2: bool = False,
+                 transport: AsyncBaseTransport | None = None) -> None:
+        self.timeout = timeout
+        self.limits = Limits(max_connections=max_connections,
+                             max_keepalive_connections=max_keepalive_connections,
+                             keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and self._http2_available()
+        self.stats = ConnectionStats()
+        self._transport = transport
+        self._client: AsyncClient | None = None
+
+    def __repr__(self):
+        return f"PooledHttpClient(http2={self.http2}, limits={self.limits}, stats={self.stats})"
+
+    @staticmethod
+    def _http2_available() -> bool:
+        if find_spec("h2") is None:
+            logger.warning("http2 requested, but h2 package isn't installed. falling back to http/1.1")
+            return False
+        return True
+
+    @property
+    def client(self) -> AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2,
+                                       transport=self._transport,
+                                       event_hooks={"request": [self._track_request]})
+        return self._client
+
+    async def _track_request(self, request: Request) -> None:
+        self.stats.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.stats.connections_opened += 1
+
+    async def get(self, url: str, **kwargs):
+        return await self.client.get(url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.client.post(url, **kwargs)
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.debug("http client closed", **self.stats.to_dict())
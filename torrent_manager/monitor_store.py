@@ -0,0 +1,177 @@
+from abc import ABC, abstractmethod
+from typing import Hashable
+import json
+import os
+import sqlite3
+import threading
+from uuid import uuid4
+from logger import logger
+
+
+class MonitorStore(ABC):
+    @abstractmethod
+    def load(self) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def upsert(self, settings: list[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, uuids: list[str]) -> None:
+        ...
+
+    def fingerprint(self) -> Hashable | None:
+        # changes whenever the stored data could have changed; None means changes can't be detected
+        return None
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _assign_missing_uuids(settings: list[dict]) -> bool:
+        missing_uuids = [setting for setting in settings if not setting.get("uuid")]
+        for setting in missing_uuids:
+            setting["uuid"] = str(uuid4())
+        return bool(missing_uuids)
+
+
+class JsonMonitorStore(MonitorStore):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._rows: dict[str, dict] = {}
+
+    def __repr__(self):
+        return f"JsonMonitorStore(path={self.path})"
+
+    def load(self) -> list[dict]:
+        if not os.path.exists(self.path):
+            self._write([])
+        with open(self.path, "r") as f:
+            settings = json.load(f)
+        if self._assign_missing_uuids(settings):
+            self._write(settings)
+        self._rows = {setting["uuid"]: setting for setting in settings}
+        return settings
+
+    def upsert(self, settings: list[dict]) -> None:
+        for setting in settings:
+            self._rows[setting["uuid"]] = setting
+        self._write(list(self._rows.values()))
+
+    def delete(self, uuids: list[str]) -> None:
+        for uuid in uuids:
+            self._rows.pop(uuid, None)
+        self._write(list(self._rows.values()))
+
+    def fingerprint(self) -> Hashable | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _write(self, settings: list[dict]) -> None:
+        # write next to the target and swap, so a crash never leaves a truncated file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(settings, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class SqliteMonitorStore(MonitorStore):
+    # PRAGMA user_version once the json settings have been imported
+    _json_imported_version = 1
+
+    def __init__(self, path: str, json_import_path: str = "") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS monitors (
+                    uuid TEXT PRIMARY KEY,
+                    owner_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                )""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS monitors_owner_id ON monitors (owner_id)")
+        if json_import_path:
+            self.import_json(json_import_path)
+
+    def __repr__(self):
+        return f"SqliteMonitorStore(path={self.path})"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM monitors").fetchone()[0]
+
+    def load(self) -> list[dict]:
+        with self._lock:
+            rows = self._connection.execute("SELECT data FROM monitors ORDER BY position").fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def load_by_owner_id(self, owner_id: int) -> list[dict]:
+        with self._lock:
+            rows = self._connection.execute("SELECT data FROM monitors WHERE owner_id = ? ORDER BY position",
+                                            (owner_id,)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def upsert(self, settings: list[dict]) -> None:
+        if not settings:
+            return
+        with self._lock, self._connection:
+            next_position = self._connection.execute(
+                "SELECT COALESCE(MAX(position), 0) + 1 FROM monitors").fetchone()[0]
+            self._connection.executemany("""
+                INSERT INTO monitors (uuid, owner_id, position, data) VALUES (?, ?, ?, ?)
+                ON CONFLICT (uuid) DO UPDATE SET owner_id = excluded.owner_id, data = excluded.data""",
+                                         ((setting["uuid"], setting["owner_id"], next_position + i, json.dumps(setting))
+                                          for i, setting in enumerate(settings)))
+
+    def delete(self, uuids: list[str]) -> None:
+        if not uuids:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM monitors WHERE uuid = ?", ((uuid,) for uuid in uuids))
+
+    def fingerprint(self) -> Hashable | None:
+        # data_version only changes on commits made by other connections
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def import_json(self, json_path: str) -> int:
+        # only ever once: after that an empty table means the monitors were deleted, not that they're missing
+        with self._lock:
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] >= self._json_imported_version:
+                return 0
+        settings = []
+        if not len(self) and os.path.exists(json_path):
+            with open(json_path, "r") as f:
+                settings = json.load(f)
+            self._assign_missing_uuids(settings)
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO monitors (uuid, owner_id, position, data) VALUES (?, ?, ?, ?)",
+                ((setting["uuid"], setting["owner_id"], position, json.dumps(setting))
+                 for position, setting in enumerate(settings, start=1)))
+            self._connection.execute(f"PRAGMA user_version = {self._json_imported_version}")
+        if settings:
+            logger.info("imported monitor settings from json", json_path=json_path, imported=len(settings))
+        return len(settings)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def create_monitor_store(store_type: str, json_path: str, sqlite_path: str) -> MonitorStore:
+    match store_type:
+        case "json" | "":
+            return JsonMonitorStore(json_path)
+        case "sqlite":
+            return SqliteMonitorStore(sqlite_path, json_import_path=json_path)
+        case provided_type:
+            raise ValueError(f"dont recognize the monitor store type {provided_type}")
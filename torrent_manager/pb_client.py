@@ -1,24 +1,148 @@
-from httpx import AsyncClient, ReadTimeout
+from abc import ABC, abstractmethod
+from httpx import Response, TransportError
+import asyncio
 import json
-from dataclasses import dataclass
+import re
+import time
+import heapq
+from typing import Callable, Iterable, Iterator
+from functools import cached_property
+from urllib.parse import urlsplit
 from uuid import uuid4
 from logger import logger
+from metrics import metrics
+from tracing import tracer
+from torrent_manager.http_client import PooledHttpClient
+from torrent_manager.single_flight import SingleFlight
+from torrent_manager.search_cache import SearchCache
+from torrent_manager.providers import TorrentDetails, SearchProvider, ProviderFanOut
+from torrent_manager.resilience import TokenBucket, RetryPolicy, CircuitBreaker, SearchUnavailableError
+from config import SEARCH_CACHE_TTL, SEARCH_CACHE_EMPTY_TTL, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES, \
+    SEARCH_RATE_LIMIT, SEARCH_RATE_BURST, SEARCH_RETRY_ATTEMPTS, SEARCH_RETRY_BASE_DELAY, \
+    SEARCH_BREAKER_THRESHOLD, SEARCH_BREAKER_RECOVERY, SEARCH_PROVIDERS, SEARCH_DEADLINE
 
+search_request_duration = metrics.histogram("apibay_request_duration_seconds", "Latency of apibay search requests",
+                                            ("status",))
+search_cache_lookups = metrics.counter("search_cache_lookups_total", "Search cache lookups", ("result",))
+search_rows_returned = metrics.counter("search_rows_returned_total", "Rows returned by apibay searches")
+search_errors = metrics.counter("search_errors_total", "Failed apibay searches", ("reason",))
+# per-search debug records, the logtail sink keeps only a LOG_DEBUG_SAMPLE_RATE share of them
+search_logger = logger.bind(sampled=True)
 
-@dataclass
-class TorrentDetails:
-    name: str
-    link: str
-    size_gb: float
-    seeds: int
-    status: str
-    info_hash: str
 
-# TODO: add an ABC class for monitor with look() abstr method, make general class not aware of data provider
+class ApibayProvider(SearchProvider):
+    """apibay.org or any mirror serving the same api. Every host has its own rate limit and circuit breaker."""
 
+    def __init__(self, host: str = "https://apibay.org", rate_limiter: TokenBucket | None = None,
+                 retry_policy: RetryPolicy | None = None, circuit_breaker: CircuitBreaker | None = None) -> None:
+        self.host = host.rstrip("/")
+        self.name = urlsplit(self.host).hostname or self.host
+        self.rate_limiter = rate_limiter or TokenBucket(rate=SEARCH_RATE_LIMIT, capacity=SEARCH_RATE_BURST)
+        self.retry_policy = retry_policy or RetryPolicy(attempts=SEARCH_RETRY_ATTEMPTS,
+                                                        base_delay=SEARCH_RETRY_BASE_DELAY)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(failure_threshold=SEARCH_BREAKER_THRESHOLD,
+                                                                 recovery_timeout=SEARCH_BREAKER_RECOVERY)
 
-class PBSearcher:
-    _search_host = "https://apibay.org/q.php"
+    def __repr__(self):
+        return f"ApibayProvider(host={self.host}, circuit_breaker={self.circuit_breaker})"
+
+    @property
+    def retry_after(self) -> float:
+        return self.circuit_breaker.retry_after
+
+    def retry_budget(self, request_timeout: float) -> float:
+        return self.retry_policy.budget(request_timeout)
+
+    def record_timeout(self) -> None:
+        # cut off mid-retry, _get_with_retries never got to count the failure
+        search_errors.inc(reason="deadline")
+        self.circuit_breaker.record_failure()
+
+    @property
+    def search_url(self) -> str:
+        return self.host + "/q.php"
+
+    async def search(self, query: str, http_client: PooledHttpClient) -> list[dict] | None:
+        return await self._fetch_rows(query, http_client)
+
+    @tracer.traced("apibay.rate_limit")
+    async def _wait_for_rate_limit(self) -> None:
+        await self.rate_limiter.acquire()
+
+    @staticmethod
+    def _is_transient(r: Response) -> bool:
+        return r.status_code == 429 or r.status_code >= 500
+
+    @staticmethod
+    def _retry_after(r: Response) -> float:
+        try:
+            return float(r.headers.get("Retry-After", 0))
+        except ValueError:
+            return 0
+
+    async def _get_with_retries(self, query: str, http_client: PooledHttpClient) -> Response:
+        if not self.circuit_breaker.allow_request():
+            search_errors.inc(reason="circuit_open")
+            raise SearchUnavailableError("search host is unhealthy, search skipped", self.circuit_breaker.retry_after)
+        retry_delays = self.retry_policy.delays()
+        while True:
+            await self._wait_for_rate_limit()
+            search_logger.debug("running search_torrent query={query!r}", query=query, provider=self.name)
+            retry_after = 0
+            started_at = time.perf_counter()
+            try:
+                with tracer.span("apibay.request"):
+                    r = await http_client.get(self.search_url, params={"q": query})
+                search_request_duration.observe(time.perf_counter() - started_at, status=r.status_code)
+                if not self._is_transient(r):
+                    self.circuit_breaker.record_success()
+                    return r
+                failure, retry_after = f"status code {r.status_code}", self._retry_after(r)
+            except TransportError as e:
+                search_request_duration.observe(time.perf_counter() - started_at, status=type(e).__name__)
+                failure = repr(e)
+            if (delay := next(retry_delays, None)) is None:
+                search_errors.inc(reason="unavailable")
+                self.circuit_breaker.record_failure()
+                logger.warning("external host unavailable, giving up", query=query, failure=failure,
+                               provider=self.name)
+                raise SearchUnavailableError(f"search host unavailable: {failure}", self.circuit_breaker.retry_after)
+            delay = max(delay, min(retry_after, self.retry_policy.max_delay))
+            logger.warning("transient error from external host, retrying", query=query, failure=failure, delay=delay,
+                           provider=self.name)
+            await asyncio.sleep(delay)
+
+    async def _fetch_rows(self, query: str, http_client: PooledHttpClient) -> list[dict] | None:
+        r = await self._get_with_retries(query, http_client)
+        if (status_code := r.status_code) != 200:
+            logger.warning("error from external host", query=query, status_code=status_code, provider=self.name)
+            search_errors.inc(reason=f"status_{status_code}")
+            return
+        with tracer.span("apibay.parse"):
+            search_rows = json.loads(r.content)
+        search_rows_returned.inc(len(search_rows))
+        search_logger.debug("search_torrent ran", query=query, results_len=len(search_rows), provider=self.name)
+        if len(search_rows) == 1 and \
+                search_rows[0]["name"] == "No results returned":
+            return []
+        return search_rows
+
+
+class Monitor(ABC):
+    """A saved search, looking for a release it hasn't found yet. Doesn't know which providers serve the results."""
+    uuid: str
+    monitor_type: str
+
+    @abstractmethod
+    async def look(self) -> TorrentDetails | None:
+        ...
+
+    @abstractmethod
+    def to_dict(self) -> dict:
+        ...
+
+
+class PBSearcher(Monitor):
     _details_page_prefix = "https://thepiratebay.org/description.php?id="
     _trackers_list = [
         "udp://tracker.coppersurfer.tk:6969/announce",
@@ -33,10 +157,20 @@ class PBSearcher:
         "udp://open.stealth.si:80/announce",
     ]
 
-    def __init__(self, default_query: str = "", uuid: str = "") -> None:
+    http_client: PooledHttpClient = PooledHttpClient()
+    in_flight_searches: SingleFlight = SingleFlight()
+    search_cache: SearchCache = SearchCache(ttl=SEARCH_CACHE_TTL, empty_ttl=SEARCH_CACHE_EMPTY_TTL,
+                                            max_entries=SEARCH_CACHE_MAX_ENTRIES, max_bytes=SEARCH_CACHE_MAX_BYTES)
+    # shared by every searcher, each provider sees a single client
+    search_providers: ProviderFanOut = ProviderFanOut([ApibayProvider(host) for host in SEARCH_PROVIDERS.split(",")],
+                                                      deadline=SEARCH_DEADLINE)
+
+    def __init__(self, default_query: str = "", uuid: str = "", http_client: PooledHttpClient | None = None) -> None:
         self.default_query = default_query
         self.monitor_type = "movie"
         self.uuid = uuid or str(uuid4())
+        if http_client:
+            self.http_client = http_client
 
     def __repr__(self):
         return f"PBSearcher(default_query={self.default_query}, uuid={self.uuid})"
@@ -47,6 +181,11 @@ class PBSearcher:
     def to_dict(self) -> dict:
         return {"monitor_type": self.monitor_type, "default_query": self.default_query, "uuid": self.uuid}
 
+    @cached_property
+    def _log(self):
+        # the message and the monitor fields are only built for records that some sink accepts
+        return logger.patch(lambda record: record["extra"].update(self.to_dict())).opt(lazy=True)
+
     @classmethod
     def generate_magnet_link(cls, torrent_details: TorrentDetails) -> str:
         trackers_list_formatted = "&tr=".join([""] + cls._trackers_list)
@@ -54,46 +193,73 @@ class PBSearcher:
             {torrent_details.name}{trackers_list_formatted}"
         return link
 
-    async def search_torrent(self, query: str = "") -> list[TorrentDetails]:
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    async def search_torrent(self, query: str = "", limit: int | None = None,
+                             where: Callable[[TorrentDetails], bool] | None = None,
+                             bypass_cache: bool = False) -> list[TorrentDetails]:
         if not query:
             query = self.default_query
-        logger.debug(f"running search_torrent {query=}", {"query": query})
-        try:
-            async with AsyncClient(timeout=10) as client:
-                r = await client.get(self._search_host, params={"q": query})
-        except ReadTimeout:
-            logger.warning("timeout waiting response from external host", query=query)
+        query = self.normalize_query(query)
+        if not bypass_cache and (cached_rows := self.search_cache.get(query)) is not None:
+            search_logger.debug("search_torrent cache hit", query=query)
+            search_cache_lookups.inc(result="hit")
+            return self._select_top(cached_rows, limit, where)
+        search_cache_lookups.inc(result="miss")
+        search_rows = await self.in_flight_searches.do(query, lambda: self._search_providers(query))
+        if search_rows is None:
             return []
-        if (status_code := r.status_code) != 200:
-            logger.warning("error from external host", query=query, status_code=status_code)
-            return []
-        search_results = json.loads(r.text)
-        logger.debug("search_torrent ran", query=query, results_len=len(search_results))
-        if len(search_results) == 1 and \
-                search_results[0]["name"] == "No results returned":
-            return []
-        search_results_formatted = (TorrentDetails(
-            name=result["name"],
-            link=self._details_page_prefix + result["id"],
-            size_gb=int(result["size"]) / 8**10,
-            seeds=int(result["seeders"]),
-            status=result["status"],
-            info_hash=result["info_hash"]
-        ) for result in search_results)
-        search_results_formatted = sorted(
-            search_results_formatted, key=lambda x: x.seeds, reverse=True)
-        return search_results_formatted
+        return self._select_top(search_rows, limit, where)
+
+    async def _search_providers(self, query: str) -> list[dict] | None:
+        fan_out = await self.search_providers.search(query, self.http_client)
+        if fan_out.rows is not None:
+            # the providers that didn't answer may list more, so a partial answer is kept only briefly
+            self.search_cache.set(query, fan_out.rows, ttl=self.search_cache.empty_ttl if fan_out.failed else None)
+        return fan_out.rows
+
+    def _row_to_details(self, row: dict) -> TorrentDetails:
+        return TorrentDetails(
+            name=row["name"],
+            link=self._details_page_prefix + row["id"],
+            size_gb=int(row["size"]) / 8**10,
+            seeds=int(row["seeders"]),
+            status=row["status"],
+            info_hash=row["info_hash"]
+        )
+
+    def _parse_rows(self, rows: Iterable[dict]) -> Iterator[TorrentDetails]:
+        return map(self._row_to_details, rows)
+
+    @tracer.traced("select_top")
+    def _select_top(self, rows: list[dict], limit: int | None = None,
+                    where: Callable[[TorrentDetails], bool] | None = None) -> list[TorrentDetails]:
+        if where is None and limit is not None:
+            # only the selected rows get turned into TorrentDetails
+            top_rows = heapq.nlargest(limit, rows, key=lambda row: int(row["seeders"]))
+            return list(self._parse_rows(top_rows))
+        search_results = self._parse_rows(rows)
+        if where is not None:
+            search_results = filter(where, search_results)
+        if limit is None:
+            return sorted(search_results, key=lambda x: x.seeds, reverse=True)
+        return heapq.nlargest(limit, search_results, key=lambda x: x.seeds)
 
     async def look(self) -> TorrentDetails | None:
-        logger.info(f"Monitor running: {self}", **self.to_dict())
-        if result := await self.search_torrent(self.default_query):
-            logger.success(f"Monitor {self} found results", **self.to_dict())
+        self._log.info("Monitor running: {}", self.__str__)
+        if result := await self.search_torrent(self.default_query, limit=1):
+            self._log.success("Monitor {} found results", self.__str__)
             return result[0]
 
 
 class PBMonitor(PBSearcher):
+    _episode_pattern = re.compile(r"s(\d{1,2})[ ._-]?e(\d{1,3})", re.IGNORECASE)
+
     def __init__(self, show_name: str, season_number: int, episode_number: int,
-                 uuid: str = "", size_limit_gb: float = 0, only_vips=False):
+                 uuid: str = "", size_limit_gb: float = 0, only_vips=False,
+                 http_client: PooledHttpClient | None = None):
         self.monitor_type = "show"
         self.show_name = show_name
         self.season_number = season_number
@@ -103,6 +269,8 @@ class PBMonitor(PBSearcher):
         self.whitelisted_statuses = (
             "vip",) if self.only_vips else ("vip", "trusted")
         self.uuid = uuid or str(uuid4())
+        if http_client:
+            self.http_client = http_client
 
     def __repr__(self):
         fields_str = ", ".join((f"{key}={val}" for key, val in self.to_dict().items()
@@ -135,27 +303,55 @@ class PBMonitor(PBSearcher):
     def default_query(self) -> str:
         return f"{self.show_name} s{self.season_number:02d}e{self.episode_number:02d}"
 
+    @property
+    def season_query(self) -> str:
+        return f"{self.show_name} s{self.season_number:02d}"
+
     async def _search_episode(self) -> list[TorrentDetails]:
         search_query = self.default_query
-        return await self.search_torrent(search_query)
+        return await self.search_torrent(search_query, limit=1, where=self._is_acceptable)
+
+    def _is_acceptable(self, download: TorrentDetails) -> bool:
+        if self.size_limit_gb and download.size_gb > self.size_limit_gb:
+            return False
+        return download.status in self.whitelisted_statuses
 
     async def _find_new_episode(self) -> TorrentDetails | None:
         available_downloads = await self._search_episode()
         if not available_downloads:
             return
-        if self.size_limit_gb:
-            available_downloads = filter(
-                lambda x: x.size_gb <= self.size_limit_gb, available_downloads)
-        available_downloads = filter(
-            lambda x: x.status in self.whitelisted_statuses, available_downloads)
-        try:
-            new_episode = next(available_downloads)
-            logger.success(f"Monitor {self}: found new episode", **self.to_dict())
+        new_episode = available_downloads[0]
+        self._log.success("Monitor {}: found new episode", self.__str__)
+        self.episode_number += 1
+        return new_episode
+
+    @tracer.traced("group_by_episode")
+    def _group_by_episode(self, available_downloads: Iterable[TorrentDetails]) -> dict[int, TorrentDetails]:
+        episodes: dict[int, TorrentDetails] = {}
+        for download in available_downloads:
+            if not (match := self._episode_pattern.search(download.name)):
+                continue
+            season, episode = map(int, match.groups())
+            if season == self.season_number:
+                episodes.setdefault(episode, download)  # results are sorted by seeds, so the first one is the best
+        return episodes
+
+    async def _find_new_episodes(self) -> list[TorrentDetails]:
+        available_downloads = await self.search_torrent(self.season_query, where=self._is_acceptable)
+        episodes = self._group_by_episode(available_downloads)
+        new_episodes = []
+        while (new_episode := episodes.get(self.episode_number)) is not None:
+            new_episodes.append(new_episode)
             self.episode_number += 1
-            return new_episode
-        except StopIteration:
-            return
+        if new_episodes:
+            self._log.success("Monitor {}: found {} new episodes in season", self.__str__,
+                              new_episodes.__len__)
+        return new_episodes
 
     async def look(self) -> TorrentDetails | None:
-        logger.info(f"Monitor running: {self}", **self.to_dict())
+        self._log.info("Monitor running: {}", self.__str__)
         return await self._find_new_episode()
+
+    async def look_season(self) -> list[TorrentDetails]:
+        self._log.info("Monitor running season lookup: {}", self.__str__)
+        return await self._find_new_episodes()
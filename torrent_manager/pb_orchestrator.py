@@ -1,17 +1,34 @@
-from typing import Iterable
+from typing import Any, Awaitable, Callable, Iterable
 import os
+import time
 from dataclasses import dataclass
-import json
-from torrent_manager.pb_client import PBSearcher, PBMonitor, TorrentDetails
+from torrent_manager.pb_client import PBSearcher, PBMonitor, TorrentDetails, Monitor
+from torrent_manager.http_client import PooledHttpClient
+from torrent_manager.monitor_store import MonitorStore, JsonMonitorStore
+from torrent_manager.polling_policy import PollingPolicy
+from torrent_manager.resilience import SearchUnavailableError
 from logger import logger
+from metrics import metrics
+from tracing import tracer
 import asyncio
 
+iteration_duration = metrics.histogram("monitor_iteration_duration_seconds", "Duration of monitor search iterations",
+                                       buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+monitor_checks = metrics.counter("monitor_checks_total", "Monitor checks by outcome", ("outcome",))
+# what a job returns when the monitor wasn't checked, it's postponed rather than counted as a miss
+unchecked_results = (SearchUnavailableError, asyncio.TimeoutError)
+
 
 @dataclass
 class MonitorSetting:
     owner_id: int
-    searcher: PBSearcher | PBMonitor  # TODO: definitely add interface
+    searcher: Monitor
     silent: bool = True
+    last_checked: float = 0
+    # find history, drives adaptive polling intervals
+    misses: int = 0
+    last_release: float = 0
+    find_cadence: float = 0
 
 
 @dataclass
@@ -25,58 +42,121 @@ class JobResult:
 
 
 class MonitorOrchestrator:
-    def __init__(self, monitor_settings_path: str = "") -> None:
-        self._monitor_settings_path = monitor_settings_path or \
-            os.path.join(os.getcwd(), "data", "monitor_settings.json")
-        self._settings: list[MonitorSetting] = []
-        self._update_monitor_settings_from_json()
+    def __init__(self, monitor_settings_path: str = "", http_client: PooledHttpClient | None = None,
+                 concurrency: int = 16, job_timeout: float = 60, iteration_deadline: float = 300,
+                 season_batch: bool = False, store: MonitorStore | None = None,
+                 clock: Callable[[], float] = time.time, polling_policy: PollingPolicy | None = None) -> None:
+        if store is None:
+            store = JsonMonitorStore(monitor_settings_path or
+                                     os.path.join(os.getcwd(), "data", "monitor_settings.json"))
+        self._store = store
+        self._http_client = http_client
+        self.concurrency = concurrency
+        self.job_timeout = job_timeout
+        self.iteration_deadline = iteration_deadline
+        self.season_batch = season_batch
+        self.clock = clock
+        self.polling_policy = polling_policy
+        # scheduled runs and the ones triggered by users mustn't search and save the same monitors at once
+        self._run_lock = asyncio.Lock()
+        # monotonic time the last job finished, shows a long run is still moving
+        self.progressed_at: float | None = None
+        self._settings_by_uuid: dict[str, MonitorSetting] = {}
+        self._settings_by_owner: dict[int, dict[str, MonitorSetting]] = {}
+        self._store_fingerprint = None
+        self._update_monitor_settings_from_store()
+
+    def get_user_monitors(self, uid: int | None) -> list[MonitorSetting]:
+        if uid is None:
+            return []
+        return list(self._settings_by_owner.get(int(uid), {}).values())
+
+    def _index_setting(self, setting: MonitorSetting) -> None:
+        uuid = setting.searcher.uuid
+        indexed_setting = self._settings_by_uuid.get(uuid)
+        if indexed_setting is not None and int(indexed_setting.owner_id) != int(setting.owner_id):
+            self._unindex_setting(indexed_setting)
+        self._settings_by_uuid[uuid] = setting
+        self._settings_by_owner.setdefault(int(setting.owner_id), {})[uuid] = setting
 
-    def get_user_monitors(self, uid: int) -> list[MonitorSetting]:
-        return [monitor for monitor in self._settings if str(monitor.owner_id) == str(uid)]
+    def _unindex_setting(self, setting: MonitorSetting) -> None:
+        uuid = setting.searcher.uuid
+        self._settings_by_uuid.pop(uuid, None)
+        owner_settings = self._settings_by_owner.get(int(setting.owner_id), {})
+        owner_settings.pop(uuid, None)
+        if not owner_settings:
+            self._settings_by_owner.pop(int(setting.owner_id), None)
 
-    def _update_monitor_settings_from_json(self) -> None:
-        if not os.path.exists(self._monitor_settings_path):
-            with open(self._monitor_settings_path, "w") as f:
-                f.write("[]")
+    def _update_monitor_settings_from_store(self) -> None:
+        self._store_fingerprint = self._store.fingerprint()
+        settings = self._store.load()
+        loaded_uuids = set()
+        for setting_dict in settings:
+            loaded_uuids.add(uuid := setting_dict["uuid"])
+            indexed_setting = self._settings_by_uuid.get(uuid)
+            if indexed_setting is not None and self._setting_to_dict(indexed_setting) == setting_dict:
+                continue
+            self._index_setting(self._dict_to_setting(setting_dict, self._http_client))
+        for uuid in self._settings_by_uuid.keys() - loaded_uuids:
+            self._unindex_setting(self._settings_by_uuid[uuid])
 
-        with open(self._monitor_settings_path, "r") as f:
-            settings = json.load(f)
-            self._settings = [self._dict_to_setting(setting) for setting in settings]
+    def _reload_if_changed(self) -> None:
+        fingerprint = self._store.fingerprint()
+        if fingerprint is not None and fingerprint != self._store_fingerprint:
+            logger.opt(lazy=True).debug("monitor store changed on disk, reloading", store=self._store.__repr__)
+            self._update_monitor_settings_from_store()
 
     @staticmethod
-    def _dict_to_setting(setting: dict) -> MonitorSetting:
+    def _dict_to_setting(setting: dict, http_client: PooledHttpClient | None = None) -> MonitorSetting:
         match setting["monitor_type"]:
             case "show":
                 return MonitorSetting(
                     owner_id=setting["owner_id"],
                     silent=setting.get("silent", True),
+                    **MonitorOrchestrator._history_from_dict(setting),
                     searcher=PBMonitor(
                         show_name=setting["name"],
                         season_number=setting["season"],
                         episode_number=setting["episode"],
                         size_limit_gb=setting.get("size_limit", 0),
-                        uuid=setting.get("uuid", "")
+                        uuid=setting.get("uuid", ""),
+                        http_client=http_client
                     )
                 )
             case "movie":
                 return MonitorSetting(
                     owner_id=setting["owner_id"],
                     silent=setting.get("silent", True),
+                    **MonitorOrchestrator._history_from_dict(setting),
                     searcher=PBSearcher(
                         default_query=setting["name"],
-                        uuid=setting.get("uuid", "")
+                        uuid=setting.get("uuid", ""),
+                        http_client=http_client
                     )
                 )
             case provided_type:
                 raise ValueError(f"dont recognize the type {provided_type} of the monitor")
 
+    @staticmethod
+    def _history_from_dict(setting: dict) -> dict:
+        return {
+            "last_checked": setting.get("last_checked", 0),
+            "misses": setting.get("misses", 0),
+            "last_release": setting.get("last_release", 0),
+            "find_cadence": setting.get("find_cadence", 0),
+        }
+
     @staticmethod
     def _setting_to_dict(setting: MonitorSetting) -> dict:
         setting_obj = {
             "owner_id": setting.owner_id,
             "silent": setting.silent,
             "monitor_type": setting.searcher.monitor_type,
-            "uuid": setting.searcher.uuid
+            "uuid": setting.searcher.uuid,
+            "last_checked": setting.last_checked,
+            "misses": setting.misses,
+            "last_release": setting.last_release,
+            "find_cadence": setting.find_cadence
         }
         match setting.searcher.monitor_type:
             case "movie":
@@ -89,48 +169,150 @@ class MonitorOrchestrator:
 
         return setting_obj
 
-    def _save_settings(self) -> None:
-        with open(self._monitor_settings_path, 'w') as f:
-            settings_json = list(map(self._setting_to_dict, self._settings))
-            json.dump(settings_json, f, indent=2)
+    @tracer.traced("save_settings")
+    async def _save_settings(self, changed: Iterable[MonitorSetting] = (), deleted: Iterable[MonitorSetting] = ()) \
+            -> None:
+        changed_settings = [self._setting_to_dict(setting) for setting in changed]
+        deleted_uuids = [setting.searcher.uuid for setting in deleted]
+        if changed_settings:
+            await asyncio.to_thread(self._store.upsert, changed_settings)
+        if deleted_uuids:
+            await asyncio.to_thread(self._store.delete, deleted_uuids)
+        if changed_settings or deleted_uuids:
+            self._store_fingerprint = self._store.fingerprint()
 
     def get_monitor_by_uuid(self, uuid) -> MonitorSetting | None:
-        return next((j for j in self._settings if j.searcher.uuid == uuid), None)
+        return self._settings_by_uuid.get(uuid)
 
     async def add_monitor_job(self, setting: MonitorSetting, run_after_init) -> list[JobResult]:
-        self._settings.append(setting)
-        self._save_settings()
-        # TODO: refactor self._settings into subscribable, so this function wouldn't have to return anything
+        self._index_setting(setting)
+        await self._save_settings(changed=[setting])
+        # TODO: refactor settings registry into subscribable, so this function wouldn't have to return anything
         if run_after_init:
             return await self.run_search_jobs([setting])
         return []
 
-    def delete_monitor_job(self, job) -> None:
-        self._settings.remove(job)
-        self._save_settings()
+    async def delete_monitor_job(self, job) -> None:
+        self._unindex_setting(job)
+        await self._save_settings(deleted=[job])
 
     async def add_monitor_job_from_dict(self, settings_dict: dict, run_after_init: bool = True) -> list[JobResult]:
-        settings = self._dict_to_setting(settings_dict)
+        settings = self._dict_to_setting(settings_dict, self._http_client)
         return await self.add_monitor_job(settings, run_after_init)
 
     def get_jobs_by_owner_id(self, owner_id) -> Iterable[MonitorSetting]:
-        self._update_monitor_settings_from_json()
-        jobs_filtered = (s for s in self._settings
-                         if s.owner_id == owner_id)
-        return jobs_filtered
+        self._reload_if_changed()
+        return self.get_user_monitors(owner_id)
+
+    def get_all_jobs(self) -> list[MonitorSetting]:
+        self._reload_if_changed()
+        return list(self._settings_by_uuid.values())
+
+    def next_check_interval(self, setting: MonitorSetting) -> float | None:
+        if self.polling_policy is None:
+            return None
+        return self.polling_policy.next_interval(setting.last_checked, setting.misses, setting.last_release,
+                                                 setting.find_cadence)
+
+    @staticmethod
+    def search_retry_after() -> float:
+        return PBSearcher.search_providers.retry_after
+
+    def _record_check(self, setting: MonitorSetting, found: bool, previous_check: float) -> None:
+        monitor_checks.inc(outcome="found" if found else "miss")
+        if not found:
+            setting.misses += 1
+            return
+        # whatever was found got released somewhere between the previous check and this one
+        release = (previous_check + setting.last_checked) / 2 if previous_check else setting.last_checked
+        if setting.last_release and self.polling_policy is not None:
+            setting.find_cadence = self.polling_policy.next_cadence(setting.find_cadence,
+                                                                    release - setting.last_release)
+        setting.last_release = release
+        setting.misses = 0
+
+    @staticmethod
+    def _look(job: MonitorSetting) -> Awaitable[Any]:
+        return job.searcher.look()
+
+    async def _run_job(self, job: MonitorSetting, semaphore: asyncio.Semaphore,
+                       look: Callable[[MonitorSetting], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            try:
+                # the query is formatted only when the span is actually recorded
+                with tracer.span("monitor", uuid=job.searcher.uuid, query=lambda: job.searcher.default_query):
+                    return await asyncio.wait_for(look(job), self.job_timeout)
+            except asyncio.TimeoutError as e:
+                logger.warning("monitor timed out", uuid=job.searcher.uuid, timeout=self.job_timeout)
+                # not a miss either, the search never got to answer
+                return e
+            except SearchUnavailableError as e:
+                # not a miss: the monitor wasn't checked at all
+                return e
+            except Exception as e:
+                logger.error(f"monitor failed: {e!r}", uuid=job.searcher.uuid)
+            finally:
+                self.progressed_at = time.monotonic()
+
+    async def _run_jobs_concurrently(self, jobs: list[MonitorSetting],
+                                     look: Callable[[MonitorSetting], Awaitable[Any]] = _look) -> list[Any]:
+        if not jobs:
+            return []
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._run_job(job, semaphore, look)) for job in jobs]
+        done, pending = await asyncio.wait(tasks, timeout=self.iteration_deadline)
+        if pending:
+            logger.warning("search iteration deadline reached, returning partial results",
+                           finished=len(done), cancelled=len(pending), deadline=self.iteration_deadline)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return [task.result() if task in done else asyncio.TimeoutError() for task in tasks]
+
+    def _split_postponed(self, jobs: list[MonitorSetting], results: list[Any]) \
+            -> tuple[list[tuple[MonitorSetting, Any]], list[MonitorSetting]]:
+        checked = [(job, result) for job, result in zip(jobs, results) if not isinstance(result, unchecked_results)]
+        postponed = [job for job, result in zip(jobs, results) if isinstance(result, unchecked_results)]
+        unavailable = sum(isinstance(result, SearchUnavailableError) for result in results)
+        monitor_checks.inc(unavailable, outcome="postponed")
+        monitor_checks.inc(len(postponed) - unavailable, outcome="timed_out")
+        if unavailable:
+            logger.warning("search host unavailable, monitors postponed", postponed=unavailable,
+                           retry_after=self.search_retry_after())
+        if len(postponed) > unavailable:
+            logger.warning("monitors timed out, postponed", postponed=len(postponed) - unavailable)
+        return checked, postponed
+
+    async def _run_iteration(self, jobs: list[MonitorSetting]) -> tuple[list[JobResult], list[MonitorSetting]]:
+        checked_at = self.clock()
+        with iteration_duration.time(), tracer.span("iteration", jobs=len(jobs)):
+            checked, postponed_jobs = self._split_postponed(jobs, await self._run_jobs_concurrently(jobs))
+        for job, _ in checked:
+            job.last_checked = checked_at
+        jobs_with_results = [JobResult(result, job) for job, result in checked if result]
+        done_jobs = [j.job_settings for j in jobs_with_results
+                     if j.job_settings.searcher.monitor_type == "movie"]
+        for job in done_jobs:
+            self._unindex_setting(job)
+        # every job that is still monitored gets its last_checked persisted, not only the ones that found something
+        checked_jobs = [job for job, _ in checked if self._settings_by_uuid.get(job.searcher.uuid) is job]
+        await self._save_settings(changed=checked_jobs, deleted=done_jobs)
+        return jobs_with_results, postponed_jobs
 
     async def run_search_job_iteration(self, jobs_to_run: Iterable[MonitorSetting] | None = None, owner_id=None) \
             -> list[JobResult]:
-        eligible_jobs = jobs_to_run or self.get_jobs_by_owner_id(owner_id)
-        # TODO: just gather and then map
-        jobs_with_results = [JobResult(result, job)
-                             for job in eligible_jobs
-                             if (result := await asyncio.gather(job.searcher.look()))]
-        done_jobs = (j for j in jobs_with_results
-                     if j.job_settings.searcher.monitor_type == "movie")
-        for job in done_jobs:
-            self.delete_monitor_job(job.job_settings)
-        self._save_settings()
+        eligible_jobs = list(jobs_to_run or self.get_jobs_by_owner_id(owner_id))
+        jobs_with_results, _ = await self._run_iteration(eligible_jobs)
+        return jobs_with_results
+
+    @tracer.traced("season_batch_iteration")
+    async def run_season_batch_iteration(self, jobs_to_run: list[MonitorSetting]) -> list[JobResult]:
+        results = await self._run_jobs_concurrently(jobs_to_run, lambda job: job.searcher.look_season())
+        results = [None if isinstance(result, unchecked_results) else result for result in results]
+        jobs_with_results = [JobResult(episode, job)
+                             for job, episodes in zip(jobs_to_run, results)
+                             for episode in episodes or []]
+        await self._save_settings(changed=[job for job, episodes in zip(jobs_to_run, results) if episodes])
         return jobs_with_results
 
     async def run_search_jobs(
@@ -138,21 +320,40 @@ class MonitorOrchestrator:
         jobs_to_run: Iterable[MonitorSetting] | None = None,
         owner_id: int = 0,
     ) -> list[JobResult]:
+        async with self._run_lock:
+            with tracer.run("monitor_run"):
+                return await self._run_search_jobs(jobs_to_run, owner_id)
+
+    async def _run_search_jobs(self, jobs_to_run: Iterable[MonitorSetting] | None, owner_id: int) -> list[JobResult]:
         logger.debug("running search jobs")
         jobs_with_results_all: list[JobResult] = []
+        jobs_to_run = list(jobs_to_run or self.get_jobs_by_owner_id(owner_id))
+        previous_checks = [job.last_checked for job in jobs_to_run]
 
-        if jobs_to_run:
-            iteration_result = await self.run_search_job_iteration(jobs_to_run)
-        else:
-            iteration_result = await self.run_search_job_iteration(owner_id=owner_id)
+        iteration_result, postponed_jobs = await self._run_iteration(jobs_to_run)
+        postponed_uuids = {job.searcher.uuid for job in postponed_jobs}
 
         while iteration_result:
             jobs_with_results_all.extend(iteration_result)
-            jobs_for_next_iteration = (
+            jobs_for_next_iteration = [
                 job.job_settings
                 for job in iteration_result
                 if job.job_settings.searcher.monitor_type == "show"
-            )
+            ]
+            if not jobs_for_next_iteration:
+                break
+            if self.season_batch:
+                # shows that are behind catch up with one season-wide query
+                jobs_with_results_all.extend(await self.run_season_batch_iteration(jobs_for_next_iteration))
+                break
             iteration_result = await self.run_search_job_iteration(jobs_for_next_iteration)
 
+        # history is recorded once per run, follow-up iterations of the same run aren't misses
+        found_uuids = {job.job_settings.searcher.uuid for job in jobs_with_results_all}
+        checked_jobs = []
+        for job, previous_check in zip(jobs_to_run, previous_checks):
+            if self._settings_by_uuid.get(job.searcher.uuid) is job and job.searcher.uuid not in postponed_uuids:
+                self._record_check(job, job.searcher.uuid in found_uuids, previous_check)
+                checked_jobs.append(job)
+        await self._save_settings(changed=checked_jobs)
         return jobs_with_results_all
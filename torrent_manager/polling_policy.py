@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+HOUR = 60 * 60
+
+
+@dataclass
+class PollingPolicy:
+    base_interval: float = 8 * HOUR
+    min_interval: float = HOUR
+    max_interval: float = 7 * 24 * HOUR
+    backoff_factor: float = 2
+    cadence_smoothing: float = 0.5
+
+    def clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def next_cadence(self, cadence: float, gap: float) -> float:
+        if gap < self.min_interval:
+            # several finds within one run (a backlog of episodes) say nothing about the air cadence
+            return cadence
+        if not cadence:
+            return gap
+        return self.cadence_smoothing * gap + (1 - self.cadence_smoothing) * cadence
+
+    def next_interval(self, last_checked: float, misses: int, last_release: float = 0, cadence: float = 0) -> float:
+        if not cadence:
+            if last_release:
+                # found once already, keep the base pace until a second find tells the cadence
+                return self.clamp(self.base_interval)
+            return self.clamp(self.base_interval * self.backoff_factor ** misses)
+        expected_at = last_release + cadence
+        if last_checked < expected_at:
+            # nothing to find before the next episode is expected to be released
+            return self.clamp(expected_at - last_checked)
+        # the episode is late: poll tightly at first, then back off as it gets more overdue.
+        # within one cadence it's likely just a late release, so never poll slower than the base interval;
+        # past that (e.g. a season break) the backoff is only bounded by max_interval
+        overdue = last_checked - expected_at
+        interval = self.clamp(overdue / self.backoff_factor)
+        return interval if overdue > cadence else min(interval, self.base_interval)
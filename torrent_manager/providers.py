@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import asyncio
+from logger import logger
+from metrics import metrics
+from torrent_manager.http_client import PooledHttpClient
+from torrent_manager.resilience import SearchUnavailableError
+
+provider_searches = metrics.counter("search_provider_results_total", "Searches sent to each data provider",
+                                    ("provider", "result"))
+
+
+@dataclass
+class TorrentDetails:
+    name: str
+    link: str
+    size_gb: float
+    seeds: int
+    status: str
+    info_hash: str
+
+
+class SearchProvider(ABC):
+    name: str = ""
+
+    @property
+    def retry_after(self) -> float:
+        # how long the provider is known to stay unreachable
+        return 0
+
+    def retry_budget(self, request_timeout: float) -> float:
+        # how long one search may take with its retries
+        return request_timeout
+
+    def record_timeout(self) -> None:
+        # the search missed the fan-out deadline and was cancelled
+        pass
+
+    @abstractmethod
+    async def search(self, query: str, http_client: PooledHttpClient) -> list[dict] | None:
+        # every result row for the query, in the apibay format (id, name, size, seeders, status, info_hash).
+        # None when the provider answered with an error, raises SearchUnavailableError when it can't be reached at all
+        ...
+
+
+@dataclass
+class FanOutResult:
+    rows: list[dict] | None
+    # providers that errored or missed the deadline, their results are missing
+    failed: list[str] = field(default_factory=list)
+    retry_after: float = 0
+
+
+class ProviderFanOut:
+    """Sends a query to every provider at once and merges what arrives before the deadline.
+    A release listed by several providers is kept once, with the best seed count any of them reported."""
+
+    def __init__(self, providers: list[SearchProvider], deadline: float = 50) -> None:
+        self.providers = providers
+        self.deadline = deadline
+
+    @property
+    def retry_after(self) -> float:
+        return min((provider.retry_after for provider in self.providers), default=0)
+
+    def __repr__(self):
+        return f"ProviderFanOut(providers={[provider.name for provider in self.providers]}, deadline={self.deadline})"
+
+    def check_deadline(self, request_timeout: float, job_timeout: float | None = None) -> bool:
+        """Warns about providers that can be cut off while still retrying, and about a job timeout
+        that cancels the whole fan-out before its deadline. Either way the failure never reaches the breaker"""
+        fits = True
+        for provider in self.providers:
+            if (budget := provider.retry_budget(request_timeout)) >= self.deadline:
+                logger.warning("search deadline is shorter than the provider retry budget", provider=provider.name,
+                               deadline=self.deadline, retry_budget=budget)
+                fits = False
+        if job_timeout is not None and job_timeout <= self.deadline:
+            logger.warning("monitor job timeout is shorter than the search deadline", job_timeout=job_timeout,
+                           deadline=self.deadline)
+            fits = False
+        return fits
+
+    @staticmethod
+    def merge(row_lists: list[list[dict]]) -> list[dict]:
+        if len(row_lists) == 1:
+            # nothing to dedupe, the rows stay untouched until somebody selects from them
+            return row_lists[0]
+        merged: dict[str, dict] = {}
+        for rows in row_lists:
+            for row in rows:
+                key = row["info_hash"].lower()
+                if key not in merged or int(row["seeders"]) > int(merged[key]["seeders"]):
+                    merged[key] = row
+        return list(merged.values())
+
+    async def search(self, query: str, http_client: PooledHttpClient) -> FanOutResult:
+        tasks = {asyncio.create_task(provider.search(query, http_client), name=f"search {provider.name}"): provider
+                 for provider in self.providers}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in pending:
+            # a slow provider doesn't get to hold the others' results back
+            task.cancel()
+            tasks[task].record_timeout()
+            provider_searches.inc(provider=tasks[task].name, result="timeout")
+        answered, failed, unavailable = [], [tasks[task].name for task in pending], []
+        for task in done:
+            provider = tasks[task]
+            if (error := task.exception()) is not None:
+                if not isinstance(error, SearchUnavailableError):
+                    logger.warning(f"search provider failed: {error!r}", provider=provider.name, query=query)
+                unavailable.append(error)
+                failed.append(provider.name)
+                provider_searches.inc(provider=provider.name, result="unavailable")
+            elif (rows := task.result()) is None:
+                failed.append(provider.name)
+                provider_searches.inc(provider=provider.name, result="error")
+            else:
+                answered.append(rows)
+                provider_searches.inc(provider=provider.name, result="ok")
+        if pending:
+            logger.warning("search providers missed the deadline", providers=[tasks[task].name for task in pending],
+                           deadline=self.deadline, query=query)
+        retry_after = min((getattr(error, "retry_after", 0) for error in unavailable), default=0)
+        if not answered and len(unavailable) + len(pending) == len(tasks):
+            # nobody answered at all, same as a single unreachable host
+            raise SearchUnavailableError(f"no search provider answered: {', '.join(failed)}", retry_after)
+        return FanOutResult(self.merge(answered) if answered else None, failed, retry_after)
@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterator
+import asyncio
+import random
+import time
+from logger import logger
+
+
+class SearchUnavailableError(Exception):
+    def __init__(self, message: str, retry_after: float = 0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated_at = clock()
+        # waiters are served in arrival order instead of racing for every refilled token
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, capacity={self.capacity})"
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1) -> None:
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await self.sleep((tokens - self._tokens) / self.rate)
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8
+
+    def delays(self, rng: random.Random = random.Random()) -> Iterator[float]:
+        # full jitter: concurrent retries of the same outage don't line up into bursts
+        for attempt in range(self.attempts - 1):
+            yield rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def budget(self, request_timeout: float) -> float:
+        """The longest every attempt together can take, a Retry-After may stretch each wait up to max_delay"""
+        return self.attempts * request_timeout + (self.attempts - 1) * self.max_delay
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.
+
+    def __repr__(self):
+        return f"CircuitBreaker(state={self.state}, failures={self.failures})"
+
+    @property
+    def retry_after(self) -> float:
+        if self.state == self.CLOSED:
+            return 0
+        return max(self._opened_at + self.recovery_timeout - self.clock(), 0)
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != self.CLOSED and self.retry_after > 0
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if not self.retry_after:
+            # one trial request per recovery timeout decides whether the host recovered
+            self.state = self.HALF_OPEN
+            self._opened_at = self.clock()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("circuit breaker closed, host recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("circuit breaker opened", failures=self.failures, recovery_timeout=self.recovery_timeout)
+            self.state = self.OPEN
+            self._opened_at = self.clock()
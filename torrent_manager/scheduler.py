@@ -0,0 +1,113 @@
+from typing import Any, Awaitable, Callable
+import asyncio
+import heapq
+import random
+import time
+from torrent_manager.pb_orchestrator import MonitorOrchestrator, MonitorSetting, JobResult
+from logger import logger
+from tracing import tracer
+
+
+class MonitorScheduler:
+    """Runs every monitor on its own period, ordered by a heap of next-run times"""
+
+    def __init__(self, orchestrator: MonitorOrchestrator,
+                 on_finds: Callable[[list[JobResult]], Awaitable[Any]] | None = None,
+                 interval: float = 60 * 60 * 8, jitter: float = 0.1, catch_up_window: float = 300,
+                 resync_interval: float = 60, clock: Callable[[], float] = time.time,
+                 rng: random.Random | None = None) -> None:
+        self.orchestrator = orchestrator
+        self.on_finds = on_finds
+        self.interval = interval
+        self.jitter = jitter
+        self.catch_up_window = catch_up_window
+        self.resync_interval = resync_interval
+        self.clock = clock
+        self._rng = rng or random.Random()
+        self._queue: list[tuple[float, str]] = []
+        # uuid -> (due_at, last_checked) of the live heap entry; entries that don't match are stale and skipped
+        self._scheduled: dict[str, tuple[float, float]] = {}
+        self._ticked_at: float | None = None
+        self._running = False
+
+    def __repr__(self):
+        return f"MonitorScheduler(interval={self.interval}, scheduled={len(self._scheduled)})"
+
+    @property
+    def is_alive(self) -> bool:
+        # the loop ticks at least every resync_interval. a run can take much longer than that,
+        # it counts as alive as long as its monitors keep finishing
+        if self._ticked_at is None:
+            return False
+        seen_at = self._ticked_at
+        if self._running and self.orchestrator.progressed_at is not None:
+            seen_at = max(seen_at, self.orchestrator.progressed_at)
+        max_tick_gap = self.resync_interval * 2 + self.orchestrator.iteration_deadline + self.orchestrator.job_timeout
+        return time.monotonic() - seen_at < max_tick_gap
+
+    def next_run_at(self, setting: MonitorSetting) -> float:
+        interval = self.orchestrator.next_check_interval(setting) or self.interval
+        due_at = setting.last_checked + interval * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        now = self.clock()
+        if due_at <= now:
+            # missed while the bot was down or postponed while search was unavailable: catch up once search is
+            # back, but spread the backlog instead of running it in one burst
+            due_at = now + self.orchestrator.search_retry_after() + self._rng.uniform(0, self.catch_up_window)
+        return due_at
+
+    def _schedule(self, setting: MonitorSetting) -> None:
+        due_at = self.next_run_at(setting)
+        self._scheduled[setting.searcher.uuid] = (due_at, setting.last_checked)
+        heapq.heappush(self._queue, (due_at, setting.searcher.uuid))
+
+    def sync(self) -> None:
+        monitors = {setting.searcher.uuid: setting for setting in self.orchestrator.get_all_jobs()}
+        for uuid in self._scheduled.keys() - monitors.keys():
+            del self._scheduled[uuid]
+        for uuid, setting in monitors.items():
+            # a monitor checked outside the schedule (e.g. by /rm) moves its next run instead of running twice
+            if (scheduled := self._scheduled.get(uuid)) is None or scheduled[1] != setting.last_checked:
+                self._schedule(setting)
+
+    def next_due_at(self) -> float | None:
+        while self._queue:
+            due_at, uuid = self._queue[0]
+            if self._scheduled.get(uuid, (None,))[0] == due_at:
+                return due_at
+            heapq.heappop(self._queue)
+
+    def pop_due(self) -> list[MonitorSetting]:
+        now = self.clock()
+        due_jobs = []
+        while (due_at := self.next_due_at()) is not None and due_at <= now:
+            _, uuid = heapq.heappop(self._queue)
+            del self._scheduled[uuid]
+            if (setting := self.orchestrator.get_monitor_by_uuid(uuid)) is not None:
+                due_jobs.append(setting)
+        return due_jobs
+
+    async def run_due(self) -> list[JobResult]:
+        self.sync()
+        results = []
+        if due_jobs := self.pop_due():
+            logger.debug("running scheduled monitors", due=len(due_jobs), scheduled=len(self._scheduled))
+            with tracer.run("scheduled_run"):
+                results = await self.orchestrator.run_search_jobs(due_jobs)
+                if results and self.on_finds is not None:
+                    await self.on_finds(results)
+        self.sync()
+        return results
+
+    async def run_forever(self) -> None:
+        while True:
+            self._ticked_at = time.monotonic()
+            self._running = True
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.exception(f"scheduled monitors run failed: {e!r}")
+            finally:
+                self._running = False
+            next_due_at = self.next_due_at()
+            delay = self.resync_interval if next_due_at is None else next_due_at - self.clock()
+            await asyncio.sleep(min(max(delay, 0), self.resync_interval))
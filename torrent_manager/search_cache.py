@@ -0,0 +1,103 @@
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, astuple
+from typing import Any, Callable
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class CacheEntry:
+    value: list
+    expires_at: float
+    size_bytes: int
+
+
+class SearchCache:
+    """LRU cache of search results with a TTL per entry, bounded by entries count and approximate memory size"""
+
+    def __init__(self, ttl: float = 600, empty_ttl: float = 60, max_entries: int = 512,
+                 max_bytes: int = 8 * 1024 ** 2, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"SearchCache(entries={len(self)}, size_bytes={self.size_bytes}, stats={self.stats})"
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    @staticmethod
+    def _estimate_size(value: list) -> int:
+        size = sys.getsizeof(value)
+        for item in value:
+            if isinstance(item, dict):
+                fields = (*item.keys(), *item.values())
+            elif hasattr(item, "__dataclass_fields__"):
+                fields = astuple(item)
+            else:
+                fields = ()
+            size += sys.getsizeof(item) + sum(sys.getsizeof(field) for field in fields)
+        return size
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._size_bytes -= entry.size_bytes
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: list, ttl: float | None = None) -> None:
+        if key in self._entries:
+            self._remove(key)
+        if ttl is None:
+            ttl = self.ttl if value else self.empty_ttl
+        if ttl <= 0:
+            return
+        size_bytes = self._estimate_size(value)
+        if size_bytes > self.max_bytes:
+            return
+        self._entries[key] = CacheEntry(value, self._clock() + ttl, size_bytes)
+        self._size_bytes += size_bytes
+        while len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size_bytes = 0
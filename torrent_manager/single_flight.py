@@ -0,0 +1,25 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key await the same result"""
+
+    def __init__(self) -> None:
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if (task := self._in_flight.get(key)) is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = asyncio.create_task(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield, so one caller's timeout doesn't cancel the request for everybody else
+        return await asyncio.shield(task)
@@ -1,13 +1,126 @@
+import asyncio
+import base64
+import re
+import time
+from dataclasses import dataclass
 from os import path
 from datetime import datetime
-from transmission_rpc import Client, Torrent, error as transmission_error
+from httpx import HTTPError
+from transmission_rpc import Torrent, error as transmission_error
 from config import MEDIA_DOWNLOAD_PATH, REGULAR_DOWNLOAD_PATH
 from logger import logger
+from metrics import metrics
+from tracing import tracer
+from torrent_manager.http_client import PooledHttpClient
 
+rpc_duration = metrics.histogram("transmission_rpc_duration_seconds", "Latency of transmission rpc calls", ("method",))
+rpc_errors = metrics.counter("transmission_rpc_errors_total", "Failed transmission rpc calls", ("method",))
 
-class TransmissionClient(Client):
-    def __init__(self, host: str) -> None:
-        super().__init__(host=host)
+
+class TorrentSnapshot:
+    def __init__(self) -> None:
+        self.fields: set[str] = set()
+        self.torrents: dict[int, dict] = {}
+        self.ids_by_name: dict[str, int] = {}
+        self.ids_by_hash: dict[str, int] = {}
+        self.refreshed_at: float = 0
+        self.version = 0
+        self.stale = True
+
+    def __len__(self) -> int:
+        return len(self.torrents)
+
+    def _index(self, torrent_fields: dict) -> bool:
+        torrent_id = torrent_fields["id"]
+        if (indexed_fields := self.torrents.get(torrent_id)) is not None:
+            changed = any(indexed_fields.get(key) != value for key, value in torrent_fields.items())
+            indexed_fields.update(torrent_fields)
+        else:
+            self.torrents[torrent_id] = indexed_fields = torrent_fields
+            changed = True
+        if "name" in indexed_fields:
+            self.ids_by_name[indexed_fields["name"]] = torrent_id
+        if "hashString" in indexed_fields:
+            self.ids_by_hash[indexed_fields["hashString"].lower()] = torrent_id
+        return changed
+
+    def _unindex(self, torrent_id: int) -> None:
+        torrent_fields = self.torrents.pop(torrent_id, None)
+        if torrent_fields is None:
+            return
+        if self.ids_by_name.get(torrent_fields.get("name")) == torrent_id:
+            del self.ids_by_name[torrent_fields["name"]]
+        if self.ids_by_hash.get(torrent_fields.get("hashString", "").lower()) == torrent_id:
+            del self.ids_by_hash[torrent_fields["hashString"].lower()]
+
+    def apply_full(self, torrents: list[dict], fields: set[str], refreshed_at: float) -> None:
+        self.torrents, self.ids_by_name, self.ids_by_hash = {}, {}, {}
+        for torrent_fields in torrents:
+            self._index(torrent_fields)
+        self.fields = fields
+        self.refreshed_at = refreshed_at
+        self.stale = False
+        self.version += 1
+
+    def apply_delta(self, torrents: list[dict], removed_ids: list[int], refreshed_at: float) -> None:
+        changed = any([torrent_id in self.torrents for torrent_id in removed_ids])
+        for torrent_id in removed_ids:
+            self._unindex(torrent_id)
+        # recently active torrents often come back unchanged, those don't make a new version
+        changed = any([self._index(torrent_fields) for torrent_fields in torrents]) or changed
+        self.refreshed_at = refreshed_at
+        self.stale = False
+        if changed:
+            self.version += 1
+
+    def get(self, torrent_id: int | None) -> Torrent | None:
+        if torrent_id is None or (torrent_fields := self.torrents.get(torrent_id)) is None:
+            return
+        return Torrent(fields=dict(torrent_fields))
+
+    def get_by_name(self, name: str) -> Torrent | None:
+        return self.get(self.ids_by_name.get(name))
+
+    def get_by_hash(self, info_hash: str) -> Torrent | None:
+        return self.get(self.ids_by_hash.get(info_hash.lower()))
+
+    def all(self) -> list[Torrent]:
+        return [Torrent(fields=dict(torrent_fields)) for torrent_fields in self.torrents.values()]
+
+
+@dataclass
+class DownloadOutcome:
+    magnet_link: str
+    download_type: str
+    info_hash: str
+    status: str  # added | exists | duplicate | error
+    torrent: Torrent | None = None
+
+
+class TransmissionClient:
+    _session_id_header = "X-Transmission-Session-Id"
+    _info_hash_pattern = re.compile(r"xt=urn:btih:([0-9a-zA-Z]+)")
+    torrent_fields = ["id", "name", "hashString", "status", "addedDate", "percentDone", "sizeWhenDone",
+                      "leftUntilDone", "downloadDir", "error", "errorString"]
+    lookup_fields = ["id", "name", "hashString"]
+    recent_downloads_fields = ["id", "name", "hashString", "status", "addedDate", "percentDone", "sizeWhenDone"]
+
+    def __init__(self, host: str, port: int = 9091, rpc_path: str = "/transmission/rpc", protocol: str = "http",
+                 username: str = "", password: str = "", http_client: PooledHttpClient | None = None,
+                 snapshot_min_age: float = 1, snapshot_max_delta_age: float = 55) -> None:
+        self.url = f"{protocol}://{host}:{port}{rpc_path}"
+        self.http_client = http_client or PooledHttpClient(timeout=30)
+        self._auth = (username, password) if username else None
+        self._session_id = ""
+        self.snapshot = TorrentSnapshot()
+        # snapshots younger than min_age are served as is;
+        # transmission reports torrents as recently active for 60 seconds, so older snapshots can't be patched by delta
+        self.snapshot_min_age = snapshot_min_age
+        self.snapshot_max_delta_age = snapshot_max_delta_age
+        self._snapshot_lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"TransmissionClient(url={self.url})"
 
     download_paths = {
         "movie": path.join(MEDIA_DOWNLOAD_PATH, "movies"),
@@ -18,35 +131,172 @@ class TransmissionClient(Client):
     _pending_statuses = ['downloading',
                          'download pending', 'check pending', 'checking',]
 
+    async def _request(self, method: str, arguments: dict | None = None, expected: tuple[str, ...] = ()) -> dict:
+        with rpc_duration.time(method=method), tracer.span(f"transmission.{method}"):
+            try:
+                return await self._send(method, arguments, expected)
+            except transmission_error.TransmissionError:
+                rpc_errors.inc(method=method)
+                raise
+
+    async def _send(self, method: str, arguments: dict | None = None, expected: tuple[str, ...] = ()) -> dict:
+        payload = {"method": method, "arguments": arguments or {}}
+        try:
+            for _ in range(2):
+                r = await self.http_client.post(self.url, json=payload, auth=self._auth,
+                                                headers={self._session_id_header: self._session_id})
+                if r.status_code != 409:
+                    break
+                # transmission rotates the session id and answers 409 with the new one in headers
+                self._session_id = r.headers.get(self._session_id_header, "")
+        except HTTPError as e:
+            raise transmission_error.TransmissionConnectError(f"can't reach transmission: {e!r}") from e
+        if r.status_code != 200:
+            raise transmission_error.TransmissionError(f"transmission responded with {r.status_code}")
+        try:
+            response = r.json()
+        except ValueError as e:
+            # something in front of transmission, like a proxy error page
+            raise transmission_error.TransmissionError(f"{method} got a reply that isn't json: {e}") from e
+        if not isinstance(response, dict):
+            raise transmission_error.TransmissionError(f"{method} got an unexpected reply: {response!r:.100}")
+        if (result := response.get("result")) != "success":
+            raise transmission_error.TransmissionError(f"{method} failed: {result}")
+        arguments = response.get("arguments")
+        if not isinstance(arguments, dict):
+            raise transmission_error.TransmissionError(f"{method} reply has no arguments")
+        if missing := [key for key in expected if key not in arguments]:
+            raise transmission_error.TransmissionError(f"{method} reply is missing {', '.join(missing)}")
+        return arguments
+
+    async def get_torrents(self, ids: list[int | str] | str | None = None,
+                           fields: list[str] | None = None) -> list[Torrent]:
+        arguments = {"fields": list(set(fields or self.torrent_fields) | {"id", "hashString"})}
+        if ids is not None:
+            arguments["ids"] = ids
+        response = await self._request("torrent-get", arguments, expected=("torrents",))
+        return [Torrent(fields=torrent_fields) for torrent_fields in response["torrents"]]
+
+    @classmethod
+    def get_info_hash(cls, magnet_link: str) -> str:
+        if not (match := cls._info_hash_pattern.search(magnet_link)):
+            return ""
+        info_hash = match.group(1)
+        if len(info_hash) == 32:  # base32 encoded btih
+            info_hash = base64.b32decode(info_hash.upper()).hex()
+        return info_hash.lower()
+
+    async def _add_torrent(self, torrent: str | bytes, download_dir: str) -> tuple[Torrent, bool]:
+        arguments = {"download-dir": download_dir}
+        if isinstance(torrent, bytes):
+            arguments["metainfo"] = base64.b64encode(torrent).decode()
+        else:
+            arguments["filename"] = torrent
+        response = await self._request("torrent-add", arguments)
+        self.snapshot.stale = True
+        if added_torrent := response.get("torrent-added"):
+            return Torrent(fields=added_torrent), True
+        if duplicate_torrent := response.get("torrent-duplicate"):
+            return Torrent(fields=duplicate_torrent), False
+        raise transmission_error.TransmissionError("torrent-add reply has neither the added nor the duplicate torrent")
+
+    async def add_torrent(self, torrent: str | bytes, download_dir: str) -> Torrent:
+        added_torrent, _ = await self._add_torrent(torrent, download_dir)
+        return added_torrent
+
+    async def refresh_snapshot(self, fields: list[str]) -> TorrentSnapshot:
+        async with self._snapshot_lock:
+            snapshot_age = time.monotonic() - self.snapshot.refreshed_at
+            missing_fields = set(fields) - self.snapshot.fields
+            if not missing_fields and not self.snapshot.stale and snapshot_age < self.snapshot_min_age:
+                return self.snapshot
+            refresh_started_at = time.monotonic()
+            if missing_fields or snapshot_age >= self.snapshot_max_delta_age:
+                snapshot_fields = self.snapshot.fields | set(fields) | {"id", "hashString"}
+                response = await self._request("torrent-get", {"fields": list(snapshot_fields)}, expected=("torrents",))
+                self.snapshot.apply_full(response["torrents"], snapshot_fields, refresh_started_at)
+            else:
+                response = await self._request("torrent-get", {"fields": list(self.snapshot.fields),
+                                                               "ids": "recently-active"}, expected=("torrents",))
+                self.snapshot.apply_delta(response["torrents"], response.get("removed", []), refresh_started_at)
+            return self.snapshot
+
     def _filter_fresh_torrents(self, torrent: Torrent) -> bool:
         torrent_date = torrent.added_date.replace(tzinfo=None)
         current_date = datetime.today()
         torrent_age_days = (current_date - torrent_date).days
         return torrent_age_days <= 3 or torrent.status in self._pending_statuses
 
-    def add_download(self, magnet_link: str | bytes, download_type: str) -> Torrent | None:
+    async def add_download(self, magnet_link: str | bytes, download_type: str) -> Torrent | None:
         download_dir = self.download_paths[download_type]
         try:
-            download = self.add_torrent(magnet_link, download_dir=download_dir)
+            download = await self.add_torrent(magnet_link, download_dir=download_dir)
         except transmission_error.TransmissionError:
             logger.error("error adding download", magnet=magnet_link)
             return
         return download
 
-    def download_from_file(self, filename, download_type) -> Torrent | None:
-        with open(filename, "rb") as f:
-            return self.add_download(f, download_type)
-
-    def find_torrent(self, torrent_name: str) -> Torrent | None:
-        torrents_list = self.get_torrents()
-        result = filter(lambda t: t.name == torrent_name, torrents_list)
+    @tracer.traced("transmission.add_downloads")
+    async def add_downloads(self, downloads: list[tuple[str, str]], max_parallel: int = 4) -> list[DownloadOutcome]:
+        outcomes = [DownloadOutcome(magnet_link, download_type, self.get_info_hash(magnet_link), "error")
+                    for magnet_link, download_type in downloads]
+        if not outcomes:
+            return outcomes
         try:
-            return next(result)
-        except StopIteration:
-            return
+            existing_hashes = (await self.refresh_snapshot(self.lookup_fields)).ids_by_hash
+        except transmission_error.TransmissionError as e:
+            logger.warning(f"couldn't fetch existing torrents before batch submission: {e}")
+            existing_hashes = {}
+        batch_hashes = set()
+        outcomes_to_submit = []
+        for outcome in outcomes:
+            if outcome.info_hash in batch_hashes:
+                outcome.status = "duplicate"
+            elif outcome.info_hash in existing_hashes:
+                outcome.status = "exists"
+                outcome.torrent = self.snapshot.get_by_hash(outcome.info_hash)
+            else:
+                outcomes_to_submit.append(outcome)
+            if outcome.info_hash:
+                batch_hashes.add(outcome.info_hash)
+
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        async def submit(outcome: DownloadOutcome) -> None:
+            async with semaphore:
+                try:
+                    outcome.torrent, is_new = await self._add_torrent(
+                        outcome.magnet_link, self.download_paths[outcome.download_type])
+                    outcome.status = "added" if is_new else "exists"
+                except transmission_error.TransmissionError:
+                    logger.error("error adding download", magnet=outcome.magnet_link)
+
+        await asyncio.gather(*map(submit, outcomes_to_submit))
+        logger.debug("batch of downloads submitted", submitted=len(outcomes_to_submit),
+                     **{status: sum(o.status == status for o in outcomes)
+                        for status in ("added", "exists", "duplicate", "error")})
+        return outcomes
 
-    def get_recent_downloads(self) -> list[Torrent]:
-        torrents = self.get_torrents()
+    async def download_from_file(self, filename, download_type) -> Torrent | None:
+        def read_file() -> bytes:
+            with open(filename, "rb") as f:
+                return f.read()
+        return await self.add_download(await asyncio.to_thread(read_file), download_type)
+
+    async def find_torrent(self, torrent_name: str) -> Torrent | None:
+        snapshot = await self.refresh_snapshot(self.lookup_fields)
+        return snapshot.get_by_name(torrent_name)
+
+    async def find_torrent_by_hash(self, info_hash: str) -> Torrent | None:
+        snapshot = await self.refresh_snapshot(self.lookup_fields)
+        return snapshot.get_by_hash(info_hash)
+
+    async def get_recent_downloads(self) -> list[Torrent]:
+        snapshot = await self.refresh_snapshot(self.recent_downloads_fields)
+        torrents = snapshot.all()
         pending_torrents = filter(
             self._filter_fresh_torrents, torrents)
         return sorted(pending_torrents, key=lambda t: t.added_date, reverse=True)
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
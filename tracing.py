@@ -0,0 +1,171 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable
+import asyncio
+import functools
+import json
+import os
+import time
+from config import TRACING_ENABLED, TRACE_EXPORT_DIR
+from logger import logger
+
+
+@dataclass
+class Span:
+    name: str
+    started_at: float
+    duration: float = 0
+    task_name: str = ""
+    attributes: dict = field(default_factory=dict)
+
+
+class _NullSpan:
+    """Shared no-op span, so disabled tracing costs a context var lookup and nothing else"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class TraceRun:
+    def __init__(self, name: str, clock: Callable[[], float]) -> None:
+        self.name = name
+        self.clock = clock
+        self.started_at = clock()
+        self.duration = 0.
+        self.spans: list[Span] = []
+
+    def breakdown(self) -> dict[str, tuple[float, int]]:
+        totals: dict[str, tuple[float, int]] = {}
+        for span in self.spans:
+            total, count = totals.get(span.name, (0, 0))
+            totals[span.name] = (total + span.duration, count + 1)
+        return dict(sorted(totals.items(), key=lambda item: item[1][0], reverse=True))
+
+    def to_chrome_trace(self) -> dict:
+        thread_ids: dict[str, int] = {}
+        events = [{"name": self.name, "cat": "run", "ph": "X", "pid": 1, "tid": 0,
+                   "ts": 0, "dur": self.duration * 10 ** 6}]
+        for span in self.spans:
+            events.append({"name": span.name, "cat": "span", "ph": "X", "pid": 1,
+                           "tid": thread_ids.setdefault(span.task_name, len(thread_ids) + 1),
+                           "ts": (span.started_at - self.started_at) * 10 ** 6, "dur": span.duration * 10 ** 6,
+                           "args": span.attributes})
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": task_name}}
+                   for task_name, tid in thread_ids.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class _ActiveSpan:
+    def __init__(self, run: TraceRun, name: str, attributes: dict) -> None:
+        self.run = run
+        # callable attributes are lazy, evaluated only for spans that get recorded
+        self.span = Span(name, 0, attributes={key: value() if callable(value) else value
+                                              for key, value in attributes.items()})
+
+    def __enter__(self):
+        task = asyncio.current_task() if _in_event_loop() else None
+        self.span.task_name = task.get_name() if task is not None else "main"
+        self.span.started_at = self.run.clock()
+        return self.span
+
+    def __exit__(self, *exc_info):
+        self.span.duration = self.run.clock() - self.span.started_at
+        self.run.spans.append(self.span)
+        return False
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, export_dir: str = "", clock: Callable[[], float] = time.perf_counter) \
+            -> None:
+        self.enabled = enabled
+        self.export_dir = export_dir
+        self.clock = clock
+        self.last_run: TraceRun | None = None
+        self._current_run: ContextVar[TraceRun | None] = ContextVar("current_trace_run", default=None)
+
+    def __repr__(self):
+        return f"Tracer(enabled={self.enabled}, export_dir={self.export_dir})"
+
+    def span(self, name: str, **attributes):
+        if (run := self._current_run.get()) is None:
+            return NULL_SPAN
+        return _ActiveSpan(run, name, attributes)
+
+    def traced(self, name: str = ""):
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def traced_coroutine(*args, **kwargs):
+                    if self._current_run.get() is None:
+                        return await fn(*args, **kwargs)
+                    with self.span(span_name):
+                        return await fn(*args, **kwargs)
+                return traced_coroutine
+
+            @functools.wraps(fn)
+            def traced_function(*args, **kwargs):
+                if self._current_run.get() is None:
+                    return fn(*args, **kwargs)
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return traced_function
+        return decorator
+
+    def run(self, name: str):
+        if not self.enabled:
+            return NULL_SPAN
+        if self._current_run.get() is not None:
+            # runs started inside another run are just a stage of the outer one
+            return self.span(name)
+        return _RunContext(self, name)
+
+    def report(self, run: TraceRun) -> None:
+        self.last_run = run
+        stages = ", ".join(f"{name} {total:.3f}s/{count}" for name, (total, count) in run.breakdown().items())
+        logger.info(f"trace {run.name} took {run.duration:.3f}s: {stages}", run=run.name, duration=run.duration,
+                    spans=len(run.spans))
+        if self.export_dir:
+            self.export(run)
+
+    def export(self, run: TraceRun) -> str:
+        os.makedirs(self.export_dir, exist_ok=True)
+        trace_path = os.path.join(self.export_dir, f"{run.name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(trace_path, "w") as f:
+            json.dump(run.to_chrome_trace(), f)
+        logger.debug("chrome trace exported", trace_path=trace_path)
+        return trace_path
+
+
+class _RunContext:
+    def __init__(self, tracer: Tracer, name: str) -> None:
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self) -> TraceRun:
+        self.run = TraceRun(self.name, self.tracer.clock)
+        self._token = self.tracer._current_run.set(self.run)
+        return self.run
+
+    def __exit__(self, *exc_info):
+        self.tracer._current_run.reset(self._token)
+        self.run.duration = self.tracer.clock() - self.run.started_at
+        self.tracer.report(self.run)
+        return False
+
+
+tracer = Tracer(enabled=TRACING_ENABLED, export_dir=TRACE_EXPORT_DIR)